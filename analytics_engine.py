@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""Columnar NumPy engine for the ball-by-ball aggregate questions.
+
+The deliveries table is read once into typed NumPy columns: player, team,
+venue and date strings become int32 codes into sorted dictionaries, and
+over, ball and run counts are stored as int8/int16. The aggregate query_map
+questions are then answered with vectorized bincount/reduceat group-bys
+instead of SQLite GROUP BYs, and produce the same rows in the same order.
+
+Columns are saved as .npy files under a directory per data generation
+(PRAGMA user_version) and memory-mapped on later starts, so a restarted
+server does not re-read SQLite. NumPy is optional: without it AVAILABLE is
+False and the server answers everything from SQLite.
+
+Usage:
+    python3 analytics_engine.py [--db ipl_data.db] [--columns ipl_data.db.columns]
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import argparse
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+AVAILABLE = np is not None
+
+FETCH_SIZE = 65536        # deliveries read from SQLite per fetchmany call
+POWERPLAY_OVERS = 6       # overs 0-5 (0-based), as in powerplay_totals
+OVER_SLOTS = 256          # over numbers are int8, so this bounds them
+DENSE_GROUP_LIMIT = 1 << 22   # largest key space grouped without sorting
+
+# Dictionaries the string columns are encoded against.
+DICTIONARIES = ("players", "teams", "venues", "dates")
+
+# Column name -> dtype. d_* has one entry per delivery, i_* per innings and
+# m_* per match; string columns hold codes, -1 for a missing innings.
+COLUMNS = {
+    "d_match": "int32",
+    "d_innings": "int32",     # row in the i_* columns
+    "d_over": "int8",
+    "d_ball": "int8",
+    "d_batsman": "int32",
+    "d_bowler": "int32",
+    "d_team": "int32",        # batting team
+    "d_runs": "int16",        # runs off the bat
+    "d_extras": "int16",
+    "d_total": "int16",
+    "d_four": "int8",
+    "d_six": "int8",
+    "d_wicket": "int8",
+    "i_match": "int32",
+    "i_inning": "int8",
+    "i_team": "int32",
+    "m_match": "int32",
+    "m_team1": "int32",
+    "m_team2": "int32",
+    "m_winner": "int32",
+    "m_venue": "int32",
+    "m_date": "int32",
+}
+
+META_FILE = "meta.json"
+
+# Normalized query_map questions the engine answers -> ColumnarEngine method
+QUESTIONS = {
+    "what was the highest total score": "highest_total_score",
+    "who scored the most runs across all matches": "most_runs",
+    "which bowler took the most wickets": "most_wickets",
+    "who has the best bowling figures in a single match": "best_bowling_figures",
+    "what's the average first innings score": "average_first_innings_score",
+    "which venue has the highest scoring matches": "highest_scoring_venues",
+    "show me all centuries scored": "centuries",
+    "show me the most successful chase targets": "chase_targets",
+    "which team has the best powerplay performance": "powerplay_performance",
+}
+
+DELIVERIES_SQL = """
+    SELECT match_id, inning, over, ball, batsman, bowler,
+           runs_scored, extra_runs, total_runs, is_four, is_six,
+           wicket_kind IS NOT NULL AND wicket_kind != ''
+    FROM deliveries ORDER BY match_id, inning, delivery_id
+"""
+INNINGS_SQL = "SELECT match_id, inning, team_batting FROM innings ORDER BY match_id, inning"
+MATCHES_SQL = "SELECT match_id, team1, team2, winner, venue, match_date FROM matches ORDER BY match_id"
+
+
+def sql_round(value, digits=2):
+    """ROUND(value, digits) exactly as SQLite computes it (half-up on 15 significant digits)."""
+    if value is None:
+        return None
+    exponent = Decimal(1).scaleb(-digits)
+    return float(Decimal(format(value, ".15g")).quantize(exponent, rounding=ROUND_HALF_UP))
+
+
+class _Encoder:
+    """Assigns provisional codes to strings, then renumbers them in sorted order."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, values):
+        codes = self.codes
+        return [codes.setdefault(value, len(codes)) for value in values]
+
+    def finish(self):
+        """Return (sorted names, provisional -> final code map). None sorts first, like NULL."""
+        names = sorted(self.codes, key=lambda name: (name is not None, name or ""))
+        remap = np.empty(len(names), dtype=np.int32)
+        for final, name in enumerate(names):
+            remap[self.codes[name]] = final
+        return names, remap
+
+
+def _group_rank(keys, size):
+    """Group-by on non-negative int keys below size: (distinct keys, group of each row).
+
+    Groups are numbered in key order. Small key spaces use a presence
+    bitmap and a running count instead of sorting.
+    """
+    if size <= DENSE_GROUP_LIMIT:
+        present = np.zeros(size, dtype=bool)
+        present[keys] = True
+        rank = np.cumsum(present, dtype=np.int32) - 1
+        return np.flatnonzero(present), rank[keys]
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, inverse.reshape(-1)
+
+
+def _order(*keys):
+    """Stable ordering by several keys, first key most significant."""
+    return np.lexsort(tuple(reversed(keys)))
+
+
+class ColumnarEngine:
+    """Typed NumPy columns for one data generation and the questions they answer."""
+
+    def __init__(self, columns, dictionaries, generation):
+        self.columns = columns
+        for name, values in columns.items():
+            setattr(self, name, values)
+        self.dictionaries = dictionaries
+        self.generation = generation
+        self.players = dictionaries["players"]
+        self.teams = dictionaries["teams"]
+        self.venues = dictionaries["venues"]
+        self.dates = dictionaries["dates"]
+        self._cache = {}
+
+    # --- building and persistence ---
+
+    @classmethod
+    def from_connection(cls, conn, generation=None):
+        """Read deliveries, innings and matches from SQLite into columns."""
+        if generation is None:
+            generation = conn.execute("PRAGMA user_version").fetchone()[0]
+        encoders = {name: _Encoder() for name in DICTIONARIES}
+        players, teams = encoders["players"], encoders["teams"]
+
+        matches = conn.execute(MATCHES_SQL).fetchall()
+        m_match, team1, team2, winner, venue, date = zip(*matches) if matches else ((),) * 6
+        columns = {
+            "m_match": np.array(m_match, dtype=np.int32),
+            "m_team1": np.array(teams.encode(team1), dtype=np.int32),
+            "m_team2": np.array(teams.encode(team2), dtype=np.int32),
+            "m_winner": np.array(teams.encode(winner), dtype=np.int32),
+            "m_venue": np.array(encoders["venues"].encode(venue), dtype=np.int32),
+            "m_date": np.array(encoders["dates"].encode(date), dtype=np.int32),
+        }
+
+        innings = conn.execute(INNINGS_SQL).fetchall()
+        i_match, i_inning, i_team = zip(*innings) if innings else ((),) * 3
+        columns["i_match"] = np.array(i_match, dtype=np.int32)
+        columns["i_inning"] = np.array(i_inning, dtype=np.int8)
+        columns["i_team"] = np.array(teams.encode(i_team), dtype=np.int32)
+
+        chunks = {name: [] for name in ("d_match", "d_inning", "d_over", "d_ball", "d_batsman", "d_bowler",
+                                        "d_runs", "d_extras", "d_total", "d_four", "d_six", "d_wicket")}
+        cursor = conn.execute(DELIVERIES_SQL)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            (match, inning, over, ball, batsman, bowler,
+             runs, extras, total, four, six, wicket) = zip(*rows)
+            chunks["d_match"].append(np.array(match, dtype=np.int32))
+            chunks["d_inning"].append(np.array(inning, dtype=np.int8))
+            chunks["d_over"].append(np.array(over, dtype=np.int8))
+            chunks["d_ball"].append(np.array(ball, dtype=np.int8))
+            chunks["d_batsman"].append(np.array(players.encode(batsman), dtype=np.int32))
+            chunks["d_bowler"].append(np.array(players.encode(bowler), dtype=np.int32))
+            chunks["d_runs"].append(np.array(runs, dtype=np.int16))
+            chunks["d_extras"].append(np.array(extras, dtype=np.int16))
+            chunks["d_total"].append(np.array(total, dtype=np.int16))
+            chunks["d_four"].append(np.array(four, dtype=np.int8))
+            chunks["d_six"].append(np.array(six, dtype=np.int8))
+            chunks["d_wicket"].append(np.array(wicket, dtype=np.int8))
+        cursor.close()
+        for name, parts in chunks.items():
+            columns[name] = np.concatenate(parts) if parts else np.empty(0, dtype=COLUMNS.get(name, "int8"))
+
+        # Point each delivery at its innings row; both are sorted by (match_id, inning).
+        d_key = columns["d_match"].astype(np.int64) * OVER_SLOTS + columns.pop("d_inning")
+        i_key = columns["i_match"].astype(np.int64) * OVER_SLOTS + columns["i_inning"]
+        position = np.searchsorted(i_key, d_key)
+        found = position < len(i_key)
+        found[found] = i_key[position[found]] == d_key[found]
+        columns["d_innings"] = np.where(found, position, -1).astype(np.int32)
+        if len(i_key):
+            columns["d_team"] = np.where(found, columns["i_team"][np.where(found, position, 0)], -1).astype(np.int32)
+        else:
+            columns["d_team"] = np.full(len(d_key), -1, dtype=np.int32)
+
+        # Renumber every dictionary so code order is the names' sort order.
+        dictionaries = {}
+        for name, encoder in encoders.items():
+            dictionaries[name], remap = encoder.finish()
+            targets = {
+                "players": ("d_batsman", "d_bowler"),
+                "teams": ("m_team1", "m_team2", "m_winner", "i_team", "d_team"),
+                "venues": ("m_venue",),
+                "dates": ("m_date",),
+            }[name]
+            for column in targets:
+                values = columns[column]
+                valid = values >= 0
+                values[valid] = remap[values[valid]]
+        return cls(columns, dictionaries, generation)
+
+    def save(self, directory):
+        """Write the columns under directory/g<generation>, replacing older generations.
+
+        Files are written to a temporary directory and renamed into place, so
+        a reader never memory-maps a half-written column; superseded
+        generations are removed (mapped files stay readable until unmapped).
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / f"g{self.generation}"
+        staging = directory / f"g{self.generation}.tmp{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        for name in COLUMNS:
+            np.save(staging / f"{name}.npy", np.ascontiguousarray(self.columns[name], dtype=COLUMNS[name]))
+        meta = {"generation": self.generation, "dictionaries": self.dictionaries}
+        (staging / META_FILE).write_text(json.dumps(meta))
+        if target.exists():
+            shutil.rmtree(staging, ignore_errors=True)
+        else:
+            os.replace(staging, target)
+        for stale in directory.iterdir():
+            if stale.is_dir() and stale.name != target.name:
+                shutil.rmtree(stale, ignore_errors=True)
+        return target
+
+    @classmethod
+    def load(cls, directory, generation):
+        """Memory-map saved columns for a generation, or return None if there are none."""
+        path = Path(directory) / f"g{generation}"
+        try:
+            meta = json.loads((path / META_FILE).read_text())
+            columns = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in COLUMNS}
+        except (OSError, ValueError):
+            return None
+        if meta.get("generation") != generation:
+            return None
+        return cls(columns, meta["dictionaries"], generation)
+
+    @classmethod
+    def open(cls, conn, directory=None, generation=None):
+        """Load saved columns for the database's current generation, building them if needed."""
+        if generation is None:
+            generation = conn.execute("PRAGMA user_version").fetchone()[0]
+        if directory is not None:
+            engine = cls.load(directory, generation)
+            if engine is not None:
+                return engine
+        engine = cls.from_connection(conn, generation)
+        if directory is not None:
+            try:
+                engine.save(directory)
+            except OSError:
+                pass  # read-only location: keep the in-memory columns
+        return engine
+
+    # --- shared group-bys ---
+
+    def _shared(self, name, compute):
+        value = self._cache.get(name)
+        if value is None:
+            value = self._cache[name] = compute()
+        return value
+
+    def _innings_totals(self):
+        """Runs per innings row (innings without deliveries total 0)."""
+        def compute():
+            valid = self.d_innings >= 0
+            return np.bincount(self.d_innings[valid], weights=self.d_total[valid],
+                               minlength=len(self.i_match)).astype(np.int64)
+        return self._shared("innings_totals", compute)
+
+    def _match_rows(self, match_ids):
+        """Row in the m_* columns for each match ID."""
+        return np.searchsorted(self.m_match, match_ids)
+
+    def _delivery_match_rows(self):
+        """Row in the m_* columns for each delivery."""
+        return self._shared("delivery_match_rows",
+                            lambda: self._match_rows(self.d_match).astype(np.int64))
+
+    def _batter_matches(self):
+        """batter_match_stats: one group per (match, batsman) over deliveries with an innings."""
+        def compute():
+            valid = self.d_innings >= 0
+            players = len(self.players)
+            pair = self._delivery_match_rows()[valid] * players + self.d_batsman[valid]
+            keys, group = _group_rank(pair, len(self.m_match) * players)
+            return {
+                "match": self.m_match[keys // players].astype(np.int64),
+                "batsman": keys % players,
+                "runs": np.bincount(group, weights=self.d_runs[valid], minlength=len(keys)).astype(np.int64),
+                "balls": np.bincount(group, minlength=len(keys)).astype(np.int64),
+            }
+        return self._shared("batter_matches", compute)
+
+    def _bowler_matches(self):
+        """bowler_match_stats: one group per (match, bowler)."""
+        def compute():
+            players = len(self.players)
+            pair = self._delivery_match_rows() * players + self.d_bowler
+            keys, group = _group_rank(pair, len(self.m_match) * players)
+            # Distinct overs per group: group-by (group, over) and count per group.
+            over_span = int(self.d_over.max()) + 1 if len(self.d_over) else 1
+            pair_overs, _ = _group_rank(group.astype(np.int64) * over_span + self.d_over, len(keys) * over_span)
+            return {
+                "match": self.m_match[keys // players].astype(np.int64),
+                "bowler": keys % players,
+                "overs": np.bincount(pair_overs // over_span, minlength=len(keys)).astype(np.int64),
+                "runs": np.bincount(group, weights=self.d_total, minlength=len(keys)).astype(np.int64),
+                "wickets": np.bincount(group, weights=self.d_wicket, minlength=len(keys)).astype(np.int64),
+            }
+        return self._shared("bowler_matches", compute)
+
+    def _name(self, dictionary, code):
+        return dictionary[code] if code >= 0 else None
+
+    def query(self, question):
+        """Answer a normalized query_map question: (column_names, rows)."""
+        return getattr(self, QUESTIONS[question])()
+
+    # --- the questions ---
+
+    def highest_total_score(self):
+        totals = self._innings_totals()
+        order = _order(-totals, -self.i_match.astype(np.int64), -self.i_inning.astype(np.int64))[:10]
+        rows = []
+        for i in order:
+            m = self._match_rows(self.i_match[i])
+            rows.append((int(self.i_match[i]), self._name(self.teams, self.m_team1[m]),
+                         self._name(self.teams, self.m_team2[m]), self._name(self.venues, self.m_venue[m]),
+                         self._name(self.dates, self.m_date[m]), self._name(self.teams, self.i_team[i]),
+                         int(totals[i]), int(self.i_inning[i])))
+        return ["match_id", "team1", "team2", "venue", "match_date", "batting_team", "total_score", "inning"], rows
+
+    def most_runs(self):
+        batter = self._batter_matches()
+        players = len(self.players)
+        runs = np.bincount(batter["batsman"], weights=batter["runs"], minlength=players).astype(np.int64)
+        balls = np.bincount(batter["batsman"], weights=batter["balls"], minlength=players).astype(np.int64)
+        matches = np.bincount(batter["batsman"], minlength=players)
+        batted = np.flatnonzero(matches)
+        order = batted[_order(-runs[batted], batted)][:15]
+        rows = [(self.players[p], int(runs[p]), int(balls[p]), int(matches[p]),
+                 sql_round(runs[p] / balls[p] * 100, 2)) for p in order]
+        return ["player", "total_runs", "balls_faced", "matches_played", "strike_rate"], rows
+
+    def most_wickets(self):
+        bowler = self._bowler_matches()
+        players = len(self.players)
+        wickets = np.bincount(bowler["bowler"], weights=bowler["wickets"], minlength=players).astype(np.int64)
+        matches = np.bincount(bowler["bowler"], minlength=players)
+        overs = np.bincount(bowler["bowler"], weights=bowler["overs"], minlength=players).astype(np.int64)
+        took = np.flatnonzero(wickets > 0)
+        order = took[_order(-wickets[took], took)][:15]
+        rows = [(self.players[p], int(wickets[p]), int(matches[p]), int(overs[p])) for p in order]
+        return ["bowler", "wickets", "matches_bowled", "overs_bowled"], rows
+
+    def best_bowling_figures(self):
+        bowler = self._bowler_matches()
+        took = np.flatnonzero(bowler["wickets"] > 0)
+        order = took[_order(-bowler["wickets"][took], bowler["runs"][took], took)][:15]
+        rows = [(self.players[bowler["bowler"][g]], int(bowler["match"][g]), int(bowler["wickets"][g]),
+                 int(bowler["overs"][g]), int(bowler["runs"][g])) for g in order]
+        return ["bowler", "match_id", "wickets_in_match", "overs_bowled", "runs_conceded"], rows
+
+    def average_first_innings_score(self):
+        totals = self._innings_totals()[self.i_inning == 1]
+        if len(totals) == 0:
+            row = (None, 0, None, None)
+        else:
+            row = (sql_round(int(totals.sum()) / len(totals), 2), len(totals), int(totals.min()), int(totals.max()))
+        return ["average_first_innings_score", "total_first_innings", "lowest_score", "highest_score"], [row]
+
+    def _match_totals(self):
+        """(match rows with innings, total runs in each) via reduceat over the sorted innings."""
+        def compute():
+            totals = self._innings_totals()
+            if len(totals) == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+            starts = np.flatnonzero(np.r_[True, self.i_match[1:] != self.i_match[:-1]])
+            return self._match_rows(self.i_match[starts]), np.add.reduceat(totals, starts)
+        return self._shared("match_totals", compute)
+
+    def highest_scoring_venues(self):
+        match_rows, match_totals = self._match_totals()
+        venue = self.m_venue[match_rows].astype(np.int64) + 1       # shift so NULL (-1) is group 0
+        groups = len(self.venues) + 1
+        played = np.bincount(venue, minlength=groups)
+        runs = np.bincount(venue, weights=match_totals, minlength=groups)
+        highest = np.full(groups, -1, dtype=np.int64)
+        np.maximum.at(highest, venue, match_totals)
+        venues = np.flatnonzero(played >= 3)
+        averages = {v: sql_round(runs[v] / played[v], 2) for v in venues}
+        ordered = sorted(venues, key=lambda v: -averages[v])[:10]
+        rows = [(self._name(self.venues, v - 1), int(played[v]), averages[v], int(highest[v])) for v in ordered]
+        return ["venue", "matches_played", "avg_match_total", "highest_match_total"], rows
+
+    def centuries(self):
+        batter = self._batter_matches()
+        hundreds = np.flatnonzero(batter["runs"] >= 100)
+        order = hundreds[_order(-batter["runs"][hundreds], batter["match"][hundreds], batter["batsman"][hundreds])]
+        rows = []
+        for g in order:
+            m = self._match_rows(batter["match"][g])
+            runs, balls = int(batter["runs"][g]), int(batter["balls"][g])
+            rows.append((self.players[batter["batsman"][g]], int(batter["match"][g]),
+                         self._name(self.teams, self.m_team1[m]), self._name(self.teams, self.m_team2[m]),
+                         self._name(self.venues, self.m_venue[m]), self._name(self.dates, self.m_date[m]),
+                         runs, balls, sql_round(runs / balls * 100, 2)))
+        return ["player", "match_id", "team1", "team2", "venue", "match_date",
+                "runs_scored", "balls_faced", "strike_rate"], rows
+
+    def chase_targets(self):
+        totals = self._innings_totals()
+        first = np.flatnonzero(self.i_inning == 1)
+        second = np.flatnonzero(self.i_inning == 2)
+        both, first_at, second_at = np.intersect1d(self.i_match[first], self.i_match[second],
+                                                   assume_unique=True, return_indices=True)
+        target = totals[first[first_at]]
+        chased = totals[second[second_at]]
+        chases = np.flatnonzero(chased >= target)
+        order = chases[_order(-target[chases], -both[chases].astype(np.int64))][:15]
+        rows = []
+        for c in order:
+            m = self._match_rows(both[c])
+            rows.append((int(both[c]), self._name(self.teams, self.m_team1[m]),
+                         self._name(self.teams, self.m_team2[m]), self._name(self.teams, self.m_winner[m]),
+                         self._name(self.venues, self.m_venue[m]), int(target[c]), int(chased[c]),
+                         int(target[c] - chased[c])))
+        return ["match_id", "team1", "team2", "winner", "venue", "target", "chased_score", "margin"], rows
+
+    def _powerplay_innings(self):
+        """powerplay_totals: (innings rows with powerplay deliveries, runs in each)."""
+        def compute():
+            powerplay = (self.d_innings >= 0) & (self.d_over < POWERPLAY_OVERS)
+            innings = self.d_innings[powerplay]
+            runs = np.bincount(innings, weights=self.d_total[powerplay], minlength=len(self.i_match))
+            batted = np.flatnonzero(np.bincount(innings, minlength=len(self.i_match)))
+            return batted, runs[batted].astype(np.int64)
+        return self._shared("powerplay_innings", compute)
+
+    def powerplay_performance(self):
+        batted, runs = self._powerplay_innings()
+        team = self.i_team[batted].astype(np.int64) + 1               # shift so NULL (-1) is group 0
+        groups = len(self.teams) + 1
+        count = np.bincount(team, minlength=groups)
+        total = np.bincount(team, weights=runs, minlength=groups)
+        best = np.full(groups, -1, dtype=np.int64)
+        np.maximum.at(best, team, runs)
+        span = int(self.i_match.max()) + 1 if len(self.i_match) else 1
+        team_matches = np.unique(team * span + self.i_match[batted])
+        matches = np.bincount(team_matches // span, minlength=groups)
+        teams = np.flatnonzero(count)
+        averages = {t: sql_round(total[t] / count[t], 2) for t in teams}
+        ordered = sorted(teams, key=lambda t: -averages[t])[:10]
+        rows = [(self._name(self.teams, t - 1), int(matches[t]), averages[t], int(best[t])) for t in ordered]
+        return ["team", "matches", "avg_powerplay_runs", "best_powerplay"], rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="ipl_data.db", help="SQLite database to read")
+    parser.add_argument("--columns", help="column directory (default: <db>.columns)")
+    args = parser.parse_args()
+    if not AVAILABLE:
+        parser.error("NumPy is not installed")
+    conn = sqlite3.connect(args.db)
+    engine = ColumnarEngine.from_connection(conn)
+    conn.close()
+    path = engine.save(args.columns or args.db + ".columns")
+    print(f"Saved {len(engine.d_match)} deliveries (generation {engine.generation}) to {path}")
+
+
+if __name__ == "__main__":
+    main()
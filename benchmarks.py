@@ -0,0 +1,879 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the IPL MCP server.
+
+Usage:
+    python3 benchmarks.py connections [--db ipl_data.db] [--iterations 200]
+    python3 benchmarks.py aggregates [--factor 100] [--iterations 5]
+    python3 benchmarks.py loader [--factors 10 100 1000] [--repeat 3] [--workers 1] [--format dir] [--baseline] [--output loader.json]
+    python3 benchmarks.py columnar [--factor 348] [--iterations 5]
+    python3 benchmarks.py server [--db ipl_data.db] [--mix all] [--requests 2000] [--concurrency 4] [--output server.json]
+    python3 benchmarks.py protocol [--messages 20000] [--repeat 3] [--output protocol.json]
+    python3 benchmarks.py startup [--db ipl_data.db] [--repeat 10] [--output startup.json]
+    python3 benchmarks.py routing [--db ipl_data.db] [--paraphrases 5000] [--output routing.json]
+    python3 benchmarks.py players [--factor 92] [--rosters 7] [--lookups 2000] [--output players.json]
+    python3 benchmarks.py compare baseline.json current.json
+
+The server, protocol, startup, routing, players and loader suites write their results as JSON (--output), tagged
+with the git commit, so runs from two commits can be diffed with compare.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import analytics_engine
+import data_loader
+import ipl_mcp_server as server
+import player_index
+from mcp_client import SERVER_SCRIPT, StdioServerClient
+from test_server import TEST_QUERIES, answer_text
+
+DEFAULT_DB = "ipl_data.db"
+DEMO_QUERIES_FILE = Path(__file__).with_name("demo_queries.md")
+
+# Canned questions exercised by the benchmarks.
+BENCH_QUESTIONS = [
+    "Show me all matches in the dataset",
+    "Which team won the most matches?",
+    "Show matches played in Mumbai",
+    "Who scored the most runs across all matches?",
+    "Which bowler took the most wickets?",
+]
+
+
+# The same questions answered by re-aggregating deliveries at query time,
+# i.e. what the templates did before the summary tables existed.
+RAW_AGGREGATE_QUERIES = {
+    "who scored the most runs across all matches": """
+        SELECT batsman as player, SUM(runs_scored) as total_runs, COUNT(*) as balls_faced,
+               COUNT(DISTINCT match_id) as matches_played
+        FROM deliveries
+        GROUP BY batsman ORDER BY total_runs DESC LIMIT 15
+    """,
+    "which bowler took the most wickets": """
+        SELECT bowler, COUNT(*) as wickets, COUNT(DISTINCT match_id) as matches_bowled
+        FROM deliveries
+        WHERE wicket_kind IS NOT NULL AND wicket_kind != ''
+        GROUP BY bowler ORDER BY wickets DESC LIMIT 15
+    """,
+    "what was the highest total score": """
+        SELECT d.match_id, d.inning, SUM(d.total_runs) as total_score
+        FROM deliveries d
+        GROUP BY d.match_id, d.inning ORDER BY total_score DESC LIMIT 10
+    """,
+    "what's the average first innings score": """
+        SELECT ROUND(AVG(innings_total), 2) FROM (
+            SELECT match_id, SUM(total_runs) as innings_total
+            FROM deliveries WHERE inning = 1 GROUP BY match_id)
+    """,
+    "which venue has the highest scoring matches": """
+        SELECT m.venue, COUNT(DISTINCT m.match_id) as matches_played,
+               ROUND(AVG(venue_scores.total_score), 2) as avg_match_total
+        FROM matches m JOIN (
+            SELECT match_id, SUM(total_runs) as total_score
+            FROM deliveries GROUP BY match_id) venue_scores ON m.match_id = venue_scores.match_id
+        GROUP BY m.venue HAVING matches_played >= 3 ORDER BY avg_match_total DESC LIMIT 10
+    """,
+    "show me all centuries scored": """
+        SELECT d.batsman as player, d.match_id, SUM(d.runs_scored) as runs_scored
+        FROM deliveries d
+        GROUP BY d.batsman, d.match_id HAVING SUM(d.runs_scored) >= 100
+        ORDER BY runs_scored DESC
+    """,
+    "which team has the best powerplay performance": """
+        SELECT i.team_batting as team, ROUND(AVG(pp.powerplay_runs), 2) as avg_powerplay_runs
+        FROM innings i JOIN (
+            SELECT match_id, inning, SUM(total_runs) as powerplay_runs
+            FROM deliveries WHERE over < 6 GROUP BY match_id, inning) pp
+            ON i.match_id = pp.match_id AND i.inning = pp.inning
+        GROUP BY team ORDER BY avg_powerplay_runs DESC LIMIT 10
+    """,
+}
+
+
+# Paraphrased questions labeled with the template they should reach (None:
+# should get the "could not understand" answer). Written separately from
+# semantic_router.PARAPHRASES so they measure generalization, not recall.
+ROUTING_QUESTIONS = [
+    ("Give me the full list of games", "show me all matches in the dataset"),
+    ("Which matches are in the database?", "show me all matches in the dataset"),
+    ("Display every fixture", "show me all matches in the dataset"),
+    ("Which franchise has the most victories?", "which team won the most matches"),
+    ("Who won the most games overall?", "which team won the most matches"),
+    ("Team with the highest number of wins", "which team won the most matches"),
+    ("What's the biggest innings total?", "what was the highest total score"),
+    ("Largest team total ever posted", "what was the highest total score"),
+    ("Top innings scores", "what was the highest total score"),
+    ("Which games were played at Eden Gardens?", "show matches played in _venue_"),
+    ("Fixtures hosted in Mumbai", "show matches played in _venue_"),
+    ("What games happened at Wankhede?", "show matches played in _venue_"),
+    ("List the KKR games", "show matches played by _team_"),
+    ("Which fixtures did Chennai Super Kings play?", "show matches played by _team_"),
+    ("Mumbai Indians match list", "show matches played by _team_"),
+    ("Which games took place in 2012?", "show matches played in _season_"),
+    ("2012 season fixtures", "show matches played in _season_"),
+    ("Most successful franchise of 2012", "which team won the most matches in _season_"),
+    ("Which side had the most victories in 2012?", "which team won the most matches in _season_"),
+    ("Who is the leading run getter?", "who scored the most runs across all matches"),
+    ("Top batsmen by runs", "who scored the most runs across all matches"),
+    ("Which batter has scored the most runs?", "who scored the most runs across all matches"),
+    ("Highest run scorer in the IPL", "who scored the most runs across all matches"),
+    ("Who has the most dismissals?", "which bowler took the most wickets"),
+    ("Leading wicket-takers", "which bowler took the most wickets"),
+    ("Which bowler has the most scalps?", "which bowler took the most wickets"),
+    ("Top bowlers by wickets", "which bowler took the most wickets"),
+    ("How many runs has Gayle scored?", "show me _player_ batting stats"),
+    ("Rohit Sharma batting record", "show me _player_ batting stats"),
+    ("How has Chris Gayle batted?", "show me _player_ batting stats"),
+    ("What is Dhoni's strike rate?", "show me _player_ batting stats"),
+    ("Malinga's wickets", "show me _player_ bowling stats"),
+    ("How did Malinga bowl?", "show me _player_ bowling stats"),
+    ("Bowling record of Sunil Narine", "show me _player_ bowling stats"),
+    ("What is Narine's economy?", "show me _player_ bowling stats"),
+    ("Best spell in a single game", "who has the best bowling figures in a single match"),
+    ("Most wickets in one game by a bowler", "who has the best bowling figures in a single match"),
+    ("Best bowling performance in a match", "who has the best bowling figures in a single match"),
+    ("What do teams usually score batting first?", "what's the average first innings score"),
+    ("Mean score of the first innings", "what's the average first innings score"),
+    ("Par first innings total", "what's the average first innings score"),
+    ("Which ground produces the highest scores?", "which venue has the highest scoring matches"),
+    ("Best stadium for batting", "which venue has the highest scoring matches"),
+    ("Where are the most runs scored?", "which venue has the highest scoring matches"),
+    ("Who has hit a hundred?", "show me all centuries scored"),
+    ("List all the tons", "show me all centuries scored"),
+    ("Which batsmen made 100s?", "show me all centuries scored"),
+    ("Biggest successful run chases", "show me the most successful chase targets"),
+    ("Highest target chased down", "show me the most successful chase targets"),
+    ("Best chasing performances", "show me the most successful chase targets"),
+    ("Which side starts fastest in the first six overs?", "which team has the best powerplay performance"),
+    ("Best team in the powerplay", "which team has the best powerplay performance"),
+    ("Powerplay runs by team", "which team has the best powerplay performance"),
+    ("Which team scores the most in the death overs?", "which team scored the most runs in _overs_"),
+    ("Team runs in the middle overs", "which team scored the most runs in _overs_"),
+    ("What is the capital of France?", None),
+    ("How do I bake bread?", None),
+    ("Tell me a joke", None),
+    ("What is the airspeed velocity of an unladen swallow?", None),
+]
+
+
+def replicate_dataset(source_dir, dest_dir, factor, rosters=1):
+    """Copy every match file in source_dir factor times under new cricsheet-style IDs.
+
+    With rosters > 1 the copies are split into that many groups and every
+    player name in group g > 0 gets a " g" suffix, so the roster grows too.
+    """
+    sources = sorted(Path(source_dir).glob("*.json"))
+    dest = Path(dest_dir)
+    dest.mkdir(parents=True, exist_ok=True)
+    for copy in range(factor):
+        roster = copy % rosters
+        for source in sources:
+            target = dest / f"{copy + 1}{source.stem}.json"
+            if not roster:
+                shutil.copyfile(source, target)
+                continue
+            match = json.loads(source.read_text())
+            for innings in match.get("innings", []):
+                for over in innings.get("overs", []):
+                    for delivery in over.get("deliveries", []):
+                        for role in ("batter", "non_striker", "bowler"):
+                            delivery[role] = f"{delivery[role]} {roster}"
+                        for wicket in delivery.get("wickets", []):
+                            wicket["player_out"] = f"{wicket['player_out']} {roster}"
+            target.write_text(json.dumps(match))
+    return len(sources) * factor
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _report(label, samples):
+    print(f"{label:<22} mean {statistics.mean(samples) * 1e6:9.1f} us   "
+          f"p50 {_percentile(samples, 50) * 1e6:9.1f} us   "
+          f"p95 {_percentile(samples, 95) * 1e6:9.1f} us")
+
+
+def _summary_ms(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1e3, 3),
+        "p50_ms": round(_percentile(samples, 50) * 1e3, 3),
+        "p95_ms": round(_percentile(samples, 95) * 1e3, 3),
+        "p99_ms": round(_percentile(samples, 99) * 1e3, 3),
+        "max_ms": round(max(samples) * 1e3, 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _write_results(output, benchmark, args, results):
+    """Write results plus enough context (commit, interpreter, params) to compare runs later."""
+    if not output:
+        return
+    params = {key: value for key, value in vars(args).items() if key not in ("func", "output", "command")}
+    document = {
+        "benchmark": benchmark,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+        "params": params,
+        "results": results,
+    }
+    Path(output).write_text(json.dumps(document, indent=2) + "\n")
+    print(f"\nresults written to {output}")
+
+
+def demo_queries(path=DEMO_QUERIES_FILE):
+    """The "- question" lines of demo_queries.md."""
+    return [line[2:].strip() for line in Path(path).read_text().splitlines() if line.startswith("- ")]
+
+
+def _connect_per_query(db_file, sql_query, params=()):
+    """The original execute path: open, run, close."""
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+    cursor.execute(sql_query, params)
+    cursor.fetchall()
+    conn.close()
+
+
+def bench_connections(args):
+    """Compare per-call latency of connect-per-query against the pooled path."""
+    server.DB_FILE = args.db
+    queries = [server.get_sql_query(q) for q in BENCH_QUESTIONS]
+    pool = server.ConnectionPool(args.db)
+
+    def pooled(sql_query, params):
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql_query, params)
+            cursor.fetchall()
+            cursor.close()
+
+    for label, run in (("connect-per-query", lambda q, p: _connect_per_query(args.db, q, p)),
+                       ("pooled read-only", pooled)):
+        samples = []
+        for _ in range(args.iterations):
+            for sql_query, params in queries:
+                start = time.perf_counter()
+                try:
+                    run(sql_query, params)
+                except sqlite3.Error:
+                    pass
+                samples.append(time.perf_counter() - start)
+        _report(label, samples)
+    pool.close()
+
+
+def bench_aggregates(args):
+    """Time aggregate questions against raw deliveries vs the summary tables."""
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = Path(workdir) / "data"
+        db_file = str(Path(workdir) / "bench.db")
+        matches = replicate_dataset(data_loader.DATA_DIR, data_dir, args.factor)
+        data_loader.load_data(db_file, str(data_dir))
+        conn = sqlite3.connect(db_file)
+        deliveries = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+        print(f"\n{matches} matches, {deliveries} deliveries\n")
+
+        for question, raw_sql in RAW_AGGREGATE_QUERIES.items():
+            timings = []
+            for sql_query in (raw_sql, server.QUERY_MAP[question]):
+                samples = []
+                for _ in range(args.iterations):
+                    start = time.perf_counter()
+                    conn.execute(sql_query).fetchall()
+                    samples.append(time.perf_counter() - start)
+                timings.append(statistics.median(samples))
+            print(f"{question:<48} raw {timings[0] * 1e3:8.2f} ms   "
+                  f"summary {timings[1] * 1e3:8.2f} ms   x{timings[0] / timings[1]:.0f}")
+        conn.close()
+
+
+def pack_dataset(data_dir, dest, data_format):
+    """data_dir's match files as data_format: "dir" (as is), "zip" or "jsonl"."""
+    if data_format == "dir":
+        return data_dir
+    files = sorted(Path(data_dir).glob("*.json"))
+    if data_format == "zip":
+        with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as archive:
+            for path in files:
+                archive.write(path, f"ipl_json/{path.name}")
+    else:
+        with open(dest, "w") as f:
+            for path in files:
+                f.write(json.dumps(dict(json.loads(path.read_text()), match_id=int(path.stem))) + "\n")
+    for path in files:
+        path.unlink()
+    return dest
+
+
+def _peak_rss_mib(command):
+    """Peak resident set size of a child process running command."""
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, cwd=Path(__file__).parent)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class _RowAtATimeWriter(data_loader.DeliveryWriter):
+    """DeliveryWriter as before executemany: one execute() per delivery row."""
+
+    def flush(self):
+        for row in self.pending:
+            self.cursor.execute(self.INSERT_SQL, row)
+        self.rows_written += len(self.pending)
+        self.pending = []
+
+
+@contextmanager
+def _row_at_a_time_loader():
+    """Run data_loader the way full loads ran before bulk inserts.
+
+    Deliveries are inserted one execute() at a time into tables that
+    already have their secondary indexes, with the default journal and
+    synchronous settings; parsing and the summary tables are unchanged.
+    """
+    saved = data_loader.DeliveryWriter, data_loader.BULK_LOAD_PRAGMAS, data_loader.create_database_schema
+    create_schema = data_loader.create_database_schema
+    data_loader.DeliveryWriter = _RowAtATimeWriter
+    data_loader.BULK_LOAD_PRAGMAS = {}
+    data_loader.create_database_schema = lambda cursor, **options: create_schema(
+        cursor, **dict(options, with_indexes=True))
+    try:
+        yield
+    finally:
+        data_loader.DeliveryWriter, data_loader.BULK_LOAD_PRAGMAS, data_loader.create_database_schema = saved
+
+
+def _time_loads(db_file, source, args):
+    """Median and fastest of args.repeat full loads of source."""
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        data_loader.load_data(db_file, source, workers=args.workers)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), min(samples)
+
+
+def bench_loader(args):
+    """Time a full data_loader.load_data over ipl_data/ replicated at each factor.
+
+    With --baseline, each factor is also loaded with row-at-a-time inserts
+    (see _row_at_a_time_loader) and both rates are reported.
+    """
+    results = {}
+    for factor in args.factors:
+        with tempfile.TemporaryDirectory() as workdir:
+            data_dir = Path(workdir) / "data"
+            db_file = str(Path(workdir) / "bench.db")
+            matches = replicate_dataset(data_loader.DATA_DIR, data_dir, factor)
+            source = str(pack_dataset(data_dir, Path(workdir) / f"data.{args.format}", args.format))
+            baseline = None
+            if args.baseline:
+                with _row_at_a_time_loader():
+                    baseline, _ = _time_loads(db_file, source, args)
+            elapsed, fastest = _time_loads(db_file, source, args)
+            conn = sqlite3.connect(db_file)
+            deliveries = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+            conn.close()
+            peak = _peak_rss_mib([sys.executable, "data_loader.py", "--db", db_file, "--data-dir", source,
+                                  "--workers", str(args.workers)])
+        results[f"x{factor}"] = {
+            "matches": matches,
+            "deliveries": deliveries,
+            "median_s": round(elapsed, 3),
+            "min_s": round(fastest, 3),
+            "rows_per_sec": round(deliveries / elapsed),
+            "peak_rss_mib": round(peak, 1),
+        }
+        print(f"\nx{factor}: {matches} matches, {deliveries} deliveries: median {elapsed:.2f} s "
+              f"({deliveries / elapsed:,.0f} rows/sec), peak RSS {peak:.0f} MiB")
+        if baseline is not None:
+            results[f"x{factor}"].update(baseline_median_s=round(baseline, 3),
+                                         baseline_rows_per_sec=round(deliveries / baseline),
+                                         speedup=round(baseline / elapsed, 2))
+            print(f"  row-at-a-time baseline: median {baseline:.2f} s ({deliveries / baseline:,.0f} rows/sec), "
+                  f"bulk inserts {baseline / elapsed:.2f}x faster")
+    _write_results(args.output, "loader", args, results)
+
+
+def bench_columnar(args):
+    """Time the aggregate questions on SQLite vs the columnar engine, plus its cold start."""
+    if not analytics_engine.AVAILABLE:
+        raise SystemExit("NumPy is not installed")
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = Path(workdir) / "data"
+        db_file = str(Path(workdir) / "bench.db")
+        columns_dir = Path(workdir) / "columns"
+        matches = replicate_dataset(data_loader.DATA_DIR, data_dir, args.factor)
+        data_loader.load_data(db_file, str(data_dir), workers=args.workers)
+        conn = sqlite3.connect(db_file)
+        deliveries = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+        print(f"\n{matches} matches, {deliveries} deliveries\n")
+
+        start = time.perf_counter()
+        engine = analytics_engine.ColumnarEngine.from_connection(conn)
+        built = time.perf_counter() - start
+        engine.save(columns_dir)
+        start = time.perf_counter()
+        engine = analytics_engine.ColumnarEngine.load(columns_dir, engine.generation)
+        mapped = time.perf_counter() - start
+        print(f"cold start: build from SQLite {built * 1e3:.1f} ms, memory-map .npy {mapped * 1e3:.2f} ms\n")
+
+        print(f"{'':<52} {'sqlite':>10} {'numpy cold':>12} {'numpy warm':>12}")
+        for question in analytics_engine.QUESTIONS:
+            sql_query = server.QUERY_MAP[question]
+            sql_samples, cold_samples, warm_samples = [], [], []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                sql_rows = conn.execute(sql_query).fetchall()
+                sql_samples.append(time.perf_counter() - start)
+                # cold: no shared group-bys from earlier questions; warm: reuses them
+                engine._cache.clear()
+                start = time.perf_counter()
+                engine_rows = engine.query(question)[1]
+                cold_samples.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                engine.query(question)
+                warm_samples.append(time.perf_counter() - start)
+            print(f"{question:<52} {statistics.median(sql_samples) * 1e3:7.2f} ms "
+                  f"{statistics.median(cold_samples) * 1e3:9.2f} ms {statistics.median(warm_samples) * 1e3:9.2f} ms"
+                  f"   {'same rows' if sql_rows == engine_rows else 'ROWS DIFFER'}")
+        conn.close()
+
+
+def bench_server(args):
+    """Drive ipl_mcp_server.py over stdio with a question mix; report throughput and latency."""
+    mixes = {"test": TEST_QUERIES, "demo": demo_queries()}
+    questions = mixes["test"] + mixes["demo"] if args.mix == "all" else mixes[args.mix]
+    rng = random.Random(args.seed)
+    calls = [("query_ipl_data", {"question": rng.choice(questions)}) for _ in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = args.db
+        if db_file is None:
+            data_dir = Path(workdir) / "data"
+            db_file = str(Path(workdir) / "bench.db")
+            replicate_dataset(data_loader.DATA_DIR, data_dir, args.factor)
+            data_loader.load_data(db_file, str(data_dir))
+
+        start = time.perf_counter()
+        with StdioServerClient(db_file) as client:
+            client.initialize()
+            startup = time.perf_counter() - start
+
+            # First pass over each distinct question: result cache misses.
+            _, first_pass = client.run_load([("query_ipl_data", {"question": q}) for q in dict.fromkeys(questions)])
+            wall, timed = client.run_load(calls, concurrency=args.concurrency)
+            stats = json.loads(answer_text(client.call_tool("server_stats")))
+
+    failed = sum(1 for _, _, response in timed if "error" in response or not answer_text(response))
+    latencies = [latency for _, latency, _ in timed]
+    per_question = {}
+    for (_, arguments), latency, _ in timed:
+        per_question.setdefault(arguments["question"], []).append(latency)
+    results = {
+        "startup_ms": round(startup * 1e3, 3),
+        "requests": len(timed),
+        "failed": failed,
+        "concurrency": args.concurrency,
+        "throughput_rps": round(len(timed) / wall, 1),
+        "latency": _summary_ms(latencies),
+        "first_pass": _summary_ms([latency for _, latency, _ in first_pass]),
+        "questions": {question: _summary_ms(samples) for question, samples in sorted(per_question.items())},
+        "result_cache": stats["result_cache"],
+    }
+
+    print(f"\nstartup {results['startup_ms']:.1f} ms, {len(timed)} requests "
+          f"({failed} failed) at concurrency {args.concurrency}: {results['throughput_rps']:,.1f} req/s")
+    _report("first pass (cold)", [latency for _, latency, _ in first_pass])
+    _report("steady state", latencies)
+    _write_results(args.output, "server", args, results)
+
+
+def _count_lines(stream, expected):
+    """Read stream until expected newline-terminated messages have arrived; returns bytes read."""
+    read = getattr(stream, "read1", stream.read)
+    seen = received = 0
+    while seen < expected:
+        chunk = read(65536)
+        if not chunk:
+            raise SystemExit(f"Server exited after {seen} of {expected} responses")
+        seen += chunk.count(b"\n")
+        received += len(chunk)
+    return received
+
+
+def bench_protocol(args):
+    """Messages/sec for tools/list, which touches no SQL: pure JSON-RPC framing overhead."""
+    requests = b"".join(json.dumps({"jsonrpc": "2.0", "id": i, "method": "tools/list"}).encode() + b"\n"
+                        for i in range(1, args.messages + 1))
+    pipelined, round_trips, response_bytes = [], [], 0
+    for _ in range(args.repeat):
+        process = subprocess.Popen([sys.executable, args.server_script],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=dict(os.environ))
+
+        # Lockstep: one request in flight, so each sample is a full round trip.
+        for i in range(args.round_trips):
+            start = time.perf_counter()
+            process.stdin.write(b'{"jsonrpc":"2.0","id":0,"method":"tools/list"}\n')
+            process.stdin.flush()
+            process.stdout.readline()
+            round_trips.append(time.perf_counter() - start)
+
+        # Pipelined: everything written up front by a second thread.
+        def write_all():
+            process.stdin.write(requests)
+            process.stdin.close()
+
+        start = time.perf_counter()
+        writer = threading.Thread(target=write_all)
+        writer.start()
+        response_bytes = _count_lines(process.stdout, args.messages)
+        pipelined.append(time.perf_counter() - start)
+        writer.join()
+        process.wait()
+
+    elapsed = statistics.median(pipelined)
+    results = {
+        "messages": args.messages,
+        "pipelined_msgs_per_sec": round(args.messages / elapsed),
+        "best_msgs_per_sec": round(args.messages / min(pipelined)),
+        "response_bytes": response_bytes // args.messages,
+        "round_trip": _summary_ms(round_trips),
+    }
+    print(f"\n{args.messages} pipelined tools/list: {results['pipelined_msgs_per_sec']:,} msgs/sec "
+          f"(best {results['best_msgs_per_sec']:,}), {results['response_bytes']} bytes each")
+    _report("round trip", round_trips)
+    _write_results(args.output, "protocol", args, results)
+
+
+def bench_players(args):
+    """Player index build cost, memory and lookup latency vs the SQL templates."""
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = Path(workdir) / "data"
+        db_file = str(Path(workdir) / "bench.db")
+        matches = replicate_dataset(data_loader.DATA_DIR, data_dir, args.factor, args.rosters)
+        data_loader.load_data(db_file, str(data_dir))
+        conn = sqlite3.connect(db_file)
+        deliveries = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+        start = time.perf_counter()
+        data_loader.build_player_index(conn.cursor())
+        built = time.perf_counter() - start
+        conn.commit()
+
+        start = time.perf_counter()
+        index = player_index.PlayerIndex.load(conn)
+        loaded = time.perf_counter() - start
+        # Loaded again under tracemalloc (which slows it down) for the allocated size.
+        tracemalloc.start()
+        traced = player_index.PlayerIndex.load(conn)
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del traced
+        print(f"\n{matches} matches, {deliveries} deliveries: {len(index)} players, "
+              f"{len(index.matchup_bowlers)} matchups")
+        print(f"loader build {built * 1e3:.0f} ms, server load {loaded * 1e3:.1f} ms, "
+              f"{index.memory_bytes() / 1024:.0f} KiB resident ({allocated / 1024:.0f} KiB allocated)\n")
+
+        rng = random.Random(args.seed)
+        batters = [name for (name,) in conn.execute(
+            "SELECT name FROM players JOIN player_careers USING (player_id) WHERE bat_matches > 0")]
+        bowlers = [name for (name,) in conn.execute(
+            "SELECT name FROM players JOIN player_careers USING (player_id) WHERE bowl_matches > 0")]
+        pairs = conn.execute("""
+            SELECT batter.name, bowler.name FROM player_matchups m
+            JOIN players batter ON batter.player_id = m.batter_id
+            JOIN players bowler ON bowler.player_id = m.bowler_id""").fetchall()
+        lookups = {
+            "show me _player_ batting stats": [(json.dumps([rng.choice(batters)]),)
+                                               for _ in range(args.lookups)],
+            "show me _player_ bowling stats": [(json.dumps([rng.choice(bowlers)]),)
+                                               for _ in range(args.lookups)],
+            "show me _player_ vs _player_ head to head": [(json.dumps(pair), json.dumps(pair))
+                                                          for pair in rng.choices(pairs, k=args.lookups)],
+        }
+        results = {"matches": matches, "deliveries": deliveries, "players": len(index),
+                   "matchups": len(index.matchup_bowlers), "loader_build_ms": round(built * 1e3, 1),
+                   "load_ms": round(loaded * 1e3, 2), "resident_bytes": index.memory_bytes(),
+                   "allocated_bytes": allocated}
+        for question, params_list in lookups.items():
+            sql_query = server.QUERY_MAP[question]
+            sql_samples, index_samples = [], []
+            for params in params_list:
+                start = time.perf_counter()
+                sql_rows = conn.execute(sql_query, params).fetchall()
+                sql_samples.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                index_rows = index.query(question, params)[1]
+                index_samples.append(time.perf_counter() - start)
+                if index_rows != sql_rows:
+                    raise SystemExit(f"{question}: index and SQL differ for {params}")
+            print(question)
+            _report("  sqlite", sql_samples)
+            _report("  index", index_samples)
+            results[question] = {"sqlite": _summary_ms(sql_samples), "index": _summary_ms(index_samples)}
+        conn.close()
+    _write_results(args.output, "players", args, results)
+
+
+def synthetic_paraphrases(count, paraphrases):
+    """About count (template, text) pairs: every paraphrase wrapped in filler prefixes and suffixes."""
+    prefixes = ["", "please ", "can you tell me ", "i want to know ", "quick question ", "show me ",
+                "could you find ", "ipl ", "hey ", "stats question "]
+    suffixes = ["", " in the ipl", " overall", " so far", " of all time", " please", " in the dataset",
+                " across seasons", " historically", " right now"]
+    base = [(template, text) for template, texts in paraphrases.items() for text in [template, *texts]]
+    documents = [(template, prefix + text + suffix)
+                 for prefix in prefixes for suffix in suffixes for template, text in base]
+    return documents[:count]
+
+
+def bench_routing(args):
+    """Accuracy and latency of the word-overlap fallback vs the semantic router on ROUTING_QUESTIONS."""
+    import semantic_router
+    if not semantic_router.AVAILABLE:
+        raise SystemExit("NumPy is not installed")
+    server.DB_FILE = args.db
+    extractor = server.get_extractor()
+    routers = {
+        "word_overlap": server.QuestionRouter(server.QUERY_MAP, server.KEY_PHRASES, server.TEMPLATE_PARAMS),
+        "semantic": server.QuestionRouter(server.QUERY_MAP, server.KEY_PHRASES, server.TEMPLATE_PARAMS,
+                                          server.get_semantic_router()),
+    }
+    masked = []
+    for question, expected in ROUTING_QUESTIONS:
+        text, entities = extractor.extract(server.normalize_question(question))
+        masked.append((question, text, frozenset(server.SLOT_TOKENS[kind] for kind in entities), expected))
+
+    results = {}
+    for name, router in routers.items():
+        misses, samples = [], []
+        for question, text, slots, expected in masked:
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                key = router.resolve(text, slots)
+                samples.append(time.perf_counter() - start)
+            if key != expected:
+                misses.append({"question": question, "expected": expected, "got": key})
+        results[name] = {
+            "accuracy": round(1 - len(misses) / len(masked), 4),
+            "resolve": _summary_ms(samples),
+            "misses": len(misses),
+        }
+        print(f"\n{name}: {len(masked) - len(misses)}/{len(masked)} correct")
+        _report("resolve", samples)
+        for miss in misses:
+            print(f"   {miss['question']!r}: expected {miss['expected']!r}, got {miss['got']!r}")
+
+    # Scaling: match latency with thousands of paraphrases in the matrix.
+    documents = synthetic_paraphrases(args.paraphrases, semantic_router.PARAPHRASES)
+    start = time.perf_counter()
+    large = semantic_router.SemanticRouter(documents)
+    built = time.perf_counter() - start
+    samples = []
+    for _ in range(args.iterations):
+        for _, text, _, _ in masked:
+            start = time.perf_counter()
+            large.match(text)
+            samples.append(time.perf_counter() - start)
+    results["scaling"] = {
+        "paraphrases": len(documents),
+        "features": large.matrix.shape[0],
+        "build_ms": round(built * 1e3, 1),
+        "match": _summary_ms(samples),
+    }
+    print(f"\n{len(documents)} paraphrases x {large.matrix.shape[0]} features, built in {built * 1e3:.0f} ms")
+    _report("match", samples)
+    _write_results(args.output, "routing", args, results)
+
+
+def import_time(module="ipl_mcp_server"):
+    """Cumulative import time of module in a fresh interpreter, from python -X importtime."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=Path(__file__).parent, capture_output=True, text=True, check=True).stderr
+    for line in reversed(stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise ValueError(f"{module} not found in -X importtime output")
+
+
+def bench_startup(args):
+    """Import time and time to the first initialize, tools/list and query responses."""
+    samples = {"import": [], "initialize": [], "tools_list": [], "first_query": [], "first_query_warm": []}
+    question = "Who scored the most runs across all matches?"
+    for _ in range(args.repeat):
+        samples["import"].append(import_time())
+        # first_query races the background warm-up; first_query_warm waits --settle seconds for it.
+        for label, settle in (("first_query", 0.0), ("first_query_warm", args.settle)):
+            start = time.perf_counter()
+            with StdioServerClient(args.db) as client:
+                client.initialize()
+                initialized = time.perf_counter()
+                client.request("tools/list")
+                listed = time.perf_counter()
+                if settle:
+                    time.sleep(settle)
+                asked = time.perf_counter()
+                client.call_tool("query_ipl_data", {"question": question})
+                samples[label].append(time.perf_counter() - asked)
+            if not settle:
+                samples["initialize"].append(initialized - start)
+                samples["tools_list"].append(listed - initialized)
+
+    results = {label: _summary_ms(values) for label, values in samples.items()}
+    print()
+    for label, values in samples.items():
+        _report(label, values)
+    _write_results(args.output, "startup", args, results)
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def bench_compare(args):
+    """Print every numeric result that appears in both files, with the relative change."""
+    documents = [json.loads(Path(path).read_text()) for path in (args.baseline, args.current)]
+    if documents[0]["benchmark"] != documents[1]["benchmark"]:
+        raise SystemExit("Results are from different benchmarks")
+    baseline, current = (dict(_flatten(document["results"])) for document in documents)
+    print(f"{documents[0]['benchmark']}: {documents[0]['commit']} -> {documents[1]['commit']}\n")
+    for key, old in baseline.items():
+        if key not in current:
+            continue
+        new = current[key]
+        change = f"{(new - old) / old * 100:+7.1f}%" if old else "      -"
+        print(f"{key:<72} {old:>12g} {new:>12g} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    connections = subparsers.add_parser("connections", help="connection pool vs connect-per-query")
+    connections.add_argument("--db", default=DEFAULT_DB)
+    connections.add_argument("--iterations", type=int, default=200)
+    connections.set_defaults(func=bench_connections)
+
+    aggregates = subparsers.add_parser("aggregates", help="raw deliveries scans vs summary tables")
+    aggregates.add_argument("--factor", type=int, default=100,
+                            help="replicate ipl_data/ this many times")
+    aggregates.add_argument("--iterations", type=int, default=5)
+    aggregates.set_defaults(func=bench_aggregates)
+
+    loader = subparsers.add_parser("loader", help="full load rows/sec")
+    loader.add_argument("--factors", type=int, nargs="+", default=[10, 100, 1000],
+                        help="replicate ipl_data/ this many times, one run per factor")
+    loader.add_argument("--repeat", type=int, default=3)
+    loader.add_argument("--workers", type=int, default=1)
+    loader.add_argument("--format", choices=("dir", "zip", "jsonl"), default="dir",
+                        help="load the copies from a directory, a zip or a JSONL file")
+    loader.add_argument("--baseline", action="store_true",
+                        help="also time row-at-a-time inserts, as full loads ran before executemany")
+    loader.add_argument("--output", help="write results as JSON to this file")
+    loader.set_defaults(func=bench_loader)
+
+    columnar = subparsers.add_parser("columnar", help="SQLite summary tables vs NumPy columns")
+    columnar.add_argument("--factor", type=int, default=348,
+                          help="replicate ipl_data/ this many times (348 -> ~1M deliveries)")
+    columnar.add_argument("--iterations", type=int, default=5)
+    columnar.add_argument("--workers", type=int, default=1)
+    columnar.set_defaults(func=bench_columnar)
+
+    server_suite = subparsers.add_parser("server", help="stdio JSON-RPC throughput and latency")
+    server_suite.add_argument("--db", help="database to serve (default: build one from ipl_data/)")
+    server_suite.add_argument("--factor", type=int, default=1,
+                              help="replicate ipl_data/ this many times when building the database")
+    server_suite.add_argument("--mix", choices=("test", "demo", "all"), default="all",
+                              help="TEST_QUERIES, demo_queries.md, or both")
+    server_suite.add_argument("--requests", type=int, default=2000)
+    server_suite.add_argument("--concurrency", type=int, default=4,
+                              help="requests kept in flight")
+    server_suite.add_argument("--seed", type=int, default=0)
+    server_suite.add_argument("--output", help="write results as JSON to this file")
+    server_suite.set_defaults(func=bench_server)
+
+    protocol = subparsers.add_parser("protocol", help="JSON-RPC framing msgs/sec with tools/list")
+    protocol.add_argument("--messages", type=int, default=20000)
+    protocol.add_argument("--round-trips", type=int, default=500,
+                          help="lockstep requests timed before the pipelined burst")
+    protocol.add_argument("--repeat", type=int, default=3)
+    protocol.add_argument("--server-script", default=SERVER_SCRIPT,
+                          help="server to run, e.g. a checkout of another commit")
+    protocol.add_argument("--output", help="write results as JSON to this file")
+    protocol.set_defaults(func=bench_protocol)
+
+    startup = subparsers.add_parser("startup", help="import time and time to first response")
+    startup.add_argument("--db", default=DEFAULT_DB)
+    startup.add_argument("--repeat", type=int, default=10)
+    startup.add_argument("--settle", type=float, default=0.5,
+                         help="seconds to let the warm-up finish before the warm first query")
+    startup.add_argument("--output", help="write results as JSON to this file")
+    startup.set_defaults(func=bench_startup)
+
+    routing = subparsers.add_parser("routing", help="question routing accuracy and latency")
+    routing.add_argument("--db", default=DEFAULT_DB, help="database the entity names come from")
+    routing.add_argument("--iterations", type=int, default=20)
+    routing.add_argument("--paraphrases", type=int, default=5000,
+                         help="paraphrases in the scaling run")
+    routing.add_argument("--output", help="write results as JSON to this file")
+    routing.set_defaults(func=bench_routing)
+
+    players = subparsers.add_parser("players", help="player index memory and lookups vs SQL")
+    players.add_argument("--factor", type=int, default=92,
+                         help="replicate ipl_data/ this many times (92 -> ~1100 matches)")
+    players.add_argument("--rosters", type=int, default=7,
+                         help="split the copies into this many distinctly named rosters")
+    players.add_argument("--lookups", type=int, default=2000)
+    players.add_argument("--seed", type=int, default=0)
+    players.add_argument("--output", help="write results as JSON to this file")
+    players.set_defaults(func=bench_players)
+
+    compare = subparsers.add_parser("compare", help="diff two JSON result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,141 +1,682 @@
 import os
+import sys
 import json
 import sqlite3
-from pathlib import Path
+import hashlib
+import tarfile
+import zipfile
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import chain, islice
+from pathlib import Path, PurePath
 
 # --- Configuration ---
 DB_FILE = "ipl_data.db"
 DATA_DIR = "ipl_data"
+BATCH_SIZE = 5000  # deliveries per executemany call
+PARSE_CHUNKSIZE = 8  # match files handed to a parser process at a time
+PARSE_WINDOW = 2  # chunks per parser process parsed ahead of the writer
+MAGIC_BYTES = 512  # bytes of stdin peeked at to tell a tar stream from JSONL
+ANALYSIS_LIMIT = 400  # index rows ANALYZE samples per index for index_stats
 
-def create_database_schema(cursor):
+# Full loads build a versioned snapshot (ipl_data.g<generation>.db) and then
+# point DB_FILE at it atomically; this many newest snapshots are kept.
+KEEP_SNAPSHOTS = 2
+
+# Pragmas applied for the duration of a full rebuild and restored afterwards.
+BULK_LOAD_PRAGMAS = {"journal_mode": "MEMORY", "synchronous": "OFF"}
+
+# Canonical schema shared with the server's query templates.
+SCHEMA_FILE = Path(__file__).with_name("schema.sql")
+
+def schema_statements(indexes):
+    """Statements from schema.sql: the CREATE INDEX ones if indexes, else the rest."""
+    statements = []
+    for statement in SCHEMA_FILE.read_text().split(";"):
+        code = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--")).strip()
+        if code and code.upper().startswith("CREATE INDEX") == indexes:
+            statements.append(code + ";")
+    return "\n".join(statements)
+
+def create_database_schema(cursor, drop_existing=True, with_indexes=True):
     """Creates a more detailed database schema to answer all query types."""
-    cursor.executescript("""
-    DROP TABLE IF EXISTS matches;
-    DROP TABLE IF EXISTS innings;
-    DROP TABLE IF EXISTS deliveries;
-
-    CREATE TABLE matches (
-        match_id INTEGER PRIMARY KEY,
-        city TEXT,
-        venue TEXT,
-        match_date TEXT,
-        team1 TEXT,
-        team2 TEXT,
-        toss_winner TEXT,
-        toss_decision TEXT,
-        winner TEXT,
-        result TEXT,
-        result_margin INTEGER,
-        player_of_match TEXT
-    );
-
-    CREATE TABLE innings (
-        inning_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        match_id INTEGER,
-        inning_number INTEGER,
-        team_batting TEXT,
-        total_runs INTEGER,
-        total_wickets INTEGER,
-        FOREIGN KEY (match_id) REFERENCES matches (match_id)
-    );
-
-    CREATE TABLE deliveries (
-        delivery_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        inning_id INTEGER,
-        over INTEGER,
-        ball INTEGER,
-        batsman TEXT,
-        non_striker TEXT,
-        bowler TEXT,
-        runs_scored INTEGER,
-        extra_runs INTEGER,
-        total_runs INTEGER,
-        is_four INTEGER,
-        is_six INTEGER,
-        wicket_kind TEXT,
-        player_out TEXT,
-        FOREIGN KEY (inning_id) REFERENCES innings (inning_id)
-    );
-    
-    CREATE INDEX idx_matches_winner ON matches (winner);
-    CREATE INDEX idx_deliveries_batsman ON deliveries (batsman);
-    CREATE INDEX idx_deliveries_bowler ON deliveries (bowler);
-    """)
+    if drop_existing:
+        cursor.executescript("""
+        DROP TABLE IF EXISTS matches;
+        DROP TABLE IF EXISTS innings;
+        DROP TABLE IF EXISTS deliveries;
+        DROP TABLE IF EXISTS ingested_files;
+        DROP TABLE IF EXISTS players;
+        DROP TABLE IF EXISTS player_careers;
+        DROP TABLE IF EXISTS player_matchups;
+        """)
+    cursor.executescript(schema_statements(indexes=False))
+    if with_indexes:
+        create_indexes(cursor)
     print("Advanced database schema created successfully.")
 
-def load_data():
-    """Parses JSON files and inserts data into the new, detailed schema."""
-    if os.path.exists(DB_FILE):
-        os.remove(DB_FILE)
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    create_database_schema(cursor)
+def create_indexes(cursor):
+    """Creates the secondary indexes from schema.sql."""
+    cursor.executescript(schema_statements(indexes=True))
+
+# Precomputed aggregates the server answers from instead of re-scanning deliveries.
+# The {..._filter} slots are "1" for a full build, "0" to create the empty
+# table, or a bound predicate to refresh a single match or venue.
+SUMMARY_TABLES = {
+    # One row per batter per match
+    "batter_match_stats": """
+        SELECT d.match_id, i.team_batting AS team, d.batsman,
+               SUM(d.runs_scored) AS runs,
+               COUNT(*) AS balls,
+               SUM(d.is_four) AS fours,
+               SUM(d.is_six) AS sixes
+        FROM deliveries d JOIN innings i ON d.match_id = i.match_id AND d.inning = i.inning
+        WHERE {match_filter}
+        GROUP BY d.match_id, d.batsman
+    """,
+    # One row per bowler per match
+    "bowler_match_stats": """
+        SELECT d.match_id, d.bowler,
+               COUNT(*) AS balls,
+               COUNT(DISTINCT d.over) AS overs,
+               SUM(d.total_runs) AS runs_conceded,
+               SUM(CASE WHEN d.wicket_kind IS NOT NULL AND d.wicket_kind != '' THEN 1 ELSE 0 END) AS wickets
+        FROM deliveries d
+        WHERE {match_filter}
+        GROUP BY d.match_id, d.bowler
+    """,
+    # One row per innings
+    "innings_totals": """
+        SELECT i.match_id, i.inning, i.team_batting AS batting_team,
+               COALESCE(SUM(d.total_runs), 0) AS total_runs,
+               COUNT(d.player_out) AS wickets,
+               COUNT(d.delivery_id) AS balls
+        FROM innings i LEFT JOIN deliveries d ON d.match_id = i.match_id AND d.inning = i.inning
+        WHERE {innings_filter}
+        GROUP BY i.match_id, i.inning
+    """,
+    # Runs in overs 1-6 of each innings
+    "powerplay_totals": """
+        SELECT d.match_id, d.inning, i.team_batting AS batting_team,
+               SUM(d.total_runs) AS runs
+        FROM deliveries d JOIN innings i ON d.match_id = i.match_id AND d.inning = i.inning
+        WHERE d.over < 6 AND {match_filter}
+        GROUP BY d.match_id, d.inning
+    """,
+    # Match totals rolled up per venue (built from innings_totals, so keep it last)
+    "venue_totals": """
+        SELECT m.venue,
+               COUNT(*) AS matches_played,
+               SUM(t.match_total) AS total_runs,
+               ROUND(AVG(t.match_total), 2) AS avg_match_total,
+               MAX(t.match_total) AS highest_match_total
+        FROM matches m
+        JOIN (SELECT match_id, SUM(total_runs) AS match_total
+              FROM innings_totals GROUP BY match_id) t ON m.match_id = t.match_id
+        WHERE {venue_filter}
+        GROUP BY m.venue
+    """,
+}
+
+SUMMARY_INDEXES_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_batter_match_stats_match ON batter_match_stats (match_id);
+    CREATE INDEX IF NOT EXISTS idx_batter_match_stats_batsman ON batter_match_stats (batsman);
+    CREATE INDEX IF NOT EXISTS idx_batter_match_stats_runs ON batter_match_stats (runs);
+    CREATE INDEX IF NOT EXISTS idx_bowler_match_stats_match ON bowler_match_stats (match_id);
+    CREATE INDEX IF NOT EXISTS idx_bowler_match_stats_bowler ON bowler_match_stats (bowler);
+    CREATE INDEX IF NOT EXISTS idx_bowler_match_stats_figures ON bowler_match_stats (wickets DESC, runs_conceded);
+    CREATE INDEX IF NOT EXISTS idx_innings_totals_match ON innings_totals (match_id, inning);
+    CREATE INDEX IF NOT EXISTS idx_innings_totals_runs ON innings_totals (total_runs);
+    CREATE INDEX IF NOT EXISTS idx_powerplay_totals_match ON powerplay_totals (match_id);
+    CREATE INDEX IF NOT EXISTS idx_powerplay_totals_team ON powerplay_totals (batting_team);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_venue_totals_venue ON venue_totals (venue);
+"""
+
+def _summary_select(table, match_filter="1", venue_filter="1"):
+    innings_filter = match_filter.replace("d.match_id", "i.match_id")
+    return SUMMARY_TABLES[table].format(match_filter=match_filter, innings_filter=innings_filter,
+                                        venue_filter=venue_filter)
+
+def build_summary_tables(cursor):
+    """Rebuilds the per-match, per-innings and per-venue aggregate tables."""
+    for table in SUMMARY_TABLES:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(f"CREATE TABLE {table} AS {_summary_select(table)}")
+    cursor.executescript(SUMMARY_INDEXES_SQL)
+    print("Summary tables built successfully.")
+
+def ensure_summary_tables(cursor):
+    """Creates empty summary tables (and their indexes) if they are missing."""
+    for table in SUMMARY_TABLES:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} AS {_summary_select(table, '0', '0')}")
+    cursor.executescript(SUMMARY_INDEXES_SQL)
+
+def refresh_match_summaries(cursor, match_id, venues):
+    """Recomputes the summary rows for one match and the venues it touches."""
+    for table in SUMMARY_TABLES:
+        if table == "venue_totals":
+            for venue in venues:
+                cursor.execute("DELETE FROM venue_totals WHERE venue = ?", (venue,))
+                cursor.execute(f"INSERT INTO venue_totals {_summary_select(table, venue_filter='m.venue = ?')}",
+                               (venue,))
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE match_id = ?", (match_id,))
+            cursor.execute(f"INSERT INTO {table} {_summary_select(table, match_filter='d.match_id = ?')}",
+                           (match_id,))
+
+# Wicket kinds that are not credited to the bowler in player_matchups.
+NON_BOWLER_DISMISSALS = ("run out", "retired hurt", "retired out", "obstructing the field")
+
+# Fill the player index tables from schema.sql. The {..._filter} slots are
+# "1" for a full build or predicates that limit a refresh to the :names JSON
+# list (careers) or to one :match_id (matchups, added with :sign = 1 and taken
+# out with -1 via the upsert, since they are plain sums).
+PLAYER_NAMES_SQL = """
+    INSERT OR IGNORE INTO players (name)
+    SELECT name FROM (SELECT batsman AS name FROM deliveries
+                      UNION SELECT bowler FROM deliveries
+                      UNION SELECT non_striker FROM deliveries)
+    WHERE name IS NOT NULL
+    ORDER BY name
+"""
+
+PLAYER_CAREERS_SQL = """
+    INSERT OR REPLACE INTO player_careers
+    SELECT p.player_id,
+           COALESCE(b.matches, 0), COALESCE(b.runs, 0), COALESCE(b.balls, 0),
+           COALESCE(b.fours, 0), COALESCE(b.sixes, 0), COALESCE(b.highest, 0), COALESCE(b.hundreds, 0),
+           COALESCE(w.matches, 0), COALESCE(w.balls, 0), COALESCE(w.overs, 0),
+           COALESCE(w.runs_conceded, 0), COALESCE(w.wickets, 0)
+    FROM players p
+    LEFT JOIN (SELECT batsman, COUNT(*) AS matches, SUM(runs) AS runs, SUM(balls) AS balls,
+                      SUM(fours) AS fours, SUM(sixes) AS sixes, MAX(runs) AS highest,
+                      SUM(runs >= 100) AS hundreds
+               FROM batter_match_stats WHERE {batter_filter} GROUP BY batsman) b ON b.batsman = p.name
+    LEFT JOIN (SELECT bowler, COUNT(*) AS matches, SUM(balls) AS balls, SUM(overs) AS overs,
+                      SUM(runs_conceded) AS runs_conceded, SUM(wickets) AS wickets
+               FROM bowler_match_stats WHERE {bowler_filter} GROUP BY bowler) w ON w.bowler = p.name
+    WHERE {player_filter}
+"""
+
+PLAYER_MATCHUPS_SQL = f"""
+    INSERT INTO player_matchups
+    SELECT batter.player_id, bowler.player_id,
+           :sign * COUNT(*), :sign * SUM(d.runs_scored), :sign * SUM(d.is_four), :sign * SUM(d.is_six),
+           :sign * SUM(CASE WHEN d.player_out = d.batsman
+                             AND d.wicket_kind NOT IN ({", ".join(f"'{kind}'" for kind in NON_BOWLER_DISMISSALS)})
+                            THEN 1 ELSE 0 END)
+    FROM deliveries d
+    JOIN players batter ON batter.name = d.batsman
+    JOIN players bowler ON bowler.name = d.bowler
+    WHERE {{match_filter}}
+    GROUP BY batter.player_id, bowler.player_id
+    ON CONFLICT (batter_id, bowler_id) DO UPDATE SET
+        balls = balls + excluded.balls, runs = runs + excluded.runs,
+        fours = fours + excluded.fours, sixes = sixes + excluded.sixes,
+        dismissals = dismissals + excluded.dismissals
+"""
+
+def build_player_index(cursor):
+    """Rebuilds the player ID dictionary, career rollups and batter x bowler matchups."""
+    cursor.execute("DELETE FROM player_matchups")
+    cursor.execute("DELETE FROM player_careers")
+    cursor.execute("DELETE FROM players")
+    cursor.execute(PLAYER_NAMES_SQL)
+    cursor.execute(PLAYER_CAREERS_SQL.format(player_filter="1", batter_filter="1", bowler_filter="1"))
+    cursor.execute(PLAYER_MATCHUPS_SQL.format(match_filter="1"), {"sign": 1})
+    print("Player index built successfully.")
+
+def record_index_stats(cursor):
+    """Samples row counts and index selectivity into index_stats for the server's cost guard.
+
+    ANALYZE writes them to sqlite_stat1, which the query planner would read
+    too; the templates' plans are tuned without statistics (with them the
+    venue and team lookups switch to a slower date-index scan), so the
+    numbers are copied to index_stats and sqlite_stat1 is dropped again.
+    """
+    cursor.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    cursor.execute("ANALYZE")
+    cursor.execute("DROP TABLE IF EXISTS index_stats")
+    cursor.execute("CREATE TABLE index_stats AS SELECT tbl, idx, stat FROM sqlite_stat1")
+    cursor.execute("DROP TABLE sqlite_stat1")
+
+def ensure_player_index(cursor):
+    """Builds the player index of a database loaded before it existed."""
+    if cursor.execute("SELECT 1 FROM players LIMIT 1").fetchone() is None:
+        build_player_index(cursor)
+
+def _match_player_names(cursor, match_id):
+    names = set()
+    for row in cursor.execute("SELECT DISTINCT batsman, bowler, non_striker FROM deliveries WHERE match_id = ?",
+                              (match_id,)).fetchall():
+        names.update(name for name in row if name is not None)
+    return names
+
+def _match_matchups(cursor, match_id, sign):
+    cursor.execute(PLAYER_MATCHUPS_SQL.format(match_filter="d.match_id = :match_id"),
+                   {"match_id": match_id, "sign": sign})
 
-    data_path = Path(DATA_DIR)
-    json_files = list(data_path.glob("*.json"))
-    
-    if not json_files:
-        print(f"Error: No JSON files found in '{DATA_DIR}'.")
+def unindex_match_players(cursor, match_id):
+    """Takes a match out of player_matchups before it is deleted; returns its players' names."""
+    names = _match_player_names(cursor, match_id)
+    if names:
+        _match_matchups(cursor, match_id, -1)
+        cursor.execute("DELETE FROM player_matchups WHERE balls <= 0")
+    return names
+
+def index_match_players(cursor, match_id, names=()):
+    """Adds a newly inserted match to the player index.
+
+    Its players get IDs if they are new (existing IDs never change) and
+    have their careers recomputed together with names, the players of the
+    version of the match it replaced. Call after refresh_match_summaries.
+    """
+    names = _match_player_names(cursor, match_id) | set(names)
+    params = {"names": json.dumps(sorted(names))}
+    in_names = "IN (SELECT value FROM json_each(:names))"
+    cursor.execute("INSERT OR IGNORE INTO players (name) SELECT value FROM json_each(:names)", params)
+    cursor.execute(PLAYER_CAREERS_SQL.format(player_filter=f"p.name {in_names}", batter_filter=f"batsman {in_names}",
+                                             bowler_filter=f"bowler {in_names}"), params)
+    _match_matchups(cursor, match_id, 1)
+
+def _named_match_id(name):
+    """Match ID from a cricsheet file name (548360.json -> 548360), or None.
+
+    JSONL lines are named "<file>:<line>" and never parsed: their ID is the
+    "match_id" inside the line.
+    """
+    if not name.endswith(".json"):
+        return None
+    stem = PurePath(name).stem
+    return int(stem) if stem.isdigit() else None
+
+def _iter_tar(tar):
+    for member in tar:
+        if member.isfile() and member.name.endswith(".json"):
+            with tar.extractfile(member) as f:
+                yield member.name, f.read()
+
+def _iter_jsonl(stream, label):
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if line:
+            yield f"{label}:{line_number}", line
+
+def iter_match_sources(source):
+    """Yields (name, raw JSON bytes) for each match in source, one at a time.
+
+    source is a directory of cricsheet JSON files, a .zip of them (the way
+    cricsheet ships the IPL), a tar archive (optionally compressed), a
+    .jsonl file with one match per line, or "-" for a tar or JSONL stream
+    on stdin. Archives are decoded member by member and nothing is
+    extracted to disk. Directories and zips are read in sorted name order,
+    tar and JSONL in stream order.
+
+    Matches are identified by their cricsheet file name; a JSONL line has
+    no file name, so it must carry the ID as a top-level "match_id".
+    """
+    if source == "-":
+        stream = sys.stdin.buffer
+        head = stream.peek(MAGIC_BYTES)[:MAGIC_BYTES]
+        if head.lstrip()[:1] == b"{":
+            yield from _iter_jsonl(stream, "stdin")
+        elif head.startswith(b"PK"):
+            raise ValueError("a zip archive cannot be streamed; pass its path instead")
+        else:
+            with tarfile.open(fileobj=stream, mode="r|*") as tar:
+                yield from _iter_tar(tar)
         return
 
-    print(f"Processing {len(json_files)} files with the new schema...")
-    match_id_counter = 0
-
-    for filepath in json_files:
-        match_id_counter += 1
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-
-        info = data.get('info', {})
-        teams = info.get('teams', [None, None])
-        outcome = info.get('outcome', {})
-        by_details = outcome.get('by', {})
-        result_key = list(by_details.keys())[0] if by_details else None
-
-        # Insert match data
-        cursor.execute("INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
-            match_id_counter, info.get('city'), info.get('venue'),
-            info.get('dates', [None])[0], teams[0], teams[1],
-            info.get('toss', {}).get('winner'), info.get('toss', {}).get('decision'),
-            outcome.get('winner'), result_key, by_details.get(result_key),
-            info.get('player_of_match', [None])[0]
-        ))
-
-        # Insert innings and deliveries
-        for i, inning_data in enumerate(data.get('innings', [])):
-            inning_number = i + 1
-            team_batting = inning_data['team']
-            
-            total_runs_inning = sum(over.get('runs', {}).get('total', 0) for over in inning_data.get('overs', []))
-            total_wickets_inning = sum(len(delivery.get('wickets', [])) for over in inning_data.get('overs', []) for delivery in over.get('deliveries', []))
-
-            cursor.execute("INSERT INTO innings (match_id, inning_number, team_batting, total_runs, total_wickets) VALUES (?, ?, ?, ?, ?)",
-                           (match_id_counter, inning_number, team_batting, total_runs_inning, total_wickets_inning))
-            inning_id = cursor.lastrowid
-
-            for over_data in inning_data.get('overs', []):
-                for ball_num, delivery in enumerate(over_data.get('deliveries', [])):
-                    runs = delivery.get('runs', {})
-                    is_four = 1 if runs.get('batter', 0) == 4 else 0
-                    is_six = 1 if runs.get('batter', 0) == 6 else 0
-                    
-                    # THE FIX: The VALUES clause now has the correct number of placeholders (13).
-                    cursor.execute("""
-                    INSERT INTO deliveries (inning_id, over, ball, batsman, non_striker, bowler, runs_scored, extra_runs, total_runs, is_four, is_six, wicket_kind, player_out)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        inning_id, over_data.get('over', 0), ball_num + 1,
-                        delivery.get('batter'), delivery.get('non_striker'), delivery.get('bowler'),
-                        runs.get('batter', 0), runs.get('extras', 0), runs.get('total', 0),
-                        is_four, is_six,
-                        delivery.get('wickets', [{}])[0].get('kind'),
-                        delivery.get('wickets', [{}])[0].get('player_out')
-                    ))
-    
+    path = Path(source)
+    if path.is_dir():
+        for filepath in sorted(path.glob("*.json")):
+            yield filepath.name, filepath.read_bytes()
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(name for name in archive.namelist() if name.endswith(".json")):
+                yield name, archive.read(name)
+    elif path.suffix == ".jsonl":
+        with open(path, "rb") as f:
+            yield from _iter_jsonl(f, path.name)
+    elif path.is_file() and tarfile.is_tarfile(path):
+        with tarfile.open(path, mode="r|*") as tar:
+            yield from _iter_tar(tar)
+    else:
+        raise ValueError(f"'{source}' is not a directory, zip, tar or JSONL file of matches")
+
+def parse_match(name, raw):
+    """Fingerprints and flattens one match document.
+
+    Runs in parser processes when loading with several workers, so it only
+    returns picklable row tuples: (match_id, name, size, sha256, flattened).
+    """
+    data = json.loads(raw)
+    match_id = _named_match_id(name)
+    if match_id is None:
+        match_id = int(data["match_id"])
+    return match_id, name, len(raw), hashlib.sha256(raw).hexdigest(), flatten_match(data)
+
+def _parse_chunk(chunk):
+    return [parse_match(name, raw) for name, raw in chunk]
+
+def iter_parsed_matches(members, workers=1):
+    """Yields parse_match results for (name, raw) members in input order.
+
+    With workers > 1 they are parsed in a process pool, PARSE_CHUNKSIZE
+    members per task, with at most PARSE_WINDOW tasks per worker ahead of
+    the writer, so memory stays bounded however long the input is.
+    """
+    if workers <= 1:
+        for name, raw in members:
+            yield parse_match(name, raw)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        members = iter(members)
+        while True:
+            chunk = list(islice(members, PARSE_CHUNKSIZE))
+            if chunk:
+                pending.append(executor.submit(_parse_chunk, chunk))
+            if pending and (not chunk or len(pending) >= workers * PARSE_WINDOW):
+                yield from pending.popleft().result()
+            elif not chunk:
+                return
+
+def delete_match(cursor, match_id):
+    """Removes a match and its innings and deliveries. Returns the venue it was played at."""
+    row = cursor.execute("SELECT venue FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+    cursor.execute("DELETE FROM deliveries WHERE match_id = ?", (match_id,))
+    cursor.execute("DELETE FROM innings WHERE match_id = ?", (match_id,))
+    cursor.execute("DELETE FROM matches WHERE match_id = ?", (match_id,))
+    return row[0] if row else None
+
+def flatten_match(data):
+    """Flattens one parsed cricsheet match into plain row tuples.
+
+    Returns (match_row, innings) where match_row lacks the leading match_id and
+    innings is a list of (inning, team_batting, total_runs, total_wickets,
+    delivery_rows); delivery rows lack the leading match_id and inning.
+    Each innings is walked once.
+    """
+    info = data.get('info', {})
+    teams = info.get('teams', [None, None])
+    toss = info.get('toss', {})
+    outcome = info.get('outcome', {})
+    by_details = outcome.get('by', {})
+    result_key = next(iter(by_details), None)
+
+    match_row = (
+        info.get('city'), info.get('venue'),
+        info.get('dates', [None])[0], teams[0], teams[1],
+        toss.get('winner'), toss.get('decision'),
+        outcome.get('winner'), result_key, by_details.get(result_key),
+        info.get('player_of_match', [None])[0]
+    )
+
+    innings = []
+    for inning_number, inning_data in enumerate(data.get('innings', []), 1):
+        rows = []
+        total_runs = 0
+        total_wickets = 0
+        for over_data in inning_data.get('overs', []):
+            over = over_data.get('over', 0)
+            for ball_num, delivery in enumerate(over_data.get('deliveries', []), 1):
+                runs = delivery.get('runs', {})
+                batter_runs = runs.get('batter', 0)
+                delivery_total = runs.get('total', 0)
+                total_runs += delivery_total
+
+                wickets = delivery.get('wickets')
+                if wickets:
+                    total_wickets += len(wickets)
+                    wicket_kind = wickets[0].get('kind')
+                    player_out = wickets[0].get('player_out')
+                else:
+                    wicket_kind = player_out = None
+
+                rows.append((
+                    over, ball_num,
+                    delivery.get('batter'), delivery.get('non_striker'), delivery.get('bowler'),
+                    batter_runs, runs.get('extras', 0), delivery_total,
+                    1 if batter_runs == 4 else 0, 1 if batter_runs == 6 else 0,
+                    wicket_kind, player_out
+                ))
+        innings.append((inning_number, inning_data['team'], total_runs, total_wickets, rows))
+    return match_row, innings
+
+class DeliveryWriter:
+    """Buffers delivery rows and writes them with executemany in batches."""
+
+    INSERT_SQL = """
+        INSERT INTO deliveries (match_id, inning, over, ball, batsman, non_striker, bowler, runs_scored, extra_runs, total_runs, is_four, is_six, wicket_kind, player_out)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def __init__(self, cursor, batch_size=BATCH_SIZE):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.pending = []
+        self.rows_written = 0
+
+    def add(self, match_id, inning, rows):
+        key = (match_id, inning)
+        self.pending.extend(key + row for row in rows)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.cursor.executemany(self.INSERT_SQL, self.pending)
+            self.rows_written += len(self.pending)
+            self.pending = []
+
+def insert_match(cursor, match_id, flattened, writer):
+    """Inserts one flattened match. Returns the venue it was played at."""
+    match_row, innings = flattened
+    cursor.execute("INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (match_id,) + match_row)
+    for inning, team_batting, total_runs, total_wickets, rows in innings:
+        cursor.execute("INSERT INTO innings (match_id, inning, team_batting, total_runs, total_wickets) VALUES (?, ?, ?, ?, ?)",
+                       (match_id, inning, team_batting, total_runs, total_wickets))
+        writer.add(match_id, inning, rows)
+    return match_row[1]
+
+def read_generation(db_file):
+    """Returns the data generation (PRAGMA user_version) of an existing database, or 0."""
+    if not os.path.exists(db_file):
+        return 0
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+def bump_generation(cursor, generation):
+    """Stores a new data generation; the server drops cached results when it changes."""
+    cursor.execute(f"PRAGMA user_version = {int(generation)}")
+
+def record_ingested_file(cursor, match_id, name, size, sha256):
+    cursor.execute("INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?, ?)", (
+        match_id, PurePath(name).name, size, sha256,
+        datetime.now(timezone.utc).isoformat(timespec='seconds')
+    ))
+
+def snapshot_path(db_file, generation):
+    """The versioned file a full load of the given generation is built in."""
+    path = Path(db_file)
+    return path.with_name(f"{path.stem}.g{generation}{path.suffix}")
+
+def publish_snapshot(db_file, snapshot):
+    """Atomically make db_file open snapshot.
+
+    db_file becomes a relative symlink to the snapshot, swapped in with
+    os.replace, so a reader opens either the old snapshot or the new one and
+    connections that are already open keep reading the old one. Where
+    symlinks are unavailable the snapshot itself is renamed over db_file.
+    """
+    link = f"{db_file}.tmp{os.getpid()}"
+    try:
+        os.symlink(Path(snapshot).name, link)
+    except (OSError, NotImplementedError):
+        os.replace(snapshot, db_file)
+        return
+    os.replace(link, db_file)
+
+def remove_old_snapshots(db_file, generation, keep=KEEP_SNAPSHOTS):
+    """Deletes snapshots older than the newest keep; open readers are unaffected on POSIX."""
+    path = Path(db_file)
+    prefix, suffix = f"{path.stem}.g", path.suffix
+    for snapshot in path.parent.glob(f"{prefix}*{suffix}"):
+        number = snapshot.name[len(prefix):len(snapshot.name) - len(suffix)]
+        if not number.isdigit() or int(number) > generation - keep:
+            continue
+        for leftover in (snapshot, *(Path(f"{snapshot}{ext}") for ext in ("-journal", "-wal", "-shm"))):
+            try:
+                leftover.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                break  # still open (Windows); try again after the next load
+
+def load_data(db_file=DB_FILE, data_dir=DATA_DIR, incremental=False, workers=1):
+    """Parses cricsheet matches and inserts data into the new, detailed schema.
+
+    data_dir is anything iter_match_sources reads: a directory, a zip, tar
+    or JSONL file, or "-" for stdin. Matches are decoded and written one at
+    a time as they are read, so memory does not grow with the input.
+
+    A full load builds a new snapshot file from scratch and then publishes
+    it (see publish_snapshot), so a running server never sees a half-built
+    database; it switches to the new snapshot between requests. An
+    incremental load keeps the existing database, switches it to WAL so the
+    server can keep reading, and ingests only files whose size or hash
+    differ from the ingested_files manifest, one transaction per file.
+
+    With workers > 1 the JSON files are parsed in that many processes while
+    this process stays the only writer. Files are always written in input
+    order, so the resulting database does not depend on the worker count.
+    """
+    try:
+        members = iter_match_sources(data_dir)
+        first = next(members, None)
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"Error: {e}")
+        return
+    if first is None:
+        print(f"Error: No JSON files found in '{data_dir}'.")
+        return
+    members = chain([first], members)
+
+    if incremental:
+        _load_incremental(db_file, members, workers)
+        return
+
+    generation = read_generation(db_file) + 1
+    snapshot = snapshot_path(db_file, generation)
+    if snapshot.exists():
+        snapshot.unlink()  # left over from an interrupted load
+
+    conn = sqlite3.connect(snapshot)
+    cursor = conn.cursor()
+    saved_pragmas = _apply_pragmas(cursor, BULK_LOAD_PRAGMAS)
+    create_database_schema(cursor, with_indexes=False)
+
+    print(f"Processing matches from '{data_dir}' with the new schema...")
+    writer = DeliveryWriter(cursor)
+
+    matches = 0
+    for match_id, name, size, sha256, flattened in iter_parsed_matches(members, workers):
+        insert_match(cursor, match_id, flattened, writer)
+        record_ingested_file(cursor, match_id, name, size, sha256)
+        matches += 1
+
+    writer.flush()
+    conn.commit()
+    create_indexes(cursor)
+    build_summary_tables(cursor)
+    build_player_index(cursor)
+    record_index_stats(cursor)
+    bump_generation(cursor, generation)
+    conn.commit()
+    _apply_pragmas(cursor, saved_pragmas)
+    conn.close()
+    publish_snapshot(db_file, snapshot)
+    remove_old_snapshots(db_file, generation)
+    print(f"Advanced data loading complete: {matches} matches, {writer.rows_written} deliveries "
+          f"(snapshot {snapshot.name}).")
+
+def _apply_pragmas(cursor, pragmas):
+    """Sets each pragma and returns the previous values so they can be restored."""
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+        cursor.execute(f"PRAGMA {name} = {value}")
+    return previous
+
+def _load_incremental(db_file, members, workers):
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = WAL")
+    cursor = conn.cursor()
+    create_database_schema(cursor, drop_existing=False)
+    ensure_summary_tables(cursor)
+    ensure_player_index(cursor)
     conn.commit()
+
+    manifest = {match_id: (size, sha256) for match_id, size, sha256 in
+                cursor.execute("SELECT match_id, file_size, sha256 FROM ingested_files")}
+
+    # Members without a match ID in their name (JSONL lines) are matched on
+    # content alone; the content includes their match_id.
+    fingerprints = set(manifest.values())
+    seen = 0
+
+    def changed(members):
+        nonlocal seen
+        for name, raw in members:
+            seen += 1
+            match_id = _named_match_id(name)
+            fingerprint = (len(raw), hashlib.sha256(raw).hexdigest())
+            if match_id is None:
+                unchanged = fingerprint in fingerprints
+            else:
+                unchanged = manifest.get(match_id) == fingerprint
+            if not unchanged:
+                yield name, raw
+
+    generation = cursor.execute("PRAGMA user_version").fetchone()[0]
+    loaded = 0
+    for match_id, name, size, sha256, flattened in iter_parsed_matches(changed(members), workers):
+        # One transaction per file: readers see either the old match or the new one.
+        with conn:
+            players = unindex_match_players(cursor, match_id)
+            old_venue = delete_match(cursor, match_id)
+            writer = DeliveryWriter(cursor)
+            new_venue = insert_match(cursor, match_id, flattened, writer)
+            writer.flush()
+            venues = {venue for venue in (old_venue, new_venue) if venue is not None}
+            refresh_match_summaries(cursor, match_id, venues)
+            index_match_players(cursor, match_id, players)
+            record_ingested_file(cursor, match_id, name, size, sha256)
+            generation += 1
+            bump_generation(cursor, generation)
+        loaded += 1
+
     conn.close()
-    print("Advanced data loading complete.")
+    print(f"Incremental load complete: {loaded} new or changed of {seen} files.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load cricsheet IPL JSON files into SQLite.")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database file")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="directory, .zip, tar or .jsonl of cricsheet JSON matches, "
+                             "or - to read a tar or JSONL stream from stdin")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only load new or changed files into the existing database")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes parsing JSON files (default: 1)")
+    args = parser.parse_args()
+    load_data(args.db, args.data_dir, incremental=args.incremental, workers=args.workers)
 
 if __name__ == "__main__":
-    load_data()
+    main()
@@ -0,0 +1,275 @@
+"""Entity extraction for parameterized question templates.
+
+Player, team, venue and city names are loaded once from the database into an
+Aho-Corasick automaton, so a question is scanned in time linear in its
+length no matter how many names the roster holds. Seasons and over ranges are
+picked up with regular expressions. Recognised spans are replaced by slot
+tokens (_player_, _team_, _venue_, _season_, _overs_) so the router can match
+"show me _player_ batting stats" whoever the player is.
+"""
+
+import re
+from collections import deque
+
+# Slot token used in template keys for each entity type.
+SLOT_TOKENS = {
+    "player": "_player_",
+    "team": "_team_",
+    "venue": "_venue_",
+    "city": "_venue_",
+    "season": "_season_",
+    "overs": "_overs_",
+}
+
+# When one alias names several kinds of entity, the first kind listed wins.
+ENTITY_PRIORITY = ("team", "player", "venue", "city")
+
+# Common abbreviations that are not simply a team's initials.
+TEAM_ALIASES = {
+    "kxip": "Kings XI Punjab",
+    "pbks": "Punjab Kings",
+    "srh": "Sunrisers Hyderabad",
+    "gt": "Gujarat Titans",
+    "lsg": "Lucknow Super Giants",
+}
+
+# Named phases of an innings, as 1-based over ranges.
+OVER_PHASES = {
+    "powerplay overs": (1, 6),
+    "middle overs": (7, 15),
+    "death overs": (16, 20),
+}
+
+# Generic trailing words dropped to give a venue's short name.
+VENUE_SUFFIXES = ("international cricket stadium", "cricket stadium", "stadium",
+                  "cricket ground", "ground")
+
+_SEASON_RE = re.compile(r"\b((?:19|20)\d{2})\b")
+# "overs 1-6" is normalized to "overs 1 6", so the word between the numbers is optional.
+_OVER_RANGE_RE = re.compile(
+    r"\b(?:between )?overs? (\d{1,2})(?: to| and| through)? (\d{1,2})\b"
+    r"|\b(first|last) (\d{1,2}) overs\b"
+    r"|\b(" + "|".join(OVER_PHASES) + r")\b")
+_NAME_CLEAN_RE = re.compile(r"[^\w\s']")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    """Lower-case a name the same way questions are normalized."""
+    return _SPACES_RE.sub(" ", _NAME_CLEAN_RE.sub(" ", name.lower())).strip()
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher over characters.
+
+    Patterns are added with add(), then build() computes failure links once.
+    iter_matches() walks the text a single time and reports every pattern
+    occurrence as (start, end, values).
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._values = [None]      # values of the pattern ending exactly here
+        self._lengths = [0]
+        self._output = [0]         # nearest proper suffix node that ends a pattern
+        self._built = False
+
+    def add(self, pattern, value):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._values.append(None)
+                self._lengths.append(0)
+                self._output.append(0)
+            node = next_node
+        if self._values[node] is None:
+            self._values[node] = []
+            self._lengths[node] = len(pattern)
+        if value not in self._values[node]:
+            self._values[node].append(value)
+        self._built = False
+
+    def build(self):
+        pending = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            pending.append(node)
+        while pending:
+            node = pending.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                failed = self._goto[fallback].get(char, 0)
+                self._fail[child] = failed
+                self._output[child] = failed if self._values[failed] is not None else self._output[failed]
+                pending.append(child)
+        self._built = True
+
+    def iter_matches(self, text):
+        if not self._built:
+            self.build()
+        goto, fail, values, lengths, output = self._goto, self._fail, self._values, self._lengths, self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if values[node] is not None else output[node]
+            while match:
+                end = index + 1
+                yield end - lengths[match], end, values[match]
+                match = output[match]
+
+    def __len__(self):
+        return len(self._goto)
+
+
+class EntityExtractor:
+    """Finds names, seasons and over ranges in a normalized question."""
+
+    def __init__(self, stopwords=()):
+        self.automaton = AhoCorasick()
+        self.stopwords = set(stopwords)
+        self.names = 0
+
+    @classmethod
+    def from_connection(cls, conn, stopwords=()):
+        """Build the name dictionary from the distinct names in the database."""
+        extractor = cls(stopwords)
+        for (name,) in conn.execute(
+                "SELECT batsman FROM batter_match_stats UNION SELECT bowler FROM bowler_match_stats"):
+            extractor.add_player(name)
+        teams = [name for (name,) in conn.execute("SELECT team1 FROM matches UNION SELECT team2 FROM matches")]
+        for name in teams:
+            extractor.add_team(name)
+        for alias, name in TEAM_ALIASES.items():
+            if name in teams:
+                extractor.add_alias(alias, "team", name)
+        for (name,) in conn.execute("SELECT DISTINCT venue FROM matches"):
+            extractor.add_venue(name)
+        for (name,) in conn.execute("SELECT DISTINCT city FROM matches"):
+            extractor.add_alias(normalize_name(name or ""), "city", name)
+        extractor.automaton.build()
+        return extractor
+
+    def add_alias(self, alias, kind, name):
+        if alias and name:
+            self.automaton.add(alias, (kind, name))
+            self.names += 1
+
+    def add_player(self, name):
+        """Full name plus surname-style suffixes: "AB de Villiers" -> "de villiers", "villiers"."""
+        if not name:
+            return
+        alias = normalize_name(name)
+        self.add_alias(alias, "player", name)
+        words = alias.split()
+        for start in range(1, len(words)):
+            suffix = " ".join(words[start:])
+            if len(suffix) >= 4 and suffix not in self.stopwords:
+                self.add_alias(suffix, "player", name)
+
+    def add_team(self, name):
+        """Full name plus initials: "Chennai Super Kings" -> "csk"."""
+        if not name:
+            return
+        alias = normalize_name(name)
+        self.add_alias(alias, "team", name)
+        initials = "".join(word[0] for word in alias.split())
+        if len(initials) >= 2 and initials not in self.stopwords:
+            self.add_alias(initials, "team", name)
+
+    def add_venue(self, name):
+        """Full venue name, the part before the first comma and that part
+        without a generic suffix: "Wankhede Stadium, Mumbai" -> "wankhede"."""
+        if not name:
+            return
+        self.add_alias(normalize_name(name), "venue", name)
+        base = normalize_name(name.split(",")[0])
+        self.add_alias(base, "venue", name)
+        for suffix in VENUE_SUFFIXES:
+            if base.endswith(" " + suffix):
+                short = base[:-len(suffix) - 1]
+                if len(short) >= 4 and short not in self.stopwords:
+                    self.add_alias(short, "venue", name)
+                break
+
+    def _name_spans(self, text):
+        """Leftmost-longest, non-overlapping name matches on word boundaries."""
+        candidates = []
+        for start, end, values in self.automaton.iter_matches(text):
+            if start > 0 and text[start - 1] != " ":
+                continue
+            if end < len(text) and text[end] not in " '":
+                continue
+            candidates.append((start, -end, values))
+        candidates.sort()
+        spans = []
+        last_end = 0
+        for start, negative_end, values in candidates:
+            if start >= last_end:
+                spans.append((start, -negative_end, values))
+                last_end = -negative_end
+        return spans
+
+    def extract(self, text):
+        """Return (masked_text, entities) for an already-normalized question.
+
+        entities maps "player", "team", "venue" and "city" to lists of
+        canonical names, "season" to a year string and "overs" to a 1-based
+        (first, last) over range.
+        """
+        entities = {}
+        spans = []
+        for start, end, values in self._name_spans(text):
+            kinds = {kind for kind, _ in values}
+            kind = next(kind for kind in ENTITY_PRIORITY if kind in kinds)
+            names = entities.setdefault(kind, [])
+            for value_kind, name in values:
+                if value_kind == kind and name not in names:
+                    names.append(name)
+            # Swallow a possessive so "kohli's stats" masks to "_player_ stats".
+            if text.startswith("'s", end):
+                end += 2
+            spans.append((start, end, SLOT_TOKENS[kind]))
+
+        for match in _OVER_RANGE_RE.finditer(text):
+            if any(start < match.end() and match.start() < end for start, end, _ in spans):
+                continue
+            if match.group(1):
+                first, last = int(match.group(1)), int(match.group(2))
+            elif match.group(3):
+                count = int(match.group(4))
+                first, last = (1, count) if match.group(3) == "first" else (21 - count, 20)
+            else:
+                first, last = OVER_PHASES[match.group(5)]
+            # Overs are numbered from 1: "overs 0 to 6" and "last 25 overs" start at the first.
+            first, last = max(first, 1), max(last, 1)
+            entities["overs"] = (min(first, last), max(first, last))
+            spans.append((match.start(), match.end(), SLOT_TOKENS["overs"]))
+            break
+
+        for match in _SEASON_RE.finditer(text):
+            if any(start < match.end() and match.start() < end for start, end, _ in spans):
+                continue
+            entities["season"] = match.group(1)
+            spans.append((match.start(), match.end(), SLOT_TOKENS["season"]))
+            break
+
+        if not spans:
+            return text, entities
+        pieces = []
+        position = 0
+        for start, end, token in sorted(spans):
+            pieces.append(text[position:start])
+            pieces.append(token)
+            position = end
+        pieces.append(text[position:])
+        return "".join(pieces), entities
@@ -5,354 +5,1893 @@ import json
 import sqlite3
 import os
 import re
+import time
+import base64
+import hashlib
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # optional dependency; the stdlib json module is used instead
+    orjson = None
+
+import player_index
+from entity_extractor import AhoCorasick, EntityExtractor, SLOT_TOKENS
+from metrics import Metrics, RequestTrace
+from query_guard import (AdmissionControl, CostModel, QueryRejected,
+                         QUERY_ABORTED, QUERY_TOO_EXPENSIVE, RESULT_TOO_LARGE)
 
 # Configuration - UPDATE THIS PATH TO YOUR ACTUAL DATABASE LOCATION
-DB_FILE = "/Users/mayank/ipl-mcp-server/ipl_data.db"
+# (or set IPL_DB_FILE, as the test and benchmark harnesses do)
+DB_FILE = os.environ.get("IPL_DB_FILE", "/Users/mayank/ipl-mcp-server/ipl_data.db")
+
+# Connection pool tuning
+DB_POOL_SIZE = 4
+DB_MMAP_SIZE = 256 * 1024 * 1024   # bytes mapped from the database file
+DB_CACHE_SIZE = -64 * 1024         # negative = KiB of page cache per connection
+DB_STATEMENT_CACHE = 256           # prepared statements kept per connection
+# Copy the snapshot into each pooled connection's own :memory: database
+# (sqlite3 backup API): the fastest reads, at pool size x database size of RAM.
+DB_IN_MEMORY = False
+
+# Request handling
+QUERY_TIMEOUT = 10.0        # seconds before a running query is interrupted
+PROGRESS_INTERVAL = 1000    # SQLite VM steps between cancellation checks
+
+# Query guard (query_guard.py). Costs are rows visited as estimated from the
+# query plan; steps are SQLite VM instructions. Every limit is per query.
+QUERY_STEP_BUDGET = 50 * 1000 * 1000   # VM steps before a running query is stopped; None = no limit
+MAX_QUERY_COST = 20 * 1000 * 1000      # plans estimated above this are refused without running
+HEAVY_QUERY_COST = 100 * 1000          # plans estimated at or above this need an admission slot
+MAX_HEAVY_QUERIES = 2                  # heavy queries running at once; the rest are turned away
+MAX_RESULT_BYTES = 1024 * 1024         # largest formatted page returned
+
+# Pagination
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+
+# MCP protocol versions spoken, newest first. initialize agrees on the
+# client's version when it is listed, else the newest. structuredContent
+# arrived in 2025-06-18: clients on an older version get the JSON of the
+# rows and columns formats in the text block only.
+PROTOCOL_VERSIONS = ("2025-06-18", "2025-03-26", "2024-11-05")
+STRUCTURED_OUTPUT_VERSION = "2025-06-18"
+
+# stdio framing
+READ_CHUNK = 64 * 1024      # bytes read from stdin per call; every complete line in it is dispatched together
+
+# Most questions accepted by one query_ipl_data_batch call
+MAX_BATCH_QUESTIONS = 20
+
+# Result cache bounds
+RESULT_CACHE_ENTRIES = 256
+RESULT_CACHE_BYTES = 8 * 1024 * 1024
+
+# JSONL trace of every query: a file path, "-" for stderr, or None for off.
+# Per-template latency histograms are always kept (see server_stats).
+TRACE_FILE = None
+
+# Questions no key phrase matches are routed by TF-IDF similarity to the
+# templates and their paraphrases (semantic_router.py, needs NumPy); without
+# NumPy, or with this off, by word overlap above FUZZY_THRESHOLD.
+SEMANTIC_ROUTER = True
+SEMANTIC_THRESHOLD = 0.2    # minimum cosine similarity
+
+# Columnar engine (analytics_engine.py, needs NumPy) for the aggregate questions
+COLUMNAR_ENGINE = False
+COLUMNS_DIR = None          # where the .npy columns live; None = DB_FILE + ".columns"
+
+# Answer player and head-to-head questions from the player index tables,
+# held in memory per data generation (player_index.py) instead of SQLite.
+PLAYER_INDEX = True
+
+# After notifications/initialized, build the router, entity dictionaries and
+# connections in the background and cache the first page of every template
+# that takes no parameters, so the first question does not pay for them.
+WARM_UP = True
+WARM_UP_BACKOFF = 0.005     # seconds the warm-up sleeps while a client tool call is running
+
+
+def file_identity(db_file, contents=False):
+    """(device, inode) of the file db_file resolves to, or None if it does not exist.
+
+    data_loader publishes each full load as a new snapshot file, so a change
+    here means a new snapshot to switch to. An incremental load writes the
+    same file in place (through its WAL), so with contents the identity also
+    covers the size and modification time of the file and of its WAL.
+    """
+    try:
+        stat = os.stat(db_file)
+    except OSError:
+        return None
+    identity = (stat.st_dev, stat.st_ino)
+    if contents:
+        try:
+            wal = os.stat(os.path.realpath(db_file) + "-wal")
+            # Readers open an empty WAL; only one with frames in it holds data.
+            wal = (wal.st_size, wal.st_mtime_ns) if wal.st_size else None
+        except OSError:
+            wal = None
+        identity += (stat.st_size, stat.st_mtime_ns, wal)
+    return identity
+
+
+class ConnectionPool:
+    """Small pool of read-only SQLite connections kept open for the server's lifetime.
+
+    Each connection keeps its own prepared statement cache, so the canned
+    query_map SQL is only compiled once per connection. A pool serves one
+    snapshot (identity); once retired, idle connections are closed and busy
+    ones are closed as they are released. An in_memory pool copies the file
+    into each connection as it opens, so its identity covers the file's
+    contents too: the copies would not see an incremental load.
+    """
+
+    def __init__(self, db_file, size=DB_POOL_SIZE, in_memory=False):
+        self.db_file = db_file
+        self.size = size
+        self.in_memory = in_memory
+        self.identity = file_identity(db_file, contents=in_memory)
+        self.retired = False
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._waiting = 0
+        self.generation = 0   # newest PRAGMA user_version a query on the pool has read
+
+    def _connect(self):
+        uri = Path(self.db_file).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               cached_statements=DB_STATEMENT_CACHE)
+        if self.in_memory:
+            memory = sqlite3.connect(":memory:", check_same_thread=False,
+                                     cached_statements=DB_STATEMENT_CACHE)
+            conn.backup(memory)
+            conn.close()
+            conn = memory
+        else:
+            conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+            conn.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, opening a new one while under the pool size."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                connect = True
+            else:
+                self._waiting += 1
+                connect = False
+        if not connect:
+            try:
+                return self._idle.get()
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, conn):
+        with self._lock:
+            if not self.retired or self._waiting:
+                self._idle.put(conn)
+                return
+            self._created -= 1
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def saw_generation(self, generation):
+        """Record the data generation a query just read (incremental loads bump it in place)."""
+        if generation > self.generation:
+            self.generation = generation
+
+    def retire(self):
+        """Stop reusing connections: close the idle ones, and the rest on release."""
+        with self._lock:
+            self.retired = True
+            idle = self._drain()
+        for conn in idle:
+            conn.close()
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle = self._drain()
+        for conn in idle:
+            conn.close()
+
+    def _drain(self):
+        """Take every idle connection out of the pool; called with the lock held."""
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        self._created -= len(idle)
+        return idle
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the connection pool for the current snapshot of DB_FILE.
+
+    Called once per request: when DB_FILE now resolves to a different file
+    (data_loader published a new snapshot) a new pool is started and the old
+    one retired, so requests already running finish on the old snapshot and
+    later ones only see the new one. With DB_IN_MEMORY an incremental load
+    into the same file starts a new pool as well, so every copy a pool
+    serves is of the same data generation.
+    """
+    global _pool
+    identity = file_identity(DB_FILE, contents=DB_IN_MEMORY)
+    pool = _pool
+    if pool is None or (identity is not None and identity != pool.identity):
+        with _pool_lock:
+            identity = file_identity(DB_FILE, contents=DB_IN_MEMORY)
+            if _pool is None or (identity is not None and identity != _pool.identity):
+                if _pool is not None:
+                    _pool.retire()
+                _pool = ConnectionPool(DB_FILE, in_memory=DB_IN_MEMORY)
+            pool = _pool
+    return pool
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s\']')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+FALLBACK_SQL = "SELECT 'Sorry, I could not understand your question. Try asking about matches, teams, players, or statistics.' as response"
 
 def normalize_question(question):
     """Normalize question by removing punctuation and extra spaces."""
     # Remove punctuation except apostrophes
-    normalized = re.sub(r'[^\w\s\']', ' ', question.lower())
+    normalized = _PUNCTUATION_RE.sub(' ', question.lower())
     # Replace multiple spaces with single space and strip
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    normalized = _WHITESPACE_RE.sub(' ', normalized).strip()
     return normalized
 
-def get_sql_query(question):
-    """Map natural language questions to SQL queries with robust matching."""
-    # Normalize the input question
-    question_normalized = normalize_question(question)
-    
-    # Define comprehensive query mappings
-    query_map = {
-        # Basic Match Information
-        "show me all matches in the dataset": """
-            SELECT match_id, team1, team2, winner, venue, match_date 
-            FROM matches ORDER BY match_date DESC LIMIT 20
-        """,
-        "which team won the most matches": """
-            SELECT winner, COUNT(*) as wins FROM matches 
-            WHERE winner IS NOT NULL GROUP BY winner 
-            ORDER BY wins DESC LIMIT 10
-        """,
-        "what was the highest total score": """
-            SELECT m.match_id, m.team1, m.team2, m.venue, m.match_date,
-                   CASE WHEN d.inning = 1 THEN m.team1 ELSE m.team2 END as batting_team,
-                   SUM(d.total_runs) as total_score, d.inning
-            FROM matches m 
-            JOIN deliveries d ON m.match_id = d.match_id 
-            GROUP BY d.match_id, d.inning, m.team1, m.team2, m.venue, m.match_date
-            ORDER BY total_score DESC LIMIT 10
-        """,
-        "show matches played in mumbai": """
-            SELECT match_id, team1, team2, winner, venue, match_date 
-            FROM matches 
-            WHERE LOWER(city) LIKE '%mumbai%' OR LOWER(venue) LIKE '%mumbai%'
-            ORDER BY match_date DESC
-        """,
-        
-        # Player Performance
-        "who scored the most runs across all matches": """
-            SELECT batsman as player, 
-                   SUM(runs_scored) as total_runs,
-                   COUNT(*) as balls_faced,
-                   COUNT(DISTINCT match_id) as matches_played,
-                   ROUND(CAST(SUM(runs_scored) AS FLOAT) / COUNT(*) * 100, 2) as strike_rate
-            FROM deliveries 
-            GROUP BY batsman 
-            ORDER BY total_runs DESC LIMIT 15
-        """,
-        "which bowler took the most wickets": """
-            SELECT bowler, 
-                   COUNT(*) as wickets,
-                   COUNT(DISTINCT match_id) as matches_bowled,
-                   COUNT(DISTINCT over || '-' || match_id) as overs_bowled
-            FROM deliveries 
-            WHERE wicket_kind IS NOT NULL AND wicket_kind != '' 
-            GROUP BY bowler 
-            ORDER BY wickets DESC LIMIT 15
-        """,
-        "show me virat kohli's batting stats": """
-            SELECT batsman as player,
-                   SUM(runs_scored) as total_runs,
-                   COUNT(*) as balls_faced,
-                   COUNT(DISTINCT match_id) as matches_played,
-                   ROUND(CAST(SUM(runs_scored) AS FLOAT) / COUNT(*) * 100, 2) as strike_rate
-            FROM deliveries 
-            WHERE LOWER(batsman) LIKE '%kohli%' 
-            GROUP BY batsman
-        """,
-        "who has the best bowling figures in a single match": """
-            SELECT bowler, match_id,
-                   COUNT(*) as wickets_in_match,
-                   COUNT(DISTINCT over) as overs_bowled,
-                   SUM(runs_scored + extra_runs) as runs_conceded
-            FROM deliveries 
-            WHERE wicket_kind IS NOT NULL AND wicket_kind != ''
-            GROUP BY bowler, match_id 
-            ORDER BY wickets_in_match DESC, runs_conceded ASC
-            LIMIT 15
-        """,
-        
-        # Advanced Analytics
-        "what's the average first innings score": """
-            SELECT ROUND(AVG(innings_total), 2) as average_first_innings_score,
-                   COUNT(*) as total_first_innings,
-                   MIN(innings_total) as lowest_score,
-                   MAX(innings_total) as highest_score
-            FROM (
-                SELECT match_id, SUM(total_runs) as innings_total 
-                FROM deliveries 
-                WHERE inning = 1 
-                GROUP BY match_id
-            ) first_innings_scores
-        """,
-        "which venue has the highest scoring matches": """
-            SELECT m.venue,
-                   COUNT(DISTINCT m.match_id) as matches_played,
-                   ROUND(AVG(venue_scores.total_score), 2) as avg_match_total,
-                   MAX(venue_scores.total_score) as highest_match_total
-            FROM matches m 
-            JOIN (
-                SELECT match_id, SUM(total_runs) as total_score
-                FROM deliveries GROUP BY match_id
-            ) venue_scores ON m.match_id = venue_scores.match_id
-            GROUP BY m.venue 
-            HAVING matches_played >= 3
-            ORDER BY avg_match_total DESC LIMIT 10
-        """,
-        "show me all centuries scored": """
-            SELECT d.batsman as player,
-                   m.team1, m.team2, m.venue, m.match_date,
-                   SUM(d.runs_scored) as runs_scored,
-                   COUNT(d.runs_scored) as balls_faced,
-                   ROUND(CAST(SUM(d.runs_scored) AS FLOAT) / COUNT(d.runs_scored) * 100, 2) as strike_rate
-            FROM deliveries d
-            JOIN matches m ON d.match_id = m.match_id
-            GROUP BY d.batsman, d.match_id, m.team1, m.team2, m.venue, m.match_date
-            HAVING SUM(d.runs_scored) >= 100
-            ORDER BY runs_scored DESC
-        """,
-        
-        # Additional useful queries
-        "show me the most successful chase targets": """
-            SELECT m.match_id, m.team1, m.team2, m.winner, m.venue,
-                   first_innings.score as target,
-                   second_innings.score as chased_score,
-                   (first_innings.score - second_innings.score) as margin
-            FROM matches m
-            JOIN (SELECT match_id, SUM(total_runs) as score FROM deliveries WHERE inning = 1 GROUP BY match_id) first_innings 
-                ON m.match_id = first_innings.match_id
-            JOIN (SELECT match_id, SUM(total_runs) as score FROM deliveries WHERE inning = 2 GROUP BY match_id) second_innings 
-                ON m.match_id = second_innings.match_id
-            WHERE second_innings.score >= first_innings.score
-            ORDER BY target DESC LIMIT 15
-        """,
-        "which team has the best powerplay performance": """
-            SELECT 
-                CASE WHEN d.inning = 1 THEN m.team1 ELSE m.team2 END as team,
-                COUNT(DISTINCT d.match_id) as matches,
-                ROUND(AVG(powerplay_runs), 2) as avg_powerplay_runs,
-                MAX(powerplay_runs) as best_powerplay
-            FROM deliveries d
-            JOIN matches m ON d.match_id = m.match_id
-            JOIN (
-                SELECT match_id, inning, SUM(total_runs) as powerplay_runs
-                FROM deliveries 
-                WHERE over < 6 
-                GROUP BY match_id, inning
-            ) pp ON d.match_id = pp.match_id AND d.inning = pp.inning
-            GROUP BY team
-            ORDER BY avg_powerplay_runs DESC LIMIT 10
-        """
-    }
-    
-    # Create normalized versions of all query keys
-    normalized_query_map = {normalize_question(key): value for key, value in query_map.items()}
-    
-    # Try exact normalized match first
-    if question_normalized in normalized_query_map:
-        return normalized_query_map[question_normalized]
-    
-    # Enhanced fuzzy matching with key phrases
-    key_phrases = {
-        "most matches": "which team won the most matches",
-        "highest score": "what was the highest total score", 
-        "most runs": "who scored the most runs across all matches",
-        "most wickets": "which bowler took the most wickets",
-        "kohli stats": "show me virat kohli's batting stats",
-        "bowling figures": "who has the best bowling figures in a single match",
-        "average score": "what's the average first innings score",
-        "highest scoring venue": "which venue has the highest scoring matches",
-        "centuries": "show me all centuries scored",
-        "mumbai matches": "show matches played in mumbai",
-        "chase": "show me the most successful chase targets",
-        "powerplay": "which team has the best powerplay performance"
-    }
-    
-    # Check for key phrase matches
-    for phrase, mapped_question in key_phrases.items():
-        if phrase in question_normalized:
-            return normalized_query_map[normalize_question(mapped_question)]
+# Define comprehensive query mappings
+QUERY_MAP = {
+    # Basic Match Information
+    "show me all matches in the dataset": """
+        SELECT match_id, team1, team2, winner, venue, match_date 
+        FROM matches ORDER BY match_date DESC LIMIT 20
+    """,
+    "which team won the most matches": """
+        SELECT winner, COUNT(*) as wins FROM matches 
+        WHERE winner IS NOT NULL GROUP BY winner 
+        ORDER BY wins DESC LIMIT 10
+    """,
+    "what was the highest total score": """
+        SELECT m.match_id, m.team1, m.team2, m.venue, m.match_date,
+               t.batting_team, t.total_runs as total_score, t.inning
+        FROM innings_totals t
+        JOIN matches m ON m.match_id = t.match_id
+        ORDER BY t.total_runs DESC LIMIT 10
+    """,
+    "show matches played in _venue_": """
+        SELECT match_id, team1, team2, winner, venue, match_date
+        FROM matches
+        WHERE city IN (SELECT value FROM json_each(?))
+           OR venue IN (SELECT value FROM json_each(?))
+        ORDER BY match_date DESC, match_id DESC
+    """,
+    "show matches played by _team_": """
+        SELECT match_id, team1, team2, winner, venue, match_date
+        FROM matches
+        WHERE team1 IN (SELECT value FROM json_each(?))
+           OR team2 IN (SELECT value FROM json_each(?))
+        ORDER BY match_date DESC, match_id DESC
+    """,
+    "show matches played in _season_": """
+        SELECT match_id, team1, team2, winner, venue, match_date
+        FROM matches
+        WHERE match_date >= ? AND match_date < ?
+        ORDER BY match_date DESC, match_id DESC
+    """,
+    "which team won the most matches in _season_": """
+        SELECT winner, COUNT(*) as wins FROM matches
+        WHERE winner IS NOT NULL AND match_date >= ? AND match_date < ?
+        GROUP BY winner
+        ORDER BY wins DESC LIMIT 10
+    """,
+
+    # Player Performance
+    "who scored the most runs across all matches": """
+        SELECT batsman as player, 
+               SUM(runs) as total_runs,
+               SUM(balls) as balls_faced,
+               COUNT(*) as matches_played,
+               ROUND(CAST(SUM(runs) AS FLOAT) / SUM(balls) * 100, 2) as strike_rate
+        FROM batter_match_stats 
+        GROUP BY batsman 
+        ORDER BY total_runs DESC LIMIT 15
+    """,
+    "which bowler took the most wickets": """
+        SELECT bowler, 
+               SUM(wickets) as wickets,
+               COUNT(*) as matches_bowled,
+               SUM(overs) as overs_bowled
+        FROM bowler_match_stats 
+        GROUP BY bowler 
+        HAVING SUM(wickets) > 0
+        ORDER BY wickets DESC LIMIT 15
+    """,
+    "show me _player_ batting stats": """
+        SELECT batsman as player,
+               SUM(runs) as total_runs,
+               SUM(balls) as balls_faced,
+               COUNT(*) as matches_played,
+               ROUND(CAST(SUM(runs) AS FLOAT) / SUM(balls) * 100, 2) as strike_rate
+        FROM batter_match_stats
+        WHERE batsman IN (SELECT value FROM json_each(?))
+        GROUP BY batsman
+    """,
+    "show me _player_ bowling stats": """
+        SELECT bowler,
+               SUM(wickets) as wickets,
+               COUNT(*) as matches_bowled,
+               SUM(overs) as overs_bowled,
+               SUM(runs_conceded) as runs_conceded
+        FROM bowler_match_stats
+        WHERE bowler IN (SELECT value FROM json_each(?))
+        GROUP BY bowler
+    """,
+    "show me _player_ vs _player_ head to head": """
+        SELECT batter.name as batsman, bowler.name as bowler,
+               m.balls, m.runs, m.fours, m.sixes, m.dismissals,
+               ROUND(CAST(m.runs AS FLOAT) / m.balls * 100, 2) as strike_rate
+        FROM player_matchups m
+        JOIN players batter ON batter.player_id = m.batter_id
+        JOIN players bowler ON bowler.player_id = m.bowler_id
+        WHERE batter.name IN (SELECT value FROM json_each(?))
+          AND bowler.name IN (SELECT value FROM json_each(?))
+        ORDER BY m.balls DESC, batsman, bowler
+    """,
+    "who has the best bowling figures in a single match": """
+        SELECT bowler, match_id,
+               wickets as wickets_in_match,
+               overs as overs_bowled,
+               runs_conceded
+        FROM bowler_match_stats 
+        WHERE wickets > 0
+        ORDER BY wickets DESC, runs_conceded ASC
+        LIMIT 15
+    """,
     
-    # Fallback: Try word-based similarity
-    best_match = None
-    best_score = 0
+    # Advanced Analytics
+    "what's the average first innings score": """
+        SELECT ROUND(AVG(total_runs), 2) as average_first_innings_score,
+               COUNT(*) as total_first_innings,
+               MIN(total_runs) as lowest_score,
+               MAX(total_runs) as highest_score
+        FROM innings_totals 
+        WHERE inning = 1
+    """,
+    "which venue has the highest scoring matches": """
+        SELECT venue, matches_played, avg_match_total, highest_match_total
+        FROM venue_totals 
+        WHERE matches_played >= 3
+        ORDER BY avg_match_total DESC LIMIT 10
+    """,
+    "show me all centuries scored": """
+        SELECT b.batsman as player, b.match_id,
+               m.team1, m.team2, m.venue, m.match_date,
+               b.runs as runs_scored,
+               b.balls as balls_faced,
+               ROUND(CAST(b.runs AS FLOAT) / b.balls * 100, 2) as strike_rate
+        FROM batter_match_stats b
+        JOIN matches m ON b.match_id = m.match_id
+        WHERE b.runs >= 100
+        ORDER BY b.runs DESC, b.match_id, b.batsman
+    """,
     
-    for key in normalized_query_map.keys():
-        # Calculate simple word overlap score
+    # Additional useful queries
+    "show me the most successful chase targets": """
+        SELECT m.match_id, m.team1, m.team2, m.winner, m.venue,
+               first_innings.total_runs as target,
+               second_innings.total_runs as chased_score,
+               (first_innings.total_runs - second_innings.total_runs) as margin
+        FROM matches m
+        JOIN innings_totals first_innings 
+            ON m.match_id = first_innings.match_id AND first_innings.inning = 1
+        JOIN innings_totals second_innings 
+            ON m.match_id = second_innings.match_id AND second_innings.inning = 2
+        WHERE second_innings.total_runs >= first_innings.total_runs
+        ORDER BY target DESC LIMIT 15
+    """,
+    "which team has the best powerplay performance": """
+        SELECT batting_team as team,
+               COUNT(DISTINCT match_id) as matches,
+               ROUND(AVG(runs), 2) as avg_powerplay_runs,
+               MAX(runs) as best_powerplay
+        FROM powerplay_totals
+        GROUP BY batting_team
+        ORDER BY avg_powerplay_runs DESC LIMIT 10
+    """,
+    "which team scored the most runs in _overs_": """
+        SELECT team,
+               COUNT(*) as innings,
+               SUM(runs) as total_runs,
+               ROUND(AVG(runs), 2) as avg_runs_per_innings
+        FROM (
+            SELECT i.team_batting as team, SUM(d.total_runs) as runs
+            FROM innings i
+            JOIN deliveries d ON d.match_id = i.match_id AND d.inning = i.inning
+            WHERE d.over BETWEEN ? AND ?
+            GROUP BY i.match_id, i.inning
+        )
+        GROUP BY team
+        ORDER BY total_runs DESC LIMIT 10
+    """
+}
+
+# The same answers from deliveries, for templates that read the player index
+# tables (schema.sql); run on databases loaded before those tables existed.
+PLAYER_TABLES_FALLBACK = {
+    "show me _player_ vs _player_ head to head": """
+        SELECT batsman, bowler,
+               COUNT(*) as balls, SUM(runs_scored) as runs,
+               SUM(is_four) as fours, SUM(is_six) as sixes,
+               SUM(CASE WHEN player_out = batsman
+                         AND wicket_kind NOT IN ('run out', 'retired hurt', 'retired out',
+                                                 'obstructing the field')
+                        THEN 1 ELSE 0 END) as dismissals,
+               ROUND(CAST(SUM(runs_scored) AS FLOAT) / COUNT(*) * 100, 2) as strike_rate
+        FROM deliveries
+        WHERE batsman IN (SELECT value FROM json_each(?))
+          AND bowler IN (SELECT value FROM json_each(?))
+        GROUP BY batsman, bowler
+        ORDER BY balls DESC, batsman, bowler
+    """,
+}
+
+# Parameters bound to each slot template's placeholders, in order
+TEMPLATE_PARAMS = {
+    "show matches played in _venue_": ("cities", "venues"),
+    "show matches played by _team_": ("teams", "teams"),
+    "show matches played in _season_": ("season_start", "season_end"),
+    "which team won the most matches in _season_": ("season_start", "season_end"),
+    "show me _player_ batting stats": ("players",),
+    "show me _player_ bowling stats": ("players",),
+    "show me _player_ vs _player_ head to head": ("players", "players"),
+    "which team scored the most runs in _overs_": ("first_over", "last_over"),
+}
+
+# How each parameter is computed from the extracted entities. Name lists are
+# bound as one JSON array each and expanded with json_each(), so the
+# predicates stay plain equality lookups on the indexed columns. Over ranges
+# are 1-based in questions and 0-based in the deliveries table.
+PARAM_BINDERS = {
+    "players": lambda entities: json.dumps(entities.get("player", [])),
+    "teams": lambda entities: json.dumps(entities.get("team", [])),
+    "venues": lambda entities: json.dumps(entities.get("venue", [])),
+    "cities": lambda entities: json.dumps(entities.get("city", [])),
+    "season_start": lambda entities: f"{entities['season']}-01-01",
+    "season_end": lambda entities: f"{int(entities['season']) + 1}-01-01",
+    "first_over": lambda entities: entities["overs"][0] - 1,
+    "last_over": lambda entities: entities["overs"][1] - 1,
+}
+# Enhanced fuzzy matching with key phrases, checked in order
+KEY_PHRASES = {
+    # Slot phrases first: they only apply when the question names an entity
+    "_player_ vs _player_": "show me _player_ vs _player_ head to head",
+    "_player_ v _player_": "show me _player_ vs _player_ head to head",
+    "_player_ versus _player_": "show me _player_ vs _player_ head to head",
+    "_player_ against _player_": "show me _player_ vs _player_ head to head",
+    "batting stats": "show me _player_ batting stats",
+    "bowling stats": "show me _player_ bowling stats",
+    "_player_ stats": "show me _player_ batting stats",
+    "most matches in _season_": "which team won the most matches in _season_",
+    "won in _season_": "which team won the most matches in _season_",
+    "_overs_": "which team scored the most runs in _overs_",
+    "matches in _venue_": "show matches played in _venue_",
+    "matches at _venue_": "show matches played in _venue_",
+    "_venue_ matches": "show matches played in _venue_",
+    "by _team_": "show matches played by _team_",
+    "_team_ matches": "show matches played by _team_",
+    "matches in _season_": "show matches played in _season_",
+    "_season_ matches": "show matches played in _season_",
+    "most matches": "which team won the most matches",
+    "highest score": "what was the highest total score", 
+    "most runs": "who scored the most runs across all matches",
+    "most wickets": "which bowler took the most wickets",
+    "bowling figures": "who has the best bowling figures in a single match",
+    "average score": "what's the average first innings score",
+    "highest scoring venue": "which venue has the highest scoring matches",
+    "centuries": "show me all centuries scored",
+    "chase": "show me the most successful chase targets",
+    "powerplay": "which team has the best powerplay performance"
+}
+
+# Entity lookups a batch can merge into one statement: template -> output
+# column holding the looked-up name. Their only parameter is the JSON list
+# of names, so several questions' names can be looked up together.
+MERGEABLE_LOOKUPS = {
+    "show me _player_ batting stats": "player",
+    "show me _player_ bowling stats": "bowler",
+}
+
+# Unique sort keys (output column, direction) for templates that can return
+# many rows; their pages are fetched with keyset predicates instead of OFFSET.
+# Each must match the template's ORDER BY.
+QUERY_KEYSETS = {
+    "show matches played in _venue_": (("match_date", "DESC"), ("match_id", "DESC")),
+    "show matches played by _team_": (("match_date", "DESC"), ("match_id", "DESC")),
+    "show matches played in _season_": (("match_date", "DESC"), ("match_id", "DESC")),
+    "show me all centuries scored": (("runs_scored", "DESC"), ("match_id", "ASC"), ("player", "ASC")),
+}
+
+SLOT_NAMES = frozenset(SLOT_TOKENS.values())
+
+# Minimum word-overlap score for the fuzzy fallback
+FUZZY_THRESHOLD = 0.3
+
+# A template that uses every slot the question filled is routed to if it
+# scores at least this fraction of the best match that drops one.
+SLOT_PREFERENCE = 0.8
+
+
+class QuestionRouter:
+    """Routes normalized questions to query_map templates.
+
+    Everything that does not depend on the question is computed once in
+    __init__: normalized keys, the key-phrase automaton, per-template word sets
+    and an inverted word -> template index, so fuzzy matching only scores
+    templates that share at least one word with the question.
+
+    Template keys may contain slot tokens (_player_, _venue_, ...). Questions
+    are routed after entity extraction has masked names with the same
+    tokens, and a slot template is only chosen when the question supplied
+    every slot it needs. A template that ignores a slot the question filled
+    is never chosen over one that uses it, and is only chosen at all when
+    nothing else matched; the filter would be silently dropped, so the
+    question gets no template instead.
+
+    With a semantic_router.SemanticRouter, it replaces word overlap as the
+    fallback for questions no key phrase matches.
+    """
+
+    def __init__(self, query_map, key_phrases, template_params=None, semantic=None):
+        self.templates = {normalize_question(key): sql for key, sql in query_map.items()}
+        self.params = {normalize_question(key): names for key, names in (template_params or {}).items()}
+        # Template keys in definition order; ties in fuzzy scoring go to the earliest.
+        self._keys = list(self.templates)
+        self._key_sizes = [len(set(key.split())) for key in self._keys]
+        self._slots = [frozenset(word for word in key.split() if word in SLOT_NAMES) for key in self._keys]
+        self._positions = {key: position for position, key in enumerate(self._keys)}
+        self._word_index = {}
+        for position, key in enumerate(self._keys):
+            for word in set(key.split()):
+                self._word_index.setdefault(word, []).append(position)
+
+        # An Aho-Corasick automaton over the key phrases finds every (possibly
+        # overlapping) occurrence in one pass over the question, however many
+        # phrases there are. Each phrase's value is its position in the table,
+        # so the lowest one found preserves first-listed-phrase-wins.
+        self._phrase_targets = []
+        self._phrases = AhoCorasick()
+        for priority, (phrase, mapped_question) in enumerate(key_phrases.items()):
+            self._phrase_targets.append(normalize_question(mapped_question))
+            self._phrases.add(phrase, priority)
+        self._phrases.build()
+        self._phrase_priority = {phrase: i for i, phrase in enumerate(key_phrases)}
+
+        self.semantic = semantic
+        self._eligible = {}   # filled slots -> semantic template masks (satisfied, filled)
+
+    @property
+    def vocabulary(self):
+        """Every word used by a template key or key phrase, slot tokens excluded."""
+        words = set(self._word_index)
+        for phrase in self._phrase_priority:
+            words.update(phrase.split())
+        return words - SLOT_NAMES
+
+    def _satisfied(self, key, slots):
+        return self._slots[self._positions[key]] <= slots
+
+    def _fills(self, key, slots):
+        """True if the template uses exactly the slots the question filled."""
+        return self._slots[self._positions[key]] == slots
+
+    def _prefer_filled(self, best, score, filled, filled_score, slots):
+        """Pick between the best match and the best one using every filled slot.
+
+        The latter wins if it scores at least SLOT_PREFERENCE of the best; a
+        best match that would drop a filled slot is otherwise declined.
+        """
+        if best is None or self._fills(best, slots):
+            return best
+        if filled is not None and filled_score >= SLOT_PREFERENCE * score:
+            return filled
+        return None
+
+    def resolve(self, question, slots=frozenset()):
+        """Return the normalized template key for a question, or None.
+
+        slots is the set of slot tokens the question filled; templates that
+        need any other slot are skipped, and templates that ignore one are
+        only used through _prefer_filled.
+        """
+        question_normalized = normalize_question(question)
+
+        # Try exact normalized match first
+        if question_normalized in self.templates and self._fills(question_normalized, slots):
+            return question_normalized
+
+        # Check for key phrase matches
+        priorities = sorted({priority for _, _, values in self._phrases.iter_matches(question_normalized)
+                             for priority in values})
+        for priority in priorities:
+            target = self._phrase_targets[priority]
+            if self._fills(target, slots):
+                return target
+
+        if self.semantic is not None:
+            masks = self._eligible.get(slots)
+            if masks is None:
+                masks = self._eligible[slots] = (
+                    self.semantic.mask(key for key in self.semantic.templates if self._satisfied(key, slots)),
+                    self.semantic.mask(key for key in self.semantic.templates if self._fills(key, slots)))
+            best, confidence = self.semantic.match(question_normalized, masks[0])
+            if best is None or self._fills(best, slots):
+                return best
+            return self._prefer_filled(best, confidence, *self.semantic.match(question_normalized, masks[1]), slots)
+
+        # Fallback: word-overlap similarity over templates sharing a word
         question_words = set(question_normalized.split())
-        key_words = set(key.split())
-        
-        if len(question_words) > 0 and len(key_words) > 0:
-            overlap = len(question_words.intersection(key_words))
-            score = overlap / max(len(question_words), len(key_words))
-            
-            if score > best_score and score > 0.3:  # Minimum threshold
+        if not question_words:
+            return None
+        overlaps = {}
+        for word in question_words:
+            for position in self._word_index.get(word, ()):
+                overlaps[position] = overlaps.get(position, 0) + 1
+
+        best_position = filled_position = None
+        best_score = filled_score = 0
+        for position in sorted(overlaps):
+            if not self._slots[position] <= slots:
+                continue
+            score = overlaps[position] / max(len(question_words), self._key_sizes[position])
+            if score <= FUZZY_THRESHOLD:  # Minimum threshold
+                continue
+            if score > best_score:
                 best_score = score
-                best_match = key
-    
-    if best_match:
-        return normalized_query_map[best_match]
-    
-    return "SELECT 'Sorry, I could not understand your question. Try asking about matches, teams, players, or statistics.' as response"
+                best_position = position
+            if score > filled_score and self._slots[position] == slots:
+                filled_score = score
+                filled_position = position
+
+        if best_position is None:
+            return None
+        filled = self._keys[filled_position] if filled_position is not None else None
+        return self._prefer_filled(self._keys[best_position], best_score, filled, filled_score, slots)
+
+    def bind(self, key, entities):
+        """Positional parameters for a template from the extracted entities."""
+        return tuple(PARAM_BINDERS[name](entities) for name in self.params.get(key, ()))
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """Return the question router, building it on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = QuestionRouter(QUERY_MAP, KEY_PHRASES, TEMPLATE_PARAMS, get_semantic_router())
+    return _router
+
+def get_semantic_router():
+    """A SemanticRouter over the query_map templates, or None without NumPy or with SEMANTIC_ROUTER off."""
+    if not SEMANTIC_ROUTER:
+        return None
+    import semantic_router
+    if not semantic_router.AVAILABLE:
+        return None
+    templates = [normalize_question(key) for key in QUERY_MAP]
+    return semantic_router.SemanticRouter.for_templates(templates, threshold=SEMANTIC_THRESHOLD)
+
+_extractor = None   # (EntityExtractor, pool, generation) it was read from
+_extractor_lock = threading.Lock()
+
+def get_extractor():
+    """Return the entity extractor, rebuilding it when the data changes.
+
+    The check takes no lock and runs no SQL: the extractor is rebuilt when
+    DB_FILE has a new pool (data_loader published a snapshot) or a query on
+    the pool has since read a newer generation (an incremental load, seen
+    from the question after the first query that reads it). Names come from
+    the database; if it cannot be read the extractor still recognises
+    seasons and over ranges.
+    """
+    global _extractor
+    pool = get_pool()
+    current = _extractor
+    if current is not None and current[1] is pool and current[2] >= pool.generation:
+        return current[0]
+    with _extractor_lock:
+        current = _extractor
+        if current is not None and current[1] is pool and current[2] >= pool.generation:
+            return current[0]
+        try:
+            with pool.connection() as conn:
+                generation = conn.execute("PRAGMA user_version").fetchone()[0]
+                extractor = EntityExtractor.from_connection(conn, get_router().vocabulary)
+            pool.saw_generation(generation)
+            _extractor = (extractor, pool, generation)
+        except sqlite3.Error:
+            if current is not None:
+                return current[0]
+            extractor = EntityExtractor(get_router().vocabulary)
+            _extractor = (extractor, None, 0)
+        return extractor
+
+def get_sql_query(question, trace=None):
+    """Map a natural language question to (sql_query, params) with robust matching.
+
+    With a trace, the normalize, extract and resolve steps are timed and
+    the matched template is recorded.
+    """
+    clock = time.perf_counter
+    start = clock()
+    normalized = normalize_question(question)
+    normalized_at = clock()
+    masked, entities = get_extractor().extract(normalized)
+    extracted_at = clock()
+    slots = frozenset(SLOT_TOKENS[kind] for kind in entities)
+    router = get_router()
+    key = router.resolve(masked, slots)
+    if trace is not None:
+        trace.add("normalize", normalized_at - start)
+        trace.add("extract", extracted_at - normalized_at)
+        trace.add("resolve", clock() - extracted_at)
+        trace.template = key
+    if key is None:
+        return FALLBACK_SQL, ()
+    return router.templates[key], router.bind(key, entities)
+
+class ResultCache:
+    """LRU cache of formatted query results, bounded by entry count and size.
+
+    Text answers are sized by their length; structured answers are given
+    their serialized size by the caller.
+
+    Entries are keyed on (sql, params) and tagged with the database generation
+    (PRAGMA user_version, bumped by data_loader on every load); the whole cache
+    is dropped as soon as a lookup sees a different generation.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def get(self, key, generation):
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
 
-def execute_sql_query(sql_query):
-    """Execute SQL query and return formatted results."""
+    def put(self, key, generation, value, size=None):
+        if size is None:
+            size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+RESULT_CACHE = ResultCache()
+
+METRICS = Metrics(TRACE_FILE)
+
+_KEYSETS_BY_SQL = {QUERY_MAP[question]: keyset for question, keyset in QUERY_KEYSETS.items()}
+_FALLBACK_BY_SQL = {QUERY_MAP[question]: sql for question, sql in PLAYER_TABLES_FALLBACK.items()}
+
+_engine = None
+_engine_questions = None
+_engine_lock = threading.Lock()
+
+def engine_question(sql_query):
+    """The analytics_engine question a template's SQL corresponds to, or None.
+
+    analytics_engine (and with it NumPy) is only imported here and in
+    get_engine, so the server starts without it when COLUMNAR_ENGINE is off.
+    """
+    global _engine_questions
+    if _engine_questions is None:
+        import analytics_engine
+        _engine_questions = {sql: question for question, sql in get_router().templates.items()
+                             if question in analytics_engine.QUESTIONS}
+    return _engine_questions.get(sql_query)
+
+def get_engine(conn, generation):
+    """Return the columnar engine for the current data generation, or None.
+
+    The first call for a generation memory-maps the saved .npy columns, or
+    builds them from conn and saves them when there are none yet.
+    """
+    global _engine
+    if not COLUMNAR_ENGINE:
+        return None
+    import analytics_engine
+    if not analytics_engine.AVAILABLE:
+        return None
+    with _engine_lock:
+        if _engine is None or _engine.generation != generation:
+            _engine = analytics_engine.ColumnarEngine.open(conn, COLUMNS_DIR or DB_FILE + ".columns", generation)
+        return _engine
+
+_player_index = None
+_player_index_lock = threading.Lock()
+_PLAYER_INDEX_BY_SQL = {QUERY_MAP[question]: question for question in player_index.QUESTIONS}
+
+def get_player_index(conn, generation):
+    """Return the player index for the current data generation, or None.
+
+    The first call for a generation reads the player index tables from
+    conn; a database loaded before they existed has none, and its player
+    questions are answered from SQLite.
+    """
+    global _player_index
+    if not PLAYER_INDEX:
+        return None
+    with _player_index_lock:
+        if _player_index is None or _player_index.generation != generation:
+            try:
+                _player_index = player_index.PlayerIndex.load(conn, generation)
+            except sqlite3.OperationalError:
+                return None
+        return _player_index
+
+
+_cost_model = None
+_cost_model_lock = threading.Lock()
+
+def get_cost_model(conn, generation):
+    """Return the query cost model for the current data generation.
+
+    The first call for a generation reads the table sizes and index
+    statistics from conn; estimates are then cached per template.
+    """
+    global _cost_model
+    with _cost_model_lock:
+        if _cost_model is None or _cost_model.generation != generation:
+            _cost_model = CostModel.load(conn, generation)
+        return _cost_model
+
+ADMISSION = AdmissionControl(MAX_HEAVY_QUERIES)
+
+
+class InvalidCursor(ValueError):
+    """Raised for a continuation token that does not belong to the query."""
+
+
+def _sql_digest(sql_query, params):
+    return hashlib.sha1(repr((sql_query, tuple(params))).encode()).hexdigest()[:16]
+
+def encode_cursor(sql_query, params, generation, returned, after=None):
+    """Opaque continuation token: query digest, data generation, rows returned
+    so far and the keyset values of the last row (templates without a keyset
+    use the row count)."""
+    token = {"q": _sql_digest(sql_query, params), "g": generation, "n": returned}
+    if after is not None:
+        token["k"] = list(after)
+    return base64.urlsafe_b64encode(json.dumps(token, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(token, sql_query, params, generation):
+    """(rows returned, keyset values) from a token; InvalidCursor unless it
+    was issued for this query on the current data generation."""
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
-        column_names = [description[0] for description in cursor.description]
-        conn.close()
-        
-        if not results:
-            return "No results found for your query."
-        
-        # Format as table
-        formatted_result = "\n" + " | ".join(column_names) + "\n"
-        formatted_result += "-" * len(formatted_result) + "\n"
-        
-        for row in results[:20]:
-            formatted_row = " | ".join(str(cell) if cell is not None else "N/A" for cell in row)
-            formatted_result += formatted_row + "\n"
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        returned = int(data["n"])
+        after = data.get("k")
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if data.get("q") != _sql_digest(sql_query, params):
+        raise InvalidCursor("Cursor does not belong to this question")
+    if data.get("g") != generation:
+        raise InvalidCursor("Cursor is from an earlier data load; ask the question again")
+    return returned, after
+
+def page_query(sql_query, params, page_size, keyset=None, returned=0, after=None):
+    """Wrap a template so it returns one page (plus one look-ahead row).
+
+    With a keyset the page starts strictly after the previous page's last
+    row, e.g. (a < ?) OR (a = ? AND b > ?) for a DESC, b ASC, so earlier
+    rows are never produced; otherwise it falls back to OFFSET.
+    """
+    params = list(params)
+    if keyset is None:
+        return (f"SELECT * FROM ({sql_query}) LIMIT ? OFFSET ?",
+                params + [page_size + 1, returned])
+
+    order_by = ", ".join(f"{column} {direction}" for column, direction in keyset)
+    if after is None:
+        return (f"SELECT * FROM ({sql_query}) ORDER BY {order_by} LIMIT ?",
+                params + [page_size + 1])
+
+    disjuncts = []
+    for i, (column, direction) in enumerate(keyset):
+        terms = [f"{prefix_column} = ?" for prefix_column, _ in keyset[:i]]
+        terms.append(f"{column} {'<' if direction == 'DESC' else '>'} ?")
+        disjuncts.append("(" + " AND ".join(terms) + ")")
+        params.extend(after[:i + 1])
+    where = " OR ".join(disjuncts)
+    return (f"SELECT * FROM ({sql_query}) WHERE {where} ORDER BY {order_by} LIMIT ?",
+            params + [page_size + 1])
+
+def format_results(column_names, results, returned=0, next_cursor=None, total=None):
+    """Format one page of rows as a pipe-separated text table."""
+    if not results:
+        return "No results found for your query."
+
+    # Format as table
+    header = " | ".join(column_names)
+    lines = ["", header, "-" * (len(header) + 2)]
+    lines.extend(" | ".join(str(cell) if cell is not None else "N/A" for cell in row) for row in results)
+    lines.append("")
+
+    if next_cursor is not None:
+        if total is not None:
+            lines.append(f"... and {total - returned - len(results)} more rows (cursor: {next_cursor})")
+        else:
+            lines.append(f"... more rows available (cursor: {next_cursor})")
+    elif total is not None:
+        lines.append(f"{total} rows in total")
+    return "\n".join(lines)
+
+def _page_info(payload, results, next_cursor, total):
+    payload["row_count"] = len(results)
+    if next_cursor is not None:
+        payload["next_cursor"] = next_cursor
+    if total is not None:
+        payload["total"] = total
+    return payload
+
+def format_rows(column_names, results, returned=0, next_cursor=None, total=None):
+    """One page as JSON-ready rows: {"columns", "rows": [{column: value}], ...}."""
+    return _page_info({
+        "format": "rows",
+        "columns": list(column_names),
+        "rows": [dict(zip(column_names, row)) for row in results],
+    }, results, next_cursor, total)
+
+def format_columns(column_names, results, returned=0, next_cursor=None, total=None):
+    """One page column by column, with repeated strings dictionary-encoded.
+
+    "data" holds one list per column. A text column holding any value that
+    occurs more than once across the page's text columns (team, venue and
+    player names, usually) is stored as indexes into the shared
+    "dictionary" list and named in "encoded"; None stays null.
+    """
+    data = [[row[index] for row in results] for index in range(len(column_names))]
+    text_columns = [index for index, values in enumerate(data)
+                    if any(value is not None for value in values)
+                    and all(value is None or isinstance(value, str) for value in values)]
+    occurrences = {}
+    for index in text_columns:
+        for value in data[index]:
+            occurrences[value] = occurrences.get(value, 0) + 1
+
+    dictionary = []
+    codes = {}
+    encoded = []
+    for index in text_columns:
+        values = data[index]
+        if not any(value is not None and occurrences[value] > 1 for value in values):
+            continue
+        for value in values:
+            if value is not None and value not in codes:
+                codes[value] = len(dictionary)
+                dictionary.append(value)
+        data[index] = [codes[value] if value is not None else None for value in values]
+        encoded.append(column_names[index])
+    return _page_info({
+        "format": "columns",
+        "columns": list(column_names),
+        "data": data,
+        "dictionary": dictionary,
+        "encoded": encoded,
+    }, results, next_cursor, total)
+
+RESULT_FORMATTERS = {
+    "text": format_results,
+    "rows": format_rows,
+    "columns": format_columns,
+}
+
+class QueryCancelled(Exception):
+    """Raised when a query is cancelled by the client."""
+
+
+class QueryControl:
+    """Cancellation, timeout and step budget state for one tools/call.
+
+    Installed as the connection's progress handler while the query runs, so
+    SQLite checks it every PROGRESS_INTERVAL VM steps; cancel() also
+    interrupts the connection directly. The timeout covers the whole call,
+    the step budget each query in it; None means the current QUERY_TIMEOUT
+    or QUERY_STEP_BUDGET setting.
+    """
+
+    def __init__(self, timeout=None, step_budget=None):
+        if timeout is None:
+            timeout = QUERY_TIMEOUT
+        if step_budget is None:
+            step_budget = QUERY_STEP_BUDGET
+        self.created = time.perf_counter()
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.timeout = timeout
+        self.step_budget = step_budget
+        self.steps = 0
+        self.cancelled = False
+        self.timed_out = False
+        self.over_budget = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def attach(self, conn):
+        with self._lock:
+            self._conn = conn
+        self.steps = 0
+        self.over_budget = False
+        conn.set_progress_handler(self.check, PROGRESS_INTERVAL)
+
+    def detach(self, conn):
+        conn.set_progress_handler(None, 0)
+        with self._lock:
+            self._conn = None
+
+    def check(self):
+        """Progress handler: a non-zero return aborts the running statement."""
+        if self.cancelled:
+            return 1
+        self.steps += PROGRESS_INTERVAL
+        if self.step_budget is not None and self.steps > self.step_budget:
+            self.over_budget = True
+            return 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.timed_out = True
+            return 1
+        return 0
+
+    def raise_if_stopped(self):
+        if self.cancelled:
+            raise QueryCancelled("Query cancelled")
+        if self.over_budget:
+            raise QueryRejected(QUERY_ABORTED, f"Query stopped after {self.step_budget:,} VM steps",
+                                {"reason": "step_budget", "limit": self.step_budget})
+        if self.timed_out:
+            raise QueryRejected(QUERY_ABORTED, f"Query timed out after {self.timeout:g} seconds",
+                                {"reason": "timeout", "limit_seconds": self.timeout})
+
+
+@contextmanager
+def guarded(conn, generation, sql_query, params, control=None, trace=None):
+    """Run the block's statements on conn under the query guard.
+
+    Plans estimated above MAX_QUERY_COST are refused, plans at or above
+    HEAVY_QUERY_COST run only while an ADMISSION slot is free, and the
+    statements stop after the control's step budget or timeout (a default
+    QueryControl when none is given).
+    """
+    start = time.perf_counter()
+    cost = get_cost_model(conn, generation).estimate(conn, sql_query, params)
+    if trace is not None:
+        trace.add("plan", time.perf_counter() - start)
+    if cost > MAX_QUERY_COST:
+        raise QueryRejected(QUERY_TOO_EXPENSIVE,
+                            f"Query too expensive: about {cost:,} rows to visit, "
+                            f"limit {MAX_QUERY_COST:,}",
+                            {"reason": "cost", "estimated_cost": cost, "limit": MAX_QUERY_COST})
+    if control is None:
+        control = QueryControl()
+    with ADMISSION.admit(cost) if cost >= HEAVY_QUERY_COST else nullcontext():
+        control.attach(conn)
+        try:
+            yield
+        except sqlite3.OperationalError:
+            control.raise_if_stopped()
+            raise
+        finally:
+            control.detach(conn)
+
+def result_size(formatted_result, result_format, page_size):
+    """Serialized size of a formatted page; raises RESULT_TOO_LARGE over MAX_RESULT_BYTES."""
+    size = len(formatted_result) if result_format == "text" else len(encode_json(formatted_result))
+    if size > MAX_RESULT_BYTES:
+        smaller = max(1, page_size * MAX_RESULT_BYTES // size)
+        raise QueryRejected(RESULT_TOO_LARGE,
+                            f"Result page is {size:,} bytes, over the {MAX_RESULT_BYTES:,} byte limit; "
+                            f"retry with page_size {smaller}",
+                            {"reason": "result_size", "bytes": size, "limit": MAX_RESULT_BYTES,
+                             "page_size": smaller})
+    return size
+
+
+def execute_sql_query(sql_query, params=(), control=None, page_size=DEFAULT_PAGE_SIZE,
+                      cursor=None, include_total=False, trace=None, result_format="text"):
+    """Execute SQL query and return one formatted page, served from RESULT_CACHE when possible.
+
+    result_format is a RESULT_FORMATTERS key: "text" returns the text
+    table, "rows" and "columns" a JSON-ready dict. Errors are returned as a
+    message string, except that queries the guard refuses or stops raise
+    QueryRejected, for the caller to report as a JSON-RPC error.
+
+    Only page_size + 1 rows are fetched; the row count behind "more rows" is
+    a separate COUNT(*) that runs only when include_total is set. With
+    COLUMNAR_ENGINE on, the aggregate templates analytics_engine knows are
+    answered from its NumPy columns instead of SQLite, and with
+    PLAYER_INDEX on the player templates come from the resident player
+    index. On a database without the player index tables, the templates
+    that read them run their PLAYER_TABLES_FALLBACK SQL instead. Stage
+    timings and the row count go to trace when one is given.
+
+    SQL runs under the query guard: plans estimated above MAX_QUERY_COST
+    are refused, plans at or above HEAVY_QUERY_COST run only while an
+    ADMISSION slot is free, and the query stops after the control's step
+    budget (a default QueryControl when none is given). Pages are capped at
+    MAX_PAGE_SIZE rows and MAX_RESULT_BYTES.
+    """
+    if trace is None:
+        trace = RequestTrace()
+    clock = time.perf_counter
+    try:
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        params = tuple(params)
+        pool = get_pool()
+        with pool.connection() as conn:
+            generation = conn.execute("PRAGMA user_version").fetchone()[0]
+            pool.saw_generation(generation)
+            if sql_query in _FALLBACK_BY_SQL and "player_matchups" not in get_cost_model(conn, generation).tables:
+                sql_query = _FALLBACK_BY_SQL[sql_query]
+            keyset = _KEYSETS_BY_SQL.get(sql_query)
+            returned, after = decode_cursor(cursor, sql_query, params, generation) if cursor else (0, None)
+            paged_sql, paged_params = page_query(sql_query, params, page_size, keyset, returned, after)
+            key = (paged_sql, tuple(paged_params), include_total, result_format)
+            cached = RESULT_CACHE.get(key, generation)
+            if cached is not None:
+                trace.cache_hit = True
+                return cached
+            question = engine_question(sql_query) if COLUMNAR_ENGINE else None
+            engine = get_engine(conn, generation) if question else None
+            index_question = _PLAYER_INDEX_BY_SQL.get(sql_query) if PLAYER_INDEX else None
+            index = get_player_index(conn, generation) if index_question else None
+            if engine is not None or index is not None:
+                # Both produce the whole ordered result; page it by position.
+                start = clock()
+                if engine is not None:
+                    column_names, rows = engine.query(question)
+                else:
+                    column_names, rows = index.query(index_question, params)
+                results = rows[returned:returned + page_size + 1]
+                total = len(rows) if include_total else None
+                trace.add("engine" if engine is not None else "index", clock() - start)
+            else:
+                with guarded(conn, generation, sql_query, params, control, trace):
+                    start = clock()
+                    db_cursor = conn.cursor()
+                    db_cursor.execute(paged_sql, paged_params)
+                    executed_at = clock()
+                    results = db_cursor.fetchmany(page_size + 1)
+                    trace.add("execute", executed_at - start)
+                    trace.add("fetch", clock() - executed_at)
+                    column_names = [description[0] for description in db_cursor.description]
+                    db_cursor.close()
+                    total = None
+                    if include_total:
+                        start = clock()
+                        total = conn.execute(f"SELECT COUNT(*) FROM ({sql_query})", params).fetchone()[0]
+                        trace.add("count", clock() - start)
         
-        if len(results) > 20:
-            formatted_result += f"\n... and {len(results) - 20} more rows"
-            
+        next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            last = None
+            if keyset is not None:
+                last = [results[-1][column_names.index(column)] for column, _ in keyset]
+            next_cursor = encode_cursor(sql_query, params, generation, returned + page_size, last)
+
+        start = clock()
+        formatted_result = RESULT_FORMATTERS[result_format](column_names, results, returned, next_cursor, total)
+        trace.add("format", clock() - start)
+        trace.rows = len(results)
+        size = result_size(formatted_result, result_format, page_size)
+        RESULT_CACHE.put(key, generation, formatted_result, size)
         return formatted_result
         
+    except QueryRejected as e:
+        trace.error = str(e)
+        raise
+    except (QueryCancelled, InvalidCursor) as e:
+        trace.error = str(e)
+        return str(e)
     except Exception as e:
+        trace.error = str(e)
         return f"Database error: {str(e)}"
 
-def main():
-    """Main MCP server loop with proper protocol handling."""
-    
-    # Keep the server running
-    for line in sys.stdin:
+_MERGEABLE_BY_SQL = {QUERY_MAP[question]: column for question, column in MERGEABLE_LOOKUPS.items()}
+
+def _merged_lookup(sql_query, members, control=None, page_size=DEFAULT_PAGE_SIZE, traces=None):
+    """Run one entity-lookup template for several parameter sets in one statement.
+
+    members are the params tuples of the individual questions; returns
+    {params: formatted first page}, each cached as if run on its own.
+    traces maps params to that question's RequestTrace; the shared
+    statement's timings go to the first one that needed it.
+
+    The shared statement runs under the same query guard as
+    execute_sql_query, and each answer is held to MAX_RESULT_BYTES; a
+    refused or stopped question is answered with {"error": JSON-RPC error
+    object}.
+    """
+    traces = traces or {}
+    clock = time.perf_counter
+    split_column = _MERGEABLE_BY_SQL[sql_query]
+    keys = {}
+    for params in members:
+        paged_sql, paged_params = page_query(sql_query, params, page_size)
+        keys[params] = (paged_sql, tuple(paged_params), False, "text")
+    answers = {}
+    try:
+        pool = get_pool()
+        with pool.connection() as conn:
+            generation = conn.execute("PRAGMA user_version").fetchone()[0]
+            pool.saw_generation(generation)
+            for params in members:
+                cached = RESULT_CACHE.get(keys[params], generation)
+                if cached is not None:
+                    answers[params] = cached
+                    if params in traces:
+                        traces[params].cache_hit = True
+            missing = [params for params in members if params not in answers]
+            if not missing:
+                return answers
+            trace = traces.get(missing[0]) or RequestTrace()
+            names = list(dict.fromkeys(name for params in missing for name in json.loads(params[0])))
+            merged_params = (json.dumps(names),)
+            with guarded(conn, generation, sql_query, merged_params, control, trace):
+                start = clock()
+                db_cursor = conn.cursor()
+                db_cursor.execute(sql_query, merged_params)
+                executed_at = clock()
+                rows = db_cursor.fetchall()
+                trace.add("execute", executed_at - start)
+                trace.add("fetch", clock() - executed_at)
+                column_names = [description[0] for description in db_cursor.description]
+                db_cursor.close()
+    except Exception as e:
+        if isinstance(e, QueryRejected):
+            message = {"error": e.error()}
+        elif isinstance(e, QueryCancelled):
+            message = str(e)
+        else:
+            message = f"Database error: {str(e)}"
+        for params in members:
+            if params not in answers and params in traces:
+                traces[params].error = str(e)
+        return {params: answers.get(params, message) for params in members}
+
+    index = column_names.index(split_column)
+    for params in missing:
+        start = clock()
+        wanted = set(json.loads(params[0]))
+        results = [row for row in rows if row[index] in wanted]
+        next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            next_cursor = encode_cursor(sql_query, params, generation, page_size)
+        formatted_result = format_results(column_names, results, 0, next_cursor)
+        if params in traces:
+            traces[params].add("format", clock() - start)
+            traces[params].rows = len(results)
         try:
-            line = line.strip()
-            if not line:
+            size = result_size(formatted_result, "text", page_size)
+        except QueryRejected as e:
+            if params in traces:
+                traces[params].error = str(e)
+            answers[params] = {"error": e.error()}
+            continue
+        answers[params] = formatted_result
+        RESULT_CACHE.put(keys[params], generation, formatted_result, size)
+    return answers
+
+def execute_batch(questions, control=None, page_size=DEFAULT_PAGE_SIZE):
+    """Answer several questions in one call: {question: formatted first page}.
+
+    Questions that route to the same SQL and parameters run once. Lookups of
+    the same entity template (several players' batting stats, say) are
+    merged into one statement over all the names and split per question,
+    unless PLAYER_INDEX is on and the player index answers them.
+    With COLUMNAR_ENGINE on, the aggregate questions also share the engine's
+    per-batter and per-bowler group-bys. A question the query guard refuses
+    or stops is answered with {"error": JSON-RPC error object}.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    routed = {}
+    traces = {}
+    for question in questions:
+        if question not in routed:
+            trace = RequestTrace("query_ipl_data_batch", question)
+            routed[question] = get_sql_query(question, trace)
+            traces.setdefault(routed[question], trace)
+
+    answers = {}
+    lookups = {}
+    for sql_query, params in traces:
+        # Player index lookups cost microseconds each, so they are not merged.
+        if sql_query in _MERGEABLE_BY_SQL and not (PLAYER_INDEX and sql_query in _PLAYER_INDEX_BY_SQL):
+            lookups.setdefault(sql_query, []).append(params)
+        else:
+            try:
+                answers[(sql_query, params)] = execute_sql_query(sql_query, params, control=control,
+                                                                 page_size=page_size,
+                                                                 trace=traces[(sql_query, params)])
+            except QueryRejected as e:
+                answers[(sql_query, params)] = {"error": e.error()}
+    for sql_query, members in lookups.items():
+        member_traces = {params: traces[(sql_query, params)] for params in members}
+        for params, result in _merged_lookup(sql_query, members, control, page_size, member_traces).items():
+            answers[(sql_query, params)] = result
+    for trace in traces.values():
+        METRICS.record(trace)
+    return {question: answers[routed[question]] for question in routed}
+
+def warm_up(busy=None):
+    """Build the lazily created state and cache the canned templates' first pages.
+
+    Between templates it waits while busy() is true, so client questions do
+    not compete with it. Best effort: a failure here (no database yet, say)
+    is left for the first real question to report.
+    """
+    try:
+        router = get_router()
+        get_extractor()
+        with get_pool().connection() as conn:
+            get_player_index(conn, conn.execute("PRAGMA user_version").fetchone()[0])
+        for key, sql_query in router.templates.items():
+            if router.params.get(key):
                 continue
-                
-            request = json.loads(line)
-            request_id = request.get('id')
-            method = request.get('method')
-            response = None
-
-            if method == 'initialize':
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "protocolVersion": "2024-11-05",
-                        "capabilities": {
-                            "tools": {}
-                        },
-                        "serverInfo": {
-                            "name": "ipl-cricket-analyzer",
-                            "version": "1.0.0"
-                        }
-                    }
+            while busy is not None and busy():
+                time.sleep(WARM_UP_BACKOFF)
+            try:
+                execute_sql_query(sql_query)
+            except QueryRejected:
+                continue  # over a guard limit right now; left for the first question that asks
+    except Exception:
+        pass
+
+def server_stats():
+    """Runtime statistics reported by the server_stats tool."""
+    stats = {"result_cache": RESULT_CACHE.stats(), "latency": METRICS.stats(),
+             "heavy_queries": ADMISSION.stats()}
+    index = _player_index
+    if index is not None:
+        stats["player_index"] = {"generation": index.generation, "players": len(index),
+                                 "matchups": len(index.matchup_bowlers), "bytes": index.memory_bytes()}
+    return stats
+
+TOOLS = [{
+    "name": "query_ipl_data",
+    "description": "Query IPL cricket data using natural language questions",
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "question": {
+                "type": "string",
+                "description": "Natural language question about IPL data"
+            },
+            "page_size": {
+                "type": "integer",
+                "minimum": 1,
+                "description": f"Rows per page (default {DEFAULT_PAGE_SIZE}, max {MAX_PAGE_SIZE})"
+            },
+            "cursor": {
+                "type": "string",
+                "description": "Continuation token from a previous page of the same question"
+            },
+            "include_total": {
+                "type": "boolean",
+                "description": "Also count the total number of result rows"
+            },
+            "format": {
+                "type": "string",
+                "enum": list(RESULT_FORMATTERS),
+                "description": ("text: a readable table (default). rows: JSON rows keyed by column. "
+                                "columns: JSON column arrays, repeated names dictionary-encoded. "
+                                "rows and columns are also returned as structuredContent "
+                                f"from protocol version {STRUCTURED_OUTPUT_VERSION}")
+            }
+        },
+        "required": ["question"]
+    }
+}, {
+    "name": "query_ipl_data_batch",
+    "description": "Answer several IPL questions in one call; results are keyed by question",
+    "inputSchema": {
+        "type": "object",
+        "properties": {
+            "questions": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": f"Natural language questions about IPL data (at most {MAX_BATCH_QUESTIONS})"
+            },
+            "page_size": {
+                "type": "integer",
+                "minimum": 1,
+                "description": f"Rows per answer (default {DEFAULT_PAGE_SIZE}, max {MAX_PAGE_SIZE})"
+            }
+        },
+        "required": ["questions"]
+    }
+}, {
+    "name": "server_stats",
+    "description": "Report server runtime statistics: result cache hit rate and p50/p95/p99 latency per query template and stage",
+    "inputSchema": {
+        "type": "object",
+        "properties": {}
+    }
+}]
+
+_protocol_version = PROTOCOL_VERSIONS[-1]   # agreed by initialize; one client per process
+
+def handle_request(request):
+    """Answer every method except tools/call. Returns None for notifications."""
+    global _protocol_version
+    request_id = request.get('id')
+    method = request.get('method')
+
+    if method == 'initialize':
+        requested = (request.get('params') or {}).get('protocolVersion')
+        _protocol_version = requested if requested in PROTOCOL_VERSIONS else PROTOCOL_VERSIONS[0]
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "protocolVersion": _protocol_version,
+                "capabilities": {
+                    "tools": {}
+                },
+                "serverInfo": {
+                    "name": "ipl-cricket-analyzer",
+                    "version": "1.0.0"
                 }
-            
-            elif method == 'notifications/initialized':
-                # Don't respond to notifications, just continue
-                continue
-            
-            elif method == 'tools/list':
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "tools": [{
-                            "name": "query_ipl_data",
-                            "description": "Query IPL cricket data using natural language questions",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "question": {
-                                        "type": "string",
-                                        "description": "Natural language question about IPL data"
-                                    }
-                                },
-                                "required": ["question"]
-                            }
-                        }]
+            }
+        }
+    
+    elif method is not None and method.startswith('notifications/'):
+        # Don't respond to notifications, just continue
+        return None
+    
+    elif method == 'tools/list':
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "tools": TOOLS
+            }
+        }
+    
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": -32601, "message": f"Method not found: {method}"}
+    }
+
+def valid_page_size(page_size):
+    """Whether a page_size argument is a positive JSON integer (larger ones are capped at MAX_PAGE_SIZE)."""
+    return isinstance(page_size, int) and not isinstance(page_size, bool) and page_size >= 1
+
+def call_tool(request_id, params, control=None):
+    """Run a tools/call request. Called on the worker pool."""
+    if params.get('name') == 'query_ipl_data':
+        arguments = params.get('arguments', {})
+        question = arguments.get('question', '')
+        result_format = arguments.get('format', 'text')
+        if result_format not in RESULT_FORMATTERS:
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32602, "message": f"format must be one of: {', '.join(RESULT_FORMATTERS)}"}
+            }
+        page_size = arguments.get('page_size', DEFAULT_PAGE_SIZE)
+        if not valid_page_size(page_size):
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32602, "message": "page_size must be a positive integer"}
+            }
+        trace = RequestTrace('query_ipl_data', question)
+        if control is not None:
+            trace.add("queue", trace.started - control.created)
+        sql_query, sql_params = get_sql_query(question, trace)
+        try:
+            result = execute_sql_query(sql_query, sql_params, control=control,
+                                       page_size=page_size,
+                                       cursor=arguments.get('cursor'),
+                                       include_total=bool(arguments.get('include_total', False)),
+                                       trace=trace, result_format=result_format)
+        except QueryRejected as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": e.error()
+            }
+        finally:
+            METRICS.record(trace)
+        if isinstance(result, dict):
+            # Structured content, serialized into the text block too for older clients.
+            content = {"content": [{"type": "text", "text": encode_json(result)}]}
+            if _protocol_version >= STRUCTURED_OUTPUT_VERSION:
+                content["structuredContent"] = result
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "result": content
+            }
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "content": [
+                    {
+                        "type": "text", 
+                        "text": result
                     }
-                }
-            
-            elif method == 'tools/call':
-                params = request.get('params', {})
-                if params.get('name') == 'query_ipl_data':
-                    question = params.get('arguments', {}).get('question', '')
-                    sql_query = get_sql_query(question)
-                    result = execute_sql_query(sql_query)
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {
-                            "content": [
-                                {
-                                    "type": "text", 
-                                    "text": result
-                                }
-                            ]
-                        }
+                ]
+            }
+        }
+    elif params.get('name') == 'query_ipl_data_batch':
+        arguments = params.get('arguments', {})
+        questions = arguments.get('questions')
+        if (not isinstance(questions, list) or not questions
+                or not all(isinstance(question, str) for question in questions)):
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32602, "message": "questions must be a non-empty list of strings"}
+            }
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32602, "message": f"At most {MAX_BATCH_QUESTIONS} questions per batch"}
+            }
+        page_size = arguments.get('page_size', DEFAULT_PAGE_SIZE)
+        if not valid_page_size(page_size):
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32602, "message": "page_size must be a positive integer"}
+            }
+        results = execute_batch(questions, control=control, page_size=page_size)
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "content": [
+                    {
+                        "type": "text",
+                        "text": json.dumps(results, indent=2)
                     }
-                else:
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "error": {"code": -32602, "message": f"Unknown tool: {params.get('name')}"}
+                ]
+            }
+        }
+    elif params.get('name') == 'server_stats':
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "content": [
+                    {
+                        "type": "text",
+                        "text": json.dumps(server_stats(), indent=2)
                     }
-            
-            elif method in ['resources/list', 'prompts/list']:
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {"code": -32601, "message": f"Method not found: {method}"}
-                }
-            
-            else:
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": {"code": -32601, "message": f"Method not found: {method}"}
-                }
-            
+                ]
+            }
+        }
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": -32602, "message": f"Unknown tool: {params.get('name')}"}
+    }
+
+
+if orjson is not None:
+    decode_message = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def encode_message(message):
+        """One JSON-RPC message as a newline-terminated UTF-8 line."""
+        return orjson.dumps(message, option=orjson.OPT_APPEND_NEWLINE)
+
+    def encode_json(value):
+        """Compact JSON text, for structured results embedded in a text block."""
+        return orjson.dumps(value).decode()
+else:
+    decode_message = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+    def encode_message(message):
+        """One JSON-RPC message as a newline-terminated UTF-8 line."""
+        return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+    def encode_json(value):
+        """Compact JSON text, for structured results embedded in a text block."""
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+class Dispatcher:
+    """Asyncio JSON-RPC dispatcher for the stdio transport.
+
+    Protocol methods are answered inline; tools/call runs on a bounded thread
+    pool (one worker per pooled connection) and its response is written as
+    soon as it finishes, so responses can arrive out of order, matched by id.
+    A JSON-RPC batch (2025-03-26) is answered with one array once all of its
+    requests are done.
+
+    stdin and stdout are used as binary streams. Responses produced in the
+    same event loop iteration are coalesced into a single write and flush.
+    """
+
+    def __init__(self, output=None, workers=DB_POOL_SIZE, timeout=None):
+        self.output = output if output is not None else sys.stdout.buffer
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ipl-query")
+        self.in_flight = {}
+        self._outgoing = []
+        self._flush_scheduled = False
+
+    def write(self, response):
+        self._outgoing.append(encode_message(response))
+        if self._flush_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self._flush_scheduled = True
+        loop.call_soon(self.flush)
+
+    def flush(self):
+        self._flush_scheduled = False
+        if self._outgoing:
+            data = b"".join(self._outgoing)
+            self._outgoing.clear()
+            self.output.write(data)
+            self.output.flush()
+
+    def dispatch(self, line):
+        """Handle one request line; tool calls are scheduled, not awaited."""
+        try:
+            line = line.strip()
+            if not line:
+                return
+            message = decode_message(line)
+        except JSONDecodeError:
+            return
+        if not isinstance(message, list):
+            self._dispatch_one(message, self.write)
+        elif message:
+            self._dispatch_batch(message)
+        else:
+            self.write({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": -32600, "message": "Invalid Request"}
+            })
+
+    def _dispatch_batch(self, requests):
+        """Answer a JSON-RPC batch with one array, once its tool calls finish.
+
+        Notifications get no entry; a batch of only notifications gets no
+        response at all.
+        """
+        responses = []
+        tasks = [task for task in (self._dispatch_one(request, responses.append) for request in requests)
+                 if task is not None]
+        pending = len(tasks)
+
+        def done(task):
+            nonlocal pending
+            pending -= 1
+            if not pending and responses:
+                self.write(responses)
+
+        if not tasks:
+            if responses:
+                self.write(responses)
+            return
+        for task in tasks:
+            task.add_done_callback(done)
+
+    def _dispatch_one(self, request, reply):
+        """Handle one request, passing any response to reply; returns a tool call's task."""
+        if not isinstance(request, dict):
+            reply({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": -32600, "message": "Invalid Request"}
+            })
+            return None
+        request_id = request.get('id')
+        try:
+            method = request.get('method')
+
+            if method == 'tools/call':
+                control = QueryControl(self.timeout)
+                task = asyncio.ensure_future(self._run_tool(request_id, request.get('params', {}), control, reply))
+                self.in_flight[request_id] = (task, control)
+                return task
+
+            if method == 'notifications/cancelled':
+                self.cancel(request.get('params', {}).get('requestId'))
+                return None
+
+            if method == 'notifications/initialized' and WARM_UP:
+                self.executor.submit(warm_up, lambda: bool(self.in_flight))
+                return None
+
+            response = handle_request(request)
             if response:
-                print(json.dumps(response), flush=True)
-            
-        except json.JSONDecodeError:
-            continue
+                reply(response)
+
+        except Exception as e:
+            reply({
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32603, "message": str(e)}
+            })
+        return None
+
+    def cancel(self, request_id):
+        entry = self.in_flight.get(request_id)
+        if entry is not None:
+            entry[1].cancel()
+
+    async def _run_tool(self, request_id, params, control, reply):
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self.executor, call_tool, request_id, params, control)
         except Exception as e:
-            error_response = {
+            response = {
                 "jsonrpc": "2.0",
-                "id": request_id if 'request_id' in locals() else None,
+                "id": request_id,
                 "error": {"code": -32603, "message": str(e)}
             }
-            print(json.dumps(error_response), flush=True)
+        finally:
+            self.in_flight.pop(request_id, None)
+        # A cancelled request gets no response.
+        if not control.cancelled:
+            reply(response)
+
+    async def serve(self, input_stream=None):
+        """Read request lines until EOF, then wait for in-flight tool calls.
+
+        The reader thread hands over every complete line of each chunk it
+        reads in one batch, so pipelined requests cost one event loop wakeup.
+        """
+        if input_stream is None:
+            input_stream = sys.stdin.buffer
+        loop = asyncio.get_running_loop()
+        batches = asyncio.Queue()
+        read = getattr(input_stream, "read1", input_stream.read)
+
+        def read_lines():
+            partial = b""
+            while True:
+                chunk = read(READ_CHUNK)
+                if not chunk:
+                    break
+                *lines, partial = (partial + chunk).split(b"\n")
+                if lines:
+                    loop.call_soon_threadsafe(batches.put_nowait, lines)
+            if partial:
+                loop.call_soon_threadsafe(batches.put_nowait, [partial])
+            loop.call_soon_threadsafe(batches.put_nowait, None)
+
+        threading.Thread(target=read_lines, name="ipl-stdin", daemon=True).start()
+        while True:
+            lines = await batches.get()
+            if lines is None:
+                break
+            for line in lines:
+                self.dispatch(line)
+
+        pending = [task for task, _ in self.in_flight.values()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+        self.flush()
+
+def main():
+    """Main MCP server loop with proper protocol handling."""
+    asyncio.run(Dispatcher().serve())
 
 if __name__ == "__main__":
     main()
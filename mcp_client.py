@@ -0,0 +1,149 @@
+"""Minimal JSON-RPC client for driving ipl_mcp_server.py over stdio.
+
+Used by test_server.py and benchmarks.py. The server runs as a subprocess
+with IPL_DB_FILE pointing at the database; requests can be pipelined, and
+each response is matched to its request by id and timestamped on arrival.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+SERVER_SCRIPT = str(Path(__file__).with_name("ipl_mcp_server.py"))
+PROTOCOL_VERSION = "2025-06-18"
+
+
+class _Pending:
+    __slots__ = ("sent", "received", "response", "done")
+
+    def __init__(self):
+        self.sent = time.perf_counter()
+        self.received = None
+        self.response = None
+        self.done = threading.Event()
+
+
+class StdioServerClient:
+    """ipl_mcp_server.py as a subprocess, spoken to with newline-delimited JSON-RPC."""
+
+    def __init__(self, db_file, server_script=SERVER_SCRIPT, env=None):
+        environment = dict(os.environ, IPL_DB_FILE=str(db_file), PYTHONUNBUFFERED="1")
+        environment.update(env or {})
+        self.process = subprocess.Popen([sys.executable, server_script],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        env=environment)
+        self._next_id = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._on_response = None
+        self._reader = threading.Thread(target=self._read_responses, name="mcp-client-reader", daemon=True)
+        self._reader.start()
+
+    def _read_responses(self):
+        for line in self.process.stdout:
+            received = time.perf_counter()
+            response = json.loads(line)
+            with self._lock:
+                pending = self._pending.pop(response.get("id"), None)
+            if pending is None:
+                continue
+            pending.received = received
+            pending.response = response
+            pending.done.set()
+            if self._on_response is not None:
+                self._on_response(pending)
+        # Server exited: wake anyone still waiting.
+        with self._lock:
+            stranded, self._pending = list(self._pending.values()), {}
+        for pending in stranded:
+            pending.done.set()
+
+    def _write(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        with self._write_lock:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+
+    def send(self, method, params=None):
+        """Send a request without waiting; returns its _Pending record."""
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            pending = self._pending[request_id] = _Pending()
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        pending.sent = time.perf_counter()
+        self._write(message)
+        return pending
+
+    def request(self, method, params=None, timeout=30):
+        pending = self.send(method, params)
+        if not pending.done.wait(timeout) or pending.response is None:
+            raise TimeoutError(f"No response to {method} within {timeout} s")
+        return pending.response
+
+    def notify(self, method, params=None):
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        self._write(message)
+
+    def initialize(self):
+        """The MCP handshake: initialize, then notifications/initialized."""
+        response = self.request("initialize", {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "ipl-mcp-client", "version": "1.0.0"},
+        })
+        self.notify("notifications/initialized")
+        return response
+
+    def call_tool(self, name, arguments=None, timeout=30):
+        return self.request("tools/call", {"name": name, "arguments": arguments or {}}, timeout)
+
+    def run_load(self, calls, concurrency=1, timeout=300):
+        """Pipeline tools/call requests, at most concurrency in flight.
+
+        calls is a list of (tool name, arguments). Returns (wall seconds,
+        [(call, latency seconds, response)]) in the order calls were given.
+        """
+        window = threading.Semaphore(concurrency)
+        self._on_response = lambda pending: window.release()
+        records = []
+        start = time.perf_counter()
+        try:
+            for name, arguments in calls:
+                window.acquire()
+                records.append(self.send("tools/call", {"name": name, "arguments": arguments}))
+            deadline = time.perf_counter() + timeout
+            for pending in records:
+                if not pending.done.wait(max(0.0, deadline - time.perf_counter())):
+                    raise TimeoutError("Server did not answer every request")
+        finally:
+            self._on_response = None
+        wall = time.perf_counter() - start
+        return wall, [(call, pending.received - pending.sent, pending.response)
+                      for call, pending in zip(calls, records)]
+
+    def close(self, timeout=10):
+        """Close stdin so the server drains in-flight calls and exits."""
+        if self.process.stdin and not self.process.stdin.closed:
+            self.process.stdin.close()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._reader.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,172 @@
+"""Latency histograms and request traces for the MCP server.
+
+Each query records how long its stages took (routing, SQL execute, fetch,
+formatting, ...) in a RequestTrace. Finished traces are folded into
+per-template LatencyHistograms, which use fixed log-spaced buckets, so
+recording costs one bisect and a list increment and memory does not grow
+with traffic. Traces can also be appended to a JSONL file (or stderr) for
+offline analysis.
+"""
+
+import json
+import math
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+HISTOGRAM_MIN = 1e-6      # seconds; anything faster lands in the first bucket
+HISTOGRAM_GROWTH = 1.05   # ratio between bucket bounds: percentiles are within 5%
+HISTOGRAM_BUCKETS = 400   # upper bound 1e-6 * 1.05**399, about five minutes
+
+# Upper bound of each bucket; the last bucket also takes anything slower.
+_BOUNDS = [HISTOGRAM_MIN * HISTOGRAM_GROWTH ** index for index in range(HISTOGRAM_BUCKETS - 1)]
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of durations in seconds."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile, capped at the maximum."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_BOUNDS[index], self.max) if index < len(_BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        """Count, mean and p50/p95/p99/max in milliseconds."""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1e3, 3),
+            "p95_ms": round(self.percentile(95) * 1e3, 3),
+            "p99_ms": round(self.percentile(99) * 1e3, 3),
+            "max_ms": round(self.max * 1e3, 3),
+        }
+
+
+class RequestTrace:
+    """Stage timings for one query; handed to Metrics.record when done."""
+
+    __slots__ = ("tool", "question", "template", "started", "stages", "rows", "cache_hit", "error")
+
+    def __init__(self, tool=None, question=None):
+        self.tool = tool
+        self.question = question
+        self.template = None
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.rows = 0
+        self.cache_hit = False
+        self.error = None
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self):
+        self.stages["total"] = time.perf_counter() - self.started
+
+
+class _TemplateStats:
+    __slots__ = ("stages", "requests", "rows", "cache_hits", "errors")
+
+    def __init__(self):
+        self.stages = {}
+        self.requests = 0
+        self.rows = 0
+        self.cache_hits = 0
+        self.errors = 0
+
+
+class Metrics:
+    """Per-template stage histograms, plus an optional JSONL trace.
+
+    trace_file is a path to append one JSON line per query to, "-" for
+    stderr, or None to keep only the histograms.
+    """
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self._templates = {}
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+        self._trace_out = None
+
+    def record(self, trace):
+        if "total" not in trace.stages:
+            trace.finish()
+        with self._lock:
+            stats = self._templates.get(trace.template)
+            if stats is None:
+                stats = self._templates[trace.template] = _TemplateStats()
+            stats.requests += 1
+            stats.rows += trace.rows
+            stats.cache_hits += trace.cache_hit
+            stats.errors += trace.error is not None
+            histograms = stats.stages
+            for stage, seconds in trace.stages.items():
+                histogram = histograms.get(stage)
+                if histogram is None:
+                    histogram = histograms[stage] = LatencyHistogram()
+                # LatencyHistogram.record, inlined: this runs for every stage of every request
+                histogram.counts[bisect_left(_BOUNDS, seconds)] += 1
+                histogram.count += 1
+                histogram.total += seconds
+                if seconds > histogram.max:
+                    histogram.max = seconds
+        if self.trace_file:
+            self._write_trace(trace)
+
+    def _write_trace(self, trace):
+        line = json.dumps({
+            "ts": round(time.time(), 6),
+            "tool": trace.tool,
+            "question": trace.question,
+            "template": trace.template,
+            "rows": trace.rows,
+            "cache_hit": trace.cache_hit,
+            "error": trace.error,
+            "ms": {stage: round(seconds * 1e3, 3) for stage, seconds in trace.stages.items()},
+        })
+        with self._trace_lock:
+            if self._trace_out is None:
+                self._trace_out = sys.stderr if self.trace_file == "-" else open(self.trace_file, "a", buffering=1)
+            self._trace_out.write(line + "\n")
+
+    def stats(self):
+        """{template: {requests, rows, cache_hits, errors, stages: {stage: summary}}}."""
+        with self._lock:
+            return {
+                template if template is not None else "(unmatched)": {
+                    "requests": stats.requests,
+                    "rows": stats.rows,
+                    "cache_hits": stats.cache_hits,
+                    "errors": stats.errors,
+                    "stages": {stage: histogram.summary() for stage, histogram in stats.stages.items()},
+                }
+                for template, stats in self._templates.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._templates.clear()
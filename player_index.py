@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Resident player index for the player and head-to-head questions.
+
+data_loader.py builds three tables during ingest: players (a dense integer
+ID per name), player_careers (career totals per ID) and player_matchups
+(batter x bowler totals). PlayerIndex reads them once per data generation
+into typed arrays: one array per career column, indexed by player ID, and
+the matchups in compressed sparse rows, with each batter's bowlers sorted
+in one array and the batter's slice of it given by an offsets array. A
+lookup is a dict probe for the name, then array indexing (careers) or a
+binary search within one batter's bowlers (matchups); SQLite is not
+touched.
+
+Answers have the same columns, values and row order as the query_map SQL
+for the same template. Strike rates are computed by SQLite at load time so
+they are rounded exactly as ROUND() rounds them.
+
+Usage:
+    python3 player_index.py [--db ipl_data.db] [name ...]
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from array import array
+from bisect import bisect_left
+
+# Normalized query_map questions the index answers -> PlayerIndex method
+QUESTIONS = {
+    "show me _player_ batting stats": "batting_stats",
+    "show me _player_ bowling stats": "bowling_stats",
+    "show me _player_ vs _player_ head to head": "head_to_head",
+}
+
+CAREER_COLUMNS = ("bat_matches", "runs", "balls_faced", "fours", "sixes", "highest_score", "hundreds",
+                  "bowl_matches", "balls_bowled", "overs", "runs_conceded", "wickets")
+MATCHUP_COLUMNS = ("balls", "runs", "fours", "sixes", "dismissals")
+
+BATTING_COLUMNS = ("player", "total_runs", "balls_faced", "matches_played", "strike_rate")
+BOWLING_COLUMNS = ("bowler", "wickets", "matches_bowled", "overs_bowled", "runs_conceded")
+HEAD_TO_HEAD_COLUMNS = ("batsman", "bowler", "balls", "runs", "fours", "sixes", "dismissals", "strike_rate")
+
+
+class PlayerIndex:
+    """Player names, careers and batter x bowler matchups held in arrays."""
+
+    __slots__ = ("generation", "names", "ids", "careers", "strike_rates",
+                 "matchup_offsets", "matchup_bowlers", "matchups", "matchup_strike_rates")
+
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.names = []             # player ID -> name (None for unused IDs)
+        self.ids = {}               # name -> player ID
+        self.careers = {column: array("l") for column in CAREER_COLUMNS}
+        self.strike_rates = array("d")
+        self.matchup_offsets = array("l")   # batter ID -> first row; one extra entry at the end
+        self.matchup_bowlers = array("l")
+        self.matchups = {column: array("l") for column in MATCHUP_COLUMNS}
+        self.matchup_strike_rates = array("d")
+
+    @classmethod
+    def load(cls, conn, generation=None):
+        """Read the player index tables; sqlite3.Error if the database has none."""
+        index = cls(generation)
+        size = (conn.execute("SELECT MAX(player_id) FROM players").fetchone()[0] or 0) + 1
+        index.names = [None] * size
+        for player_id, name in conn.execute("SELECT player_id, name FROM players"):
+            index.names[player_id] = name
+            index.ids[name] = player_id
+
+        for values in (*index.careers.values(), index.strike_rates):
+            values.frombytes(bytes(values.itemsize * size))
+        rows = conn.execute(f"""
+            SELECT player_id, {", ".join(CAREER_COLUMNS)},
+                   COALESCE(ROUND(CAST(runs AS FLOAT) / balls_faced * 100, 2), 0.0)
+            FROM player_careers""").fetchall()
+        if rows:
+            player_ids, *columns = zip(*rows)
+            for values, column in zip((*index.careers.values(), index.strike_rates), columns):
+                for player_id, value in zip(player_ids, column):
+                    values[player_id] = value
+
+        # Rows come in (batter, bowler) order, so each batter's bowlers are
+        # one sorted run and the offsets are running counts.
+        rows = conn.execute(f"""
+            SELECT batter_id, bowler_id, {", ".join(MATCHUP_COLUMNS)},
+                   ROUND(CAST(runs AS FLOAT) / balls * 100, 2)
+            FROM player_matchups ORDER BY batter_id, bowler_id""").fetchall()
+        offsets = [0] * (size + 1)
+        if rows:
+            batter_ids, bowler_ids, *columns, strike_rates = zip(*rows)
+            index.matchup_bowlers = array("l", bowler_ids)
+            for column, values in zip(MATCHUP_COLUMNS, columns):
+                index.matchups[column] = array("l", values)
+            index.matchup_strike_rates = array("d", strike_rates)
+            for batter_id in batter_ids:
+                offsets[batter_id + 1] += 1
+        for player_id in range(size):
+            offsets[player_id + 1] += offsets[player_id]
+        index.matchup_offsets = array("l", offsets)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def career(self, name):
+        """{column: value} of a player's career totals, or None for an unknown name."""
+        player_id = self.ids.get(name)
+        if player_id is None:
+            return None
+        return {column: values[player_id] for column, values in self.careers.items()}
+
+    def matchup_row(self, batter, bowler):
+        """Row of player_matchups for two names, or None if they never met."""
+        batter_id, bowler_id = self.ids.get(batter), self.ids.get(bowler)
+        if batter_id is None or bowler_id is None:
+            return None
+        start, end = self.matchup_offsets[batter_id], self.matchup_offsets[batter_id + 1]
+        row = bisect_left(self.matchup_bowlers, bowler_id, start, end)
+        if row == end or self.matchup_bowlers[row] != bowler_id:
+            return None
+        return row
+
+    def batting_stats(self, names):
+        careers = self.careers
+        rows = []
+        for name in sorted(set(names)):
+            player_id = self.ids.get(name)
+            if player_id is None or not careers["bat_matches"][player_id]:
+                continue
+            rows.append((name, careers["runs"][player_id], careers["balls_faced"][player_id],
+                         careers["bat_matches"][player_id], self.strike_rates[player_id]))
+        return list(BATTING_COLUMNS), rows
+
+    def bowling_stats(self, names):
+        careers = self.careers
+        rows = []
+        for name in sorted(set(names)):
+            player_id = self.ids.get(name)
+            if player_id is None or not careers["bowl_matches"][player_id]:
+                continue
+            rows.append((name, careers["wickets"][player_id], careers["bowl_matches"][player_id],
+                         careers["overs"][player_id], careers["runs_conceded"][player_id]))
+        return list(BOWLING_COLUMNS), rows
+
+    def head_to_head(self, batters, bowlers):
+        """Every matchup between a batter and a bowler named, most balls first."""
+        matchups = self.matchups
+        rows = []
+        for batter in set(batters):
+            for bowler in set(bowlers):
+                row = self.matchup_row(batter, bowler)
+                if row is None:
+                    continue
+                rows.append((batter, bowler, *(matchups[column][row] for column in MATCHUP_COLUMNS),
+                             self.matchup_strike_rates[row]))
+        rows.sort(key=lambda row: (-row[2], row[0], row[1]))
+        return list(HEAD_TO_HEAD_COLUMNS), rows
+
+    def query(self, question, params):
+        """(column_names, rows) for a QUESTIONS template and its bound params.
+
+        params are the template's SQL parameters; each is a JSON list of
+        player names.
+        """
+        return getattr(self, QUESTIONS[question])(*(json.loads(param) for param in params))
+
+    def memory_bytes(self):
+        """Approximate resident size: the arrays, the names and the name -> ID dict."""
+        arrays = [*self.careers.values(), self.strike_rates, self.matchup_offsets, self.matchup_bowlers,
+                  *self.matchups.values(), self.matchup_strike_rates]
+        total = sum(values.buffer_info()[1] * values.itemsize for values in arrays)
+        total += sys.getsizeof(self.names) + sys.getsizeof(self.ids)
+        total += sum(sys.getsizeof(name) for name in self.ids)
+        return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the player index and look players up in it.")
+    parser.add_argument("--db", default="ipl_data.db", help="SQLite database file")
+    parser.add_argument("names", nargs="*", help="player names to look up")
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db)
+    start = time.perf_counter()
+    index = PlayerIndex.load(conn)
+    print(f"{len(index)} players, {len(index.matchup_bowlers)} matchups, "
+          f"{index.memory_bytes() / 1024:.0f} KiB, loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for name in args.names:
+        print(name, index.career(name))
+    conn.close()
+
+if __name__ == "__main__":
+    main()
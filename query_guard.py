@@ -0,0 +1,260 @@
+"""Cost estimates, limits and admission control for the server's SQL.
+
+Before a template runs, CostModel reads its EXPLAIN QUERY PLAN and turns it
+into an estimate of the rows SQLite will visit: a SCAN visits the whole
+table, a SEARCH visits the average number of rows per key of the index it
+uses (from the index_stats table data_loader.py samples with ANALYZE), and
+nested loops multiply. Estimates are rough, within an order of magnitude
+or so, but enough to tell a lookup from a full pass over the deliveries.
+
+The server refuses plans estimated above a hard ceiling, runs queries
+estimated as heavy only while an AdmissionControl slot is free, and stops
+any query that exceeds its VM-step budget. Every refusal is a
+QueryRejected carrying a JSON-RPC error code, message and data.
+"""
+
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# JSON-RPC error codes, from the range reserved for implementation-defined server errors
+QUERY_TOO_EXPENSIVE = -32001   # estimated cost above the ceiling; never run
+SERVER_BUSY = -32002           # every heavy query slot is taken; retry later
+QUERY_ABORTED = -32003         # stopped while running: step budget or timeout
+RESULT_TOO_LARGE = -32004      # the formatted page is over the byte cap
+
+# Estimation heuristics
+VIRTUAL_TABLE_ROWS = 10        # rows assumed for json_each() and other table-valued functions
+EQUALITY_SELECTIVITY = 10      # without index statistics, each equality keeps 1/10 of the rows
+RANGE_SELECTIVITY = 4          # each range-constrained column keeps 1/4 of the rows, as SQLite assumes
+
+_SQL_WORDS = frozenset("""
+    where join on using left right full inner outer cross natural group order limit
+    union except intersect as select values
+""".split())
+_TABLE_REF_RE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_LOOP_RE = re.compile(r"^(SCAN|SEARCH) (\S+)")
+_INDEX_RE = re.compile(r"USING (?:COVERING )?INDEX (\S+)")
+_CONSTRAINTS_RE = re.compile(r"\(([^()]*)\)$")
+
+
+class QueryRejected(Exception):
+    """A query refused or stopped by the guard, carrying its JSON-RPC error."""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.data = data or {}
+
+    def error(self):
+        """The JSON-RPC error object: {"code", "message", "data"}."""
+        return {"code": self.code, "message": str(self), "data": self.data}
+
+
+class IndexInfo:
+    """What the estimator needs to know about one index."""
+
+    __slots__ = ("table", "unique", "columns", "averages")
+
+    def __init__(self, table, unique, columns, averages=()):
+        self.table = table
+        self.unique = unique
+        self.columns = columns
+        self.averages = averages   # average rows per distinct value of the first 1, 2, ... columns
+
+
+def _stat_numbers(stat):
+    """Leading integers of a sqlite_stat1 stat string ("nRow avg1 avg2 ... unordered sz=...")."""
+    numbers = []
+    for field in stat.split():
+        if not field.isdigit():
+            break
+        numbers.append(int(field))
+    return numbers
+
+
+def table_aliases(sql):
+    """{name used in the plan: table} for the FROM and JOIN clauses of a query."""
+    aliases = {}
+    for table, alias in _TABLE_REF_RE.findall(sql):
+        aliases.setdefault(table, table)
+        if alias and alias.lower() not in _SQL_WORDS:
+            aliases[alias] = table
+    return aliases
+
+
+class CostModel:
+    """Table sizes and index shapes of one data generation, and plan estimates over them."""
+
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.tables = {}           # table -> rows
+        self.indexes = {}          # index name -> IndexInfo
+        self.primary_keys = {}     # WITHOUT ROWID table -> IndexInfo of its primary key
+        self._estimates = {}       # SQL text -> estimated rows visited
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, conn, generation=None):
+        """Read sizes from index_stats; tables it does not cover are counted."""
+        model = cls(generation)
+        tables = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        stats = {}
+        try:
+            for table, index, stat in conn.execute("SELECT tbl, idx, stat FROM index_stats"):
+                numbers = _stat_numbers(stat)
+                if numbers and table in tables:
+                    stats[index or table] = numbers
+                    model.tables[table] = max(model.tables.get(table, 0), numbers[0])
+        except sqlite3.OperationalError:
+            pass  # loaded before index_stats existed: fall back to default selectivity
+        for table in tables:
+            if table not in model.tables:
+                model.tables[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            for _, index, unique, origin, _ in conn.execute(f'PRAGMA index_list("{table}")'):
+                columns = len(conn.execute(f'PRAGMA index_info("{index}")').fetchall())
+                # ANALYZE files a WITHOUT ROWID table's primary key under the table's name.
+                averages = stats.get(index) or (stats.get(table) if origin == "pk" else None) or []
+                info = IndexInfo(table, bool(unique), columns, tuple(averages[1:]))
+                model.indexes[index] = info
+                if origin == "pk":
+                    model.primary_keys[table] = info
+        return model
+
+    def estimate(self, conn, sql, params=()):
+        """Estimated rows visited by sql, cached per SQL text.
+
+        Plans depend on the SQL and the schema, not on the parameter
+        values, so params are only bound to make EXPLAIN accept them.
+        """
+        cost = self._estimates.get(sql)
+        if cost is None:
+            plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            cost = self.plan_cost(plan, table_aliases(sql))
+            with self._lock:
+                self._estimates[sql] = cost
+        return cost
+
+    def plan_cost(self, plan, aliases=None):
+        """Estimated rows visited for EXPLAIN QUERY PLAN rows (id, parent, notused, detail)."""
+        children = {}
+        for node, parent, _, detail in plan:
+            children.setdefault(parent, []).append((node, detail))
+        cost, _ = self._subtree(children, 0, aliases or {}, {})
+        return round(cost)
+
+    def _subtree(self, children, parent, aliases, derived):
+        """(rows visited, rows produced) of the plan nodes under parent.
+
+        The loops of one level nest in plan order, so each loop runs once
+        per row of the loops before it. IN (...) lists are charged to the
+        whole level, since the plan does not say which loop they feed.
+        """
+        cost = 0.0
+        rows = 1.0
+        lists = 1.0
+        for node, detail in children.get(parent, ()):
+            loop = _LOOP_RE.match(detail)
+            if loop:
+                rows *= self._fanout(loop.group(2), detail, aliases, derived)
+                cost += rows * lists
+            elif detail.startswith(("CO-ROUTINE ", "MATERIALIZE ")):
+                sub_cost, sub_rows = self._subtree(children, node, aliases, derived)
+                derived[detail.split(" ", 1)[1]] = sub_rows
+                cost += sub_cost
+            elif detail.startswith("LIST SUBQUERY"):
+                sub_cost, sub_rows = self._subtree(children, node, aliases, derived)
+                cost += sub_cost
+                lists *= sub_rows
+            elif detail.startswith(("SCALAR SUBQUERY", "CORRELATED")):
+                sub_cost, _ = self._subtree(children, node, aliases, derived)
+                cost += sub_cost * (rows * lists if detail.startswith("CORRELATED") else 1)
+            elif detail == "MULTI-INDEX OR" or detail.startswith("COMPOUND"):
+                # Branches run one after another and their rows add up.
+                branch_rows = 0.0
+                for branch, _ in children.get(node, ()):
+                    sub_cost, sub_rows = self._subtree(children, branch, aliases, derived)
+                    cost += sub_cost * rows * lists
+                    branch_rows += sub_rows
+                rows *= branch_rows
+            elif detail.startswith("USE TEMP B-TREE"):
+                cost += rows * lists   # every row goes through the sorter once
+            else:
+                sub_cost, _ = self._subtree(children, node, aliases, derived)
+                cost += sub_cost
+        return cost, rows * lists
+
+    def _fanout(self, name, detail, aliases, derived):
+        """Rows one SCAN or SEARCH step visits each time it runs."""
+        if "VIRTUAL TABLE" in detail:
+            return VIRTUAL_TABLE_ROWS
+        if name == "CONSTANT":
+            return 1
+        index_match = _INDEX_RE.search(detail)
+        info = self.indexes.get(index_match.group(1)) if index_match else None
+        table = info.table if info is not None else aliases.get(name, name)
+        if table in self.tables:
+            rows = self.tables[table]
+        else:
+            rows = derived.get(name, VIRTUAL_TABLE_ROWS)
+        if detail.startswith("SCAN"):
+            return max(rows, 1)
+
+        constraints = _CONSTRAINTS_RE.search(detail)
+        equalities, ranges = 0, set()
+        for term in (constraints.group(1).split(" AND ") if constraints else ()):
+            if "=?" in term and not term.endswith((">=?", "<=?")):
+                equalities += 1
+            else:
+                ranges.add(re.split(r"[<>=]", term, 1)[0])
+        if "INTEGER PRIMARY KEY" in detail:
+            fanout = 1 if equalities else rows
+        else:
+            if info is None and "PRIMARY KEY" in detail:
+                info = self.primary_keys.get(table)
+            if info is not None and info.unique and equalities >= info.columns:
+                fanout = 1
+            elif info is not None and equalities and info.averages:
+                fanout = info.averages[min(equalities, len(info.averages)) - 1]
+            else:
+                fanout = rows / EQUALITY_SELECTIVITY ** equalities
+        return max(fanout / RANGE_SELECTIVITY ** len(ranges), 1)
+
+
+class AdmissionControl:
+    """Bounds how many heavy queries run at once.
+
+    Over the limit a heavy query is turned away with SERVER_BUSY rather
+    than queued, so a waiting query never holds one of the pool's
+    connections while the lookups behind it could use it.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self.admitted = 0
+        self.turned_away = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, cost):
+        with self._lock:
+            if self.running >= self.limit:
+                self.turned_away += 1
+                raise QueryRejected(SERVER_BUSY, "Server busy: too many expensive queries running, retry shortly",
+                                    {"reason": "busy", "estimated_cost": cost, "running": self.running,
+                                     "limit": self.limit})
+            self.running += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"limit": self.limit, "running": self.running, "admitted": self.admitted,
+                    "turned_away": self.turned_away}
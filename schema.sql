@@ -1,16 +1,17 @@
--- This script creates the tables for the IPL data analysis project.
--- It is designed to be run on an SQLite database.
-
--- Drop tables if they already exist to ensure a fresh start.
-DROP TABLE IF EXISTS matches;
-DROP TABLE IF EXISTS deliveries;
+-- Canonical schema for the IPL data analysis project.
+-- data_loader.py creates the database from this file and the query templates
+-- in ipl_mcp_server.py are written against it. It is designed to be run on an
+-- SQLite database and is safe to re-run: every statement is IF NOT EXISTS.
+-- The summary tables (batter_match_stats, innings_totals, ...) are derived
+-- from these tables by data_loader.py.
 
 -- Create the 'matches' table to store high-level information about each match.
-CREATE TABLE matches (
+-- match_id is the cricsheet match ID (the JSON file name).
+CREATE TABLE IF NOT EXISTS matches (
     match_id INTEGER PRIMARY KEY,
     city TEXT,
     venue TEXT,
-    match_date DATE,
+    match_date TEXT,
     team1 TEXT,
     team2 TEXT,
     toss_winner TEXT,
@@ -21,9 +22,20 @@ CREATE TABLE matches (
     player_of_match TEXT
 );
 
+-- One row per innings, numbered from 1 in the order cricsheet lists them.
+CREATE TABLE IF NOT EXISTS innings (
+    match_id INTEGER,
+    inning INTEGER,
+    team_batting TEXT,
+    total_runs INTEGER,
+    total_wickets INTEGER,
+    PRIMARY KEY (match_id, inning),
+    FOREIGN KEY (match_id) REFERENCES matches (match_id)
+);
+
 -- Create the 'deliveries' table for ball-by-ball data.
-CREATE TABLE deliveries (
-    delivery_id INTEGER PRIMARY KEY AUTOINCREMENT,
+CREATE TABLE IF NOT EXISTS deliveries (
+    delivery_id INTEGER PRIMARY KEY,
     match_id INTEGER,
     inning INTEGER,
     over INTEGER,
@@ -34,14 +46,72 @@ CREATE TABLE deliveries (
     runs_scored INTEGER,
     extra_runs INTEGER,
     total_runs INTEGER,
+    is_four INTEGER,
+    is_six INTEGER,
     wicket_kind TEXT,
     player_out TEXT,
-    FOREIGN KEY (match_id) REFERENCES matches (match_id)
+    FOREIGN KEY (match_id, inning) REFERENCES innings (match_id, inning)
 );
 
+-- One row per ingested cricsheet file, used to skip unchanged files.
+CREATE TABLE IF NOT EXISTS ingested_files (
+    match_id INTEGER PRIMARY KEY,
+    file_name TEXT,
+    file_size INTEGER,
+    sha256 TEXT,
+    ingested_at TEXT
+);
+
+-- Player index, built by data_loader.py after the summary tables: a dense
+-- integer ID per player name plus career and batter x bowler rollups keyed by
+-- it. The server keeps these resident in memory (player_index.py).
+CREATE TABLE IF NOT EXISTS players (
+    player_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+-- One row per player. Batting columns come from batter_match_stats and
+-- bowling columns from bowler_match_stats, zero where the player never did either.
+CREATE TABLE IF NOT EXISTS player_careers (
+    player_id INTEGER PRIMARY KEY,
+    bat_matches INTEGER,
+    runs INTEGER,
+    balls_faced INTEGER,
+    fours INTEGER,
+    sixes INTEGER,
+    highest_score INTEGER,
+    hundreds INTEGER,
+    bowl_matches INTEGER,
+    balls_bowled INTEGER,
+    overs INTEGER,
+    runs_conceded INTEGER,
+    wickets INTEGER
+);
+
+-- One row per batter and bowler who faced each other. Dismissals count
+-- only the kinds credited to the bowler.
+CREATE TABLE IF NOT EXISTS player_matchups (
+    batter_id INTEGER,
+    bowler_id INTEGER,
+    balls INTEGER,
+    runs INTEGER,
+    fours INTEGER,
+    sixes INTEGER,
+    dismissals INTEGER,
+    PRIMARY KEY (batter_id, bowler_id)
+) WITHOUT ROWID;
+
 -- Create indexes for faster queries.
-CREATE INDEX idx_matches_winner ON matches (winner);
-CREATE INDEX idx_matches_venue ON matches (venue);
-CREATE INDEX idx_deliveries_batsman ON deliveries (batsman);
-CREATE INDEX idx_deliveries_bowler ON deliveries (bowler);
-CREATE INDEX idx_deliveries_match_id ON deliveries (match_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_matches_winner ON matches (winner);
+CREATE INDEX IF NOT EXISTS idx_matches_venue ON matches (venue);
+CREATE INDEX IF NOT EXISTS idx_matches_city ON matches (city);
+CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (match_date, match_id);
+-- Matches by team, for either side.
+CREATE INDEX IF NOT EXISTS idx_matches_team1 ON matches (team1);
+CREATE INDEX IF NOT EXISTS idx_matches_team2 ON matches (team2);
+-- Per-innings and powerplay totals: covers match_id/inning/over filters and total_runs.
+CREATE INDEX IF NOT EXISTS idx_deliveries_match_inning_over ON deliveries (match_id, inning, over, total_runs);
+-- Per-batter aggregates.
+CREATE INDEX IF NOT EXISTS idx_deliveries_batsman ON deliveries (batsman, match_id, runs_scored);
+-- Wicket counts per bowler.
+CREATE INDEX IF NOT EXISTS idx_deliveries_bowler_wicket ON deliveries (bowler, wicket_kind);
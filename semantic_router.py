@@ -0,0 +1,254 @@
+"""Offline semantic routing of questions to query templates.
+
+Each template key and its paraphrases become TF-IDF vectors over word,
+word-bigram and character n-gram features, after light stemming and
+synonym folding ("dismissals" -> wicket, "ground" -> venue). The vectors
+form one NumPy matrix with a row per feature and a column per paraphrase.
+A question is scored against every paraphrase with a single vector-matrix
+product over the features it contains, and each template's score is its
+best paraphrase's cosine similarity. NumPy is optional: without it
+AVAILABLE is False and the server keeps its word-overlap fallback.
+"""
+
+import math
+import re
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+AVAILABLE = np is not None
+
+CHAR_NGRAMS = (3, 4)
+# Relative weight of each feature kind in the vectors
+FEATURE_WEIGHTS = {"w": 1.0, "b": 0.6, "c": 0.35}
+DEFAULT_THRESHOLD = 0.2   # minimum cosine similarity for a match
+
+_TOKEN_RE = re.compile(r"_[a-z]+_|[a-z0-9]+")
+
+# Function words carry no routing signal; they are dropped before featurizing
+STOP_WORDS = frozenset("""
+    a an the of in on at by for to and or is are was were be been has have had do does did
+    what what's whats which who whom how where when me my i you your we us can could would please
+    there s it its this that these those show tell give list display find
+""".split())
+
+# Words folded onto one canonical form before stemming
+SYNONYMS = {
+    "dismissals": "wickets", "dismissal": "wickets", "scalps": "wickets", "wkts": "wickets",
+    "ground": "venue", "grounds": "venue", "stadium": "venue", "stadiums": "venue",
+    "venues": "venue", "city": "venue", "cities": "venue",
+    "batter": "batsman", "batters": "batsman", "batsmen": "batsman", "hitter": "batsman",
+    "bowlers": "bowler",
+    "hundreds": "centuries", "hundred": "centuries", "tons": "centuries", "ton": "centuries",
+    "100s": "centuries", "century": "centuries",
+    "games": "matches", "game": "matches", "fixtures": "matches", "fixture": "matches",
+    "side": "team", "sides": "team", "franchise": "team", "franchises": "team", "teams": "team",
+    "victories": "won", "victory": "won", "wins": "won", "win": "won", "winning": "won",
+    "biggest": "highest", "largest": "highest", "top": "most", "maximum": "most",
+    "total": "score", "totals": "score", "mean": "average", "avg": "average", "typical": "average",
+    "chases": "chase", "chasing": "chase", "pursuit": "chase",
+    "statistics": "stats", "record": "stats", "numbers": "stats",
+    "spell": "figures", "spells": "figures",
+    "opening": "powerplay", "pp": "powerplay",
+    "every": "all",
+}
+
+# Hand-written paraphrases of each template key; questions are matched
+# after names have been masked with slot tokens, so paraphrases use them too.
+PARAPHRASES = {
+    "show me all matches in the dataset": [
+        "list every match", "all games in the data", "show the match list",
+        "what matches are there", "recent matches",
+    ],
+    "which team won the most matches": [
+        "most successful team", "team with the most wins", "who has won the most games",
+        "which side has the most victories", "best team by wins",
+    ],
+    "what was the highest total score": [
+        "biggest team total", "highest innings total", "largest score in an innings",
+        "top team scores", "what is the highest score ever",
+    ],
+    "show matches played in _venue_": [
+        "games at _venue_", "fixtures held in _venue_", "matches hosted at _venue_",
+        "what matches were played at _venue_",
+    ],
+    "show matches played by _team_": [
+        "games played by _team_", "_team_ fixtures", "list _team_ games",
+        "which matches did _team_ play",
+    ],
+    "show matches played in _season_": [
+        "games in _season_", "_season_ fixtures", "matches from the _season_ season",
+        "list the _season_ games",
+    ],
+    "which team won the most matches in _season_": [
+        "most wins in _season_", "best team of _season_", "who won the most games in _season_",
+        "_season_ most successful side",
+    ],
+    "who scored the most runs across all matches": [
+        "leading run scorer", "top run getters", "which batsman has the most runs",
+        "highest run scorers overall", "who made the most runs",
+    ],
+    "which bowler took the most wickets": [
+        "leading wicket taker", "top wicket takers", "most dismissals by a bowler",
+        "who has taken the most wickets", "highest wicket taker",
+    ],
+    "show me _player_ batting stats": [
+        "how many runs has _player_ scored", "_player_ batting record", "_player_ runs and strike rate",
+        "how did _player_ bat", "_player_ batting numbers",
+    ],
+    "show me _player_ bowling stats": [
+        "how many wickets has _player_ taken", "_player_ bowling record", "_player_ economy rate",
+        "how did _player_ bowl", "_player_ wickets",
+    ],
+    "show me _player_ vs _player_ head to head": [
+        "_player_ against _player_", "how did _player_ fare against _player_",
+        "_player_ versus _player_ record", "head to head between _player_ and _player_",
+        "how many times did _player_ dismiss _player_",
+    ],
+    "who has the best bowling figures in a single match": [
+        "best bowling spell", "best figures in a match", "most wickets in one match",
+        "best single match bowling performance", "best bowling performance in a game",
+    ],
+    "what's the average first innings score": [
+        "average score batting first", "mean first innings total", "typical first innings score",
+        "par score batting first", "average first innings total",
+    ],
+    "which venue has the highest scoring matches": [
+        "highest scoring ground", "best venue for batting", "which stadium has the most runs",
+        "venue with the highest average total", "most runs scored at which ground",
+    ],
+    "show me all centuries scored": [
+        "list of hundreds", "who scored a century", "all 100s", "centuries by batsmen",
+        "every hundred scored",
+    ],
+    "show me the most successful chase targets": [
+        "highest successful run chase", "biggest target chased down", "best chases",
+        "highest total chased", "successful chases",
+    ],
+    "which team has the best powerplay performance": [
+        "best powerplay team", "most runs in the powerplay", "powerplay scoring by team",
+        "which side scores fastest in the first six overs", "best start in the first 6 overs",
+    ],
+    "which team scored the most runs in _overs_": [
+        "most runs in _overs_", "best team in _overs_", "who scores fastest in _overs_",
+        "team runs in _overs_",
+    ],
+}
+
+
+def stem(word):
+    """Fold a word onto its synonym, then strip common English suffixes."""
+    word = SYNONYMS.get(word, word)
+    if word.startswith("_") or len(word) <= 3:
+        return word
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:len(word) - len(suffix)] + replacement
+            break
+    # "score", "scored" and "scoring" all end up as "scor"
+    return word[:-1] if word.endswith("e") and len(word) > 4 else word
+
+
+def features(text):
+    """{feature: count} for a normalized question: words, word bigrams and char n-grams."""
+    words = [stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+    counts = {}
+    for word in words:
+        key = "w:" + word
+        counts[key] = counts.get(key, 0) + 1
+        if word.startswith("_"):
+            continue
+        padded = f" {word} "
+        for size in CHAR_NGRAMS:
+            for start in range(len(padded) - size + 1):
+                key = "c:" + padded[start:start + size]
+                counts[key] = counts.get(key, 0) + 1
+    for first, second in zip(words, words[1:]):
+        key = f"b:{first} {second}"
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+class SemanticRouter:
+    """Cosine similarity between a question and every template paraphrase.
+
+    documents is a list of (template, text); templates keep their
+    first-seen order, which also breaks ties.
+    """
+
+    def __init__(self, documents, threshold=DEFAULT_THRESHOLD):
+        if np is None:
+            raise RuntimeError("SemanticRouter needs NumPy")
+        self.threshold = threshold
+        self.templates = list(dict.fromkeys(template for template, _ in documents))
+        positions = {template: position for position, template in enumerate(self.templates)}
+        # Columns grouped by template so per-template maxima are one reduceat.
+        documents = sorted(documents, key=lambda document: positions[document[0]])
+        self.document_templates = np.array([positions[template] for template, _ in documents])
+        self._group_starts = np.flatnonzero(np.r_[True, np.diff(self.document_templates) != 0])
+
+        counts = [features(text) for _, text in documents]
+        document_frequency = {}
+        for document in counts:
+            for feature in document:
+                document_frequency[feature] = document_frequency.get(feature, 0) + 1
+        total = len(counts)
+        self._index = {feature: row for row, feature in enumerate(document_frequency)}
+        self._idf = {feature: math.log((1 + total) / (1 + frequency)) + 1
+                     for feature, frequency in document_frequency.items()}
+        self._unseen_idf = math.log(1 + total) + 1
+
+        self.matrix = np.zeros((len(self._index), total), dtype=np.float32)
+        for column, document in enumerate(counts):
+            rows, weights = self._weights(document)
+            self.matrix[rows, column] = weights / np.linalg.norm(weights)
+
+    @classmethod
+    def for_templates(cls, templates, paraphrases=PARAPHRASES, threshold=DEFAULT_THRESHOLD):
+        """A router over template keys (each its own first paraphrase) plus their paraphrases."""
+        documents = []
+        for template in templates:
+            documents.append((template, template))
+            documents.extend((template, text) for text in paraphrases.get(template, ()))
+        return cls(documents, threshold)
+
+    def _weights(self, counts):
+        rows = np.array([self._index.get(feature, -1) for feature in counts])
+        weights = np.array([FEATURE_WEIGHTS[feature[0]] * (1 + math.log(count))
+                            * self._idf.get(feature, self._unseen_idf)
+                            for feature, count in counts.items()], dtype=np.float32)
+        return rows, weights
+
+    def scores(self, question):
+        """Best cosine similarity per template, in self.templates order."""
+        counts = features(question)
+        if not counts:
+            return np.zeros(len(self.templates), dtype=np.float32)
+        rows, weights = self._weights(counts)
+        # Features the templates never use still count towards the question's norm.
+        weights /= np.linalg.norm(weights)
+        known = rows >= 0
+        similarity = weights[known] @ self.matrix[rows[known]]
+        return np.maximum.reduceat(similarity, self._group_starts)
+
+    def mask(self, templates):
+        """Boolean array over self.templates, true for the given ones; for match(eligible=...)."""
+        allowed = set(templates)
+        return np.array([template in allowed for template in self.templates])
+
+    def match(self, question, eligible=None):
+        """(template, confidence) for the best-scoring template, or (None, confidence).
+
+        eligible is an optional boolean array over self.templates; other
+        templates are never returned. Confidence is the cosine similarity.
+        """
+        scores = self.scores(question)
+        if eligible is not None:
+            scores = np.where(eligible, scores, -1.0)
+        best = int(np.argmax(scores))
+        confidence = float(scores[best])
+        if confidence < self.threshold:
+            return None, max(confidence, 0.0)
+        return self.templates[best], confidence
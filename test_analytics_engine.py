@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import analytics_engine
+import data_loader
+import ipl_mcp_server as server
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    db_file = tmp_path_factory.mktemp("columnar") / "ipl.db"
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    conn = sqlite3.connect(db_file)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def engine(conn):
+    return analytics_engine.ColumnarEngine.from_connection(conn)
+
+
+@pytest.mark.parametrize("question", list(analytics_engine.QUESTIONS))
+def test_engine_matches_sql(conn, engine, question):
+    cursor = conn.execute(server.QUERY_MAP[question])
+    column_names = [description[0] for description in cursor.description]
+    assert engine.query(question) == (column_names, cursor.fetchall())
+
+
+def test_saved_columns_are_memory_mapped(tmp_path, engine):
+    engine.save(tmp_path)
+    loaded = analytics_engine.ColumnarEngine.load(tmp_path, engine.generation)
+    assert isinstance(loaded.d_batsman, np.memmap)
+    assert loaded.d_over.dtype == np.int8
+    for question in analytics_engine.QUESTIONS:
+        assert loaded.query(question) == engine.query(question)
+    assert analytics_engine.ColumnarEngine.load(tmp_path, engine.generation + 1) is None
+
+
+def test_sql_round_matches_sqlite(conn):
+    values = [i / 7 * 100 for i in range(1, 400)] + [0.125, 1.005, 2.675, 146.455]
+    for value in values:
+        assert analytics_engine.sql_round(value, 2) == conn.execute("SELECT ROUND(?, 2)", (value,)).fetchone()[0]
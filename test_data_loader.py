@@ -0,0 +1,220 @@
+import io
+import json
+import shutil
+import sqlite3
+import sys
+import tarfile
+import zipfile
+from pathlib import Path
+
+import data_loader
+
+DATA_TABLES = ["matches", "innings", "deliveries"] + list(data_loader.SUMMARY_TABLES)
+
+
+def dump_database(db_file):
+    """Every data table's rows, plus the manifest without its load timestamp."""
+    conn = sqlite3.connect(db_file)
+    dump = {table: conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+            for table in DATA_TABLES}
+    dump["ingested_files"] = conn.execute(
+        "SELECT match_id, file_name, file_size, sha256 FROM ingested_files ORDER BY match_id").fetchall()
+    conn.close()
+    return dump
+
+
+def test_worker_count_does_not_change_database(tmp_path):
+    serial_db = tmp_path / "serial.db"
+    parallel_db = tmp_path / "parallel.db"
+
+    data_loader.load_data(str(serial_db), data_loader.DATA_DIR, workers=1)
+    data_loader.load_data(str(parallel_db), data_loader.DATA_DIR, workers=3)
+
+    serial = dump_database(serial_db)
+    assert serial["deliveries"]
+    assert serial == dump_database(parallel_db)
+
+
+def test_full_load_publishes_a_new_snapshot(tmp_path):
+    db_file = tmp_path / "ipl.db"
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    reader = sqlite3.connect(db_file)
+    matches = reader.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    assert db_file.resolve().name == "ipl.g2.db"
+    assert data_loader.read_generation(str(db_file)) == 2
+    # A connection opened before the reload keeps reading its own snapshot.
+    assert reader.execute("SELECT COUNT(*) FROM matches").fetchone()[0] == matches
+    assert reader.execute("PRAGMA user_version").fetchone()[0] == 1
+    reader.close()
+
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["ipl.db", "ipl.g2.db", "ipl.g3.db"]
+
+
+def table_contents(db_file):
+    """Every data table's rows without the delivery_id surrogate key, sorted.
+
+    An incremental load renumbers the deliveries of the matches it
+    replaces, so rows are compared by their natural columns only.
+    """
+    conn = sqlite3.connect(db_file)
+    contents = {}
+    for table in DATA_TABLES:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != "delivery_id"]
+        order = ", ".join(str(position) for position in range(1, len(columns) + 1))
+        contents[table] = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order}").fetchall()
+    conn.close()
+    return contents
+
+
+def test_incremental_load_matches_a_full_load(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    sources = sorted(Path(data_loader.DATA_DIR).glob("*.json"))
+    for source in sources[:-1]:
+        shutil.copy(source, data_dir)
+    incremental_db = tmp_path / "incremental.db"
+    data_loader.load_data(str(incremental_db), str(data_dir))
+
+    # One new match, and one already loaded match moved to another venue and
+    # rescored, so its old venue, team and batter aggregates must shrink.
+    shutil.copy(sources[-1], data_dir)
+    changed = data_dir / sources[0].name
+    match = json.loads(changed.read_text())
+    match["info"]["venue"] = "A New Ground"
+    delivery = match["innings"][0]["overs"][0]["deliveries"][0]
+    delivery["runs"] = {"batter": 6, "extras": 0, "total": 6}
+    changed.write_text(json.dumps(match))
+    data_loader.load_data(str(incremental_db), str(data_dir), incremental=True)
+
+    full_db = tmp_path / "full.db"
+    data_loader.load_data(str(full_db), str(data_dir))
+    expected = table_contents(full_db)
+    assert any(row[2] == "A New Ground" for row in expected["matches"])
+    assert table_contents(incremental_db) == expected
+
+
+def player_index(db_file):
+    """Careers and matchups keyed by player name, so player IDs can differ."""
+    conn = sqlite3.connect(db_file)
+    careers = conn.execute("""
+        SELECT p.name, c.* FROM player_careers c JOIN players p USING (player_id)
+        WHERE c.bat_matches + c.bowl_matches > 0""").fetchall()
+    matchups = conn.execute("""
+        SELECT batter.name, bowler.name, m.balls, m.runs, m.fours, m.sixes, m.dismissals
+        FROM player_matchups m
+        JOIN players batter ON batter.player_id = m.batter_id
+        JOIN players bowler ON bowler.player_id = m.bowler_id""").fetchall()
+    conn.close()
+    return sorted(row[:1] + row[2:] for row in careers), sorted(matchups)
+
+
+def test_incremental_load_keeps_player_index_current(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    sources = sorted(Path(data_loader.DATA_DIR).glob("*.json"))
+    for source in sources[:-3]:
+        shutil.copy(source, data_dir)
+    incremental_db = tmp_path / "incremental.db"
+    data_loader.load_data(str(incremental_db), str(data_dir))
+
+    # Three new matches, and one already loaded match rewritten with a different bowler.
+    for source in sources[-3:]:
+        shutil.copy(source, data_dir)
+    changed = data_dir / sources[0].name
+    match = json.loads(changed.read_text())
+    over = match["innings"][0]["overs"][0]
+    for delivery in over["deliveries"]:
+        delivery["bowler"] = "A Newcomer"
+    changed.write_text(json.dumps(match))
+    data_loader.load_data(str(incremental_db), str(data_dir), incremental=True)
+
+    full_db = tmp_path / "full.db"
+    data_loader.load_data(str(full_db), str(data_dir))
+    careers, matchups = player_index(full_db)
+    assert any(bowler == "A Newcomer" for _, bowler, *_ in matchups)
+    assert player_index(incremental_db) == (careers, matchups)
+
+
+def test_archives_and_streams_load_like_the_directory(tmp_path, monkeypatch):
+    sources = sorted(Path(data_loader.DATA_DIR).glob("*.json"))
+    archive = tmp_path / "ipl_json.zip"
+    with zipfile.ZipFile(archive, "w") as f:
+        for source in sources:
+            f.write(source, f"ipl_json/{source.name}")
+    tar_stream = io.BytesIO()
+    with tarfile.open(fileobj=tar_stream, mode="w:gz") as f:
+        for source in sources:
+            f.add(source, source.name)
+    jsonl = b"".join(json.dumps(dict(json.loads(source.read_text()), match_id=int(source.stem))).encode() + b"\n"
+                     for source in sources)
+
+    expected = tmp_path / "directory.db"
+    data_loader.load_data(str(expected), data_loader.DATA_DIR)
+    expected = dump_database(expected)
+
+    data_loader.load_data(str(tmp_path / "zip.db"), str(archive))
+    assert dump_database(tmp_path / "zip.db") == expected
+    for name, data in (("tar", tar_stream.getvalue()), ("jsonl", jsonl)):
+        monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BufferedReader(io.BytesIO(data))))
+        data_loader.load_data(str(tmp_path / f"{name}.db"), "-")
+        dump = dump_database(tmp_path / f"{name}.db")
+        if name == "jsonl":
+            # JSONL lines are re-serialized matches named by line number.
+            assert [row[0] for row in dump.pop("ingested_files")] == [row[0] for row in expected["ingested_files"]]
+            assert dump == {table: rows for table, rows in expected.items() if table != "ingested_files"}
+        else:
+            assert dump == expected
+
+    # Nothing changed, whatever the container.
+    data_loader.load_data(str(tmp_path / "zip.db"), str(archive), incremental=True)
+    assert dump_database(tmp_path / "zip.db") == expected
+
+
+def test_jsonl_lines_are_keyed_on_their_match_id(tmp_path):
+    # A season's file: the digits in its name are not a match ID.
+    sources = sorted(Path(data_loader.DATA_DIR).glob("*.json"))
+    matches = [dict(json.loads(source.read_text()), match_id=int(source.stem)) for source in sources]
+    season = tmp_path / "2012.jsonl"
+    season.write_text("".join(json.dumps(match) + "\n" for match in matches))
+    db_file = tmp_path / "season.db"
+    data_loader.load_data(str(db_file), str(season))
+
+    expected = tmp_path / "directory.db"
+    data_loader.load_data(str(expected), data_loader.DATA_DIR)
+    expected = dump_database(expected)
+    dump = dump_database(db_file)
+    assert [row[:2] for row in dump.pop("ingested_files")] == [
+        (match["match_id"], f"2012.jsonl:{line}") for line, match in enumerate(matches, 1)]
+    assert dump == {table: rows for table, rows in expected.items() if table != "ingested_files"}
+
+    # An incremental load replaces only the changed line's match.
+    matches[-1]["info"]["venue"] = "A New Ground"
+    season.write_text("".join(json.dumps(match) + "\n" for match in matches))
+    data_loader.load_data(str(db_file), str(season), incremental=True)
+    conn = sqlite3.connect(db_file)
+    venues = dict(conn.execute("SELECT match_id, venue FROM matches"))
+    conn.close()
+    assert len(venues) == len(matches)
+    assert venues[matches[-1]["match_id"]] == "A New Ground"
+
+
+def test_parallel_parsing_reads_input_lazily():
+    sources = sorted(Path(data_loader.DATA_DIR).glob("*.json"))
+    pulled = 0
+
+    def members():
+        nonlocal pulled
+        for copy in range(50):
+            for source in sources:
+                pulled += 1
+                yield f"{copy + 1}{source.name}", source.read_bytes()
+
+    workers = 2
+    parsed = data_loader.iter_parsed_matches(members(), workers)
+    next(parsed)
+    window = workers * data_loader.PARSE_WINDOW * data_loader.PARSE_CHUNKSIZE
+    assert pulled <= window + data_loader.PARSE_CHUNKSIZE
+    assert sum(1 for _ in parsed) + 1 == pulled == 50 * len(sources)
@@ -0,0 +1,40 @@
+import json
+import random
+
+import metrics
+
+
+def test_histogram_percentiles_within_bucket_error():
+    histogram = metrics.LatencyHistogram()
+    rng = random.Random(7)
+    samples = sorted(rng.lognormvariate(-8, 1) for _ in range(20000))
+    for seconds in samples:
+        histogram.record(seconds)
+    for pct in (50, 95, 99):
+        exact = samples[int(pct / 100 * len(samples)) - 1]
+        assert exact <= histogram.percentile(pct) <= exact * metrics.HISTOGRAM_GROWTH * 1.001
+    assert histogram.percentile(100) == samples[-1]
+
+
+def test_metrics_aggregate_per_template_and_write_trace(tmp_path):
+    trace_file = tmp_path / "trace.jsonl"
+    recorder = metrics.Metrics(str(trace_file))
+    for rows in (3, 5):
+        trace = metrics.RequestTrace("query_ipl_data", "most runs")
+        trace.template = "who scored the most runs across all matches"
+        trace.add("execute", 0.002)
+        trace.rows = rows
+        recorder.record(trace)
+    recorder.record(metrics.RequestTrace("query_ipl_data", "gibberish"))
+
+    stats = recorder.stats()
+    template = stats["who scored the most runs across all matches"]
+    assert template["requests"] == 2
+    assert template["rows"] == 8
+    assert template["stages"]["execute"]["count"] == 2
+    assert set(template["stages"]) == {"execute", "total"}
+    assert stats["(unmatched)"]["requests"] == 1
+
+    lines = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [line["question"] for line in lines] == ["most runs", "most runs", "gibberish"]
+    assert lines[0]["ms"]["execute"] == 2.0
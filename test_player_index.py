@@ -0,0 +1,93 @@
+import json
+import sqlite3
+
+import pytest
+
+import data_loader
+import ipl_mcp_server as server
+import player_index
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    db_file = tmp_path_factory.mktemp("players") / "ipl.db"
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    conn = sqlite3.connect(db_file)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def index(conn):
+    return player_index.PlayerIndex.load(conn)
+
+
+@pytest.fixture(scope="module")
+def names(conn):
+    # Every player, plus one the database has never heard of.
+    return [name for (name,) in conn.execute("SELECT name FROM players")] + ["Nobody"]
+
+
+@pytest.mark.parametrize("question", list(player_index.QUESTIONS))
+@pytest.mark.parametrize("count", [1, 2, None])
+def test_index_matches_sql(conn, index, names, question, count):
+    params = tuple(json.dumps(names[:count]) for _ in server.TEMPLATE_PARAMS[question])
+    cursor = conn.execute(server.QUERY_MAP[question], params)
+    column_names = [description[0] for description in cursor.description]
+    assert index.query(question, params) == (column_names, cursor.fetchall())
+
+
+def test_matchups_agree_with_deliveries(conn, index):
+    batter, bowler, balls, runs = conn.execute("""
+        SELECT batsman, bowler, COUNT(*), SUM(runs_scored) FROM deliveries
+        GROUP BY batsman, bowler ORDER BY COUNT(*) DESC LIMIT 1""").fetchone()
+    row = index.matchup_row(batter, bowler)
+    assert (index.matchups["balls"][row], index.matchups["runs"][row]) == (balls, runs)
+    assert index.matchup_row(batter, "Nobody") is None
+
+
+def test_career_totals(conn, index):
+    name, runs = conn.execute("SELECT batsman, SUM(runs_scored) FROM deliveries "
+                              "GROUP BY batsman ORDER BY 2 DESC LIMIT 1").fetchone()
+    assert index.career(name)["runs"] == runs
+    assert index.career("Nobody") is None
+    assert 0 < index.memory_bytes() < 1024 * 1024
+
+
+def test_head_to_head_question_is_routed():
+    router = server.get_router()
+    key = router.resolve("_player_ vs _player_", frozenset({"_player_"}))
+    assert key == "show me _player_ vs _player_ head to head"
+    assert router.bind(key, {"player": ["A", "B"]}) == ('["A", "B"]', '["A", "B"]')
+
+
+@pytest.mark.parametrize("question", list(server.PLAYER_TABLES_FALLBACK))
+@pytest.mark.parametrize("count", [2, None])
+def test_fallback_sql_matches_template(conn, names, question, count):
+    params = tuple(json.dumps(names[:count]) for _ in server.TEMPLATE_PARAMS[question])
+    template = conn.execute(server.QUERY_MAP[question], params)
+    fallback = conn.execute(server.PLAYER_TABLES_FALLBACK[question], params)
+    assert [column[0] for column in fallback.description] == [column[0] for column in template.description]
+    assert fallback.fetchall() == template.fetchall()
+
+
+@pytest.mark.parametrize("use_index", [True, False])
+def test_head_to_head_without_player_tables(monkeypatch, tmp_path, conn, use_index):
+    old_db = tmp_path / "old.db"
+    old = sqlite3.connect(old_db)
+    conn.backup(old)
+    old.executescript("DROP TABLE player_matchups; DROP TABLE player_careers; DROP TABLE players;")
+    old.close()
+    monkeypatch.setattr(server, "DB_FILE", str(old_db))
+    monkeypatch.setattr(server, "PLAYER_INDEX", use_index)
+    for name in ("_pool", "_cost_model", "_player_index", "_extractor"):
+        monkeypatch.setattr(server, name, None)
+    monkeypatch.setattr(server, "RESULT_CACHE", server.ResultCache())
+
+    batter, bowler, balls = conn.execute("""
+        SELECT batsman, bowler, COUNT(*) FROM deliveries
+        GROUP BY batsman, bowler ORDER BY COUNT(*) DESC LIMIT 1""").fetchone()
+    answer = server.execute_sql_query(*server.get_sql_query(f"How did {batter} fare against {bowler}?"),
+                                      result_format="rows")
+    server.get_pool().retire()
+    assert [(row["batsman"], row["bowler"], row["balls"]) for row in answer["rows"]] == [(batter, bowler, balls)]
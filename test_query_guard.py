@@ -0,0 +1,151 @@
+import sqlite3
+
+import pytest
+
+import data_loader
+import ipl_mcp_server as server
+import query_guard
+from query_guard import AdmissionControl, CostModel, QueryRejected
+
+OVERS_QUESTION = "which team scored the most runs in overs 1 to 20"
+
+
+@pytest.fixture(scope="module")
+def db_file(tmp_path_factory):
+    db_file = tmp_path_factory.mktemp("guard") / "ipl.db"
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    return db_file
+
+
+@pytest.fixture
+def conn(db_file):
+    conn = sqlite3.connect(db_file)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def guarded_server(monkeypatch, db_file):
+    """The server module on the test database, with a fresh cache and pool."""
+    monkeypatch.setattr(server, "DB_FILE", str(db_file))
+    monkeypatch.setattr(server, "RESULT_CACHE", server.ResultCache())
+    monkeypatch.setattr(server, "_pool", None)
+    yield server
+    server.get_pool().retire()
+
+
+def call(question, control=None, **arguments):
+    return server.call_tool(1, {"name": "query_ipl_data", "arguments": dict(arguments, question=question)},
+                            control)
+
+
+def test_loader_keeps_statistics_from_the_planner(conn):
+    assert conn.execute("SELECT COUNT(*) FROM index_stats WHERE tbl = 'deliveries'").fetchone()[0] > 0
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'sqlite_stat%'").fetchall() == []
+
+
+def test_estimates_tell_a_lookup_from_a_pass_over_the_deliveries(conn):
+    model = CostModel.load(conn)
+    deliveries = conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+    assert model.tables["deliveries"] == pytest.approx(deliveries, rel=0.2)  # ANALYZE samples
+
+    overs = model.estimate(conn, *server.get_sql_query(OVERS_QUESTION))
+    lookup = model.estimate(conn, *server.get_sql_query("show me V Kohli batting stats"))
+    assert overs > deliveries / 2
+    assert lookup < deliveries / 100
+
+
+def test_estimates_without_index_stats(tmp_path, conn):
+    # A database loaded before index_stats existed: tables are counted and
+    # SEARCH steps get the default selectivity.
+    old = sqlite3.connect(tmp_path / "old.db")
+    conn.backup(old)
+    old.execute("DROP TABLE index_stats")
+    model = CostModel.load(old)
+    deliveries = old.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+    assert model.tables["deliveries"] == deliveries
+    assert "index_stats" not in model.tables
+    assert all(info.averages == () for info in model.indexes.values())
+
+    overs = model.estimate(old, *server.get_sql_query(OVERS_QUESTION))
+    lookup = model.estimate(old, *server.get_sql_query("show me V Kohli batting stats"))
+    old.close()
+    assert deliveries / 10 < overs < deliveries * 10   # within an order of magnitude
+    assert lookup < overs / 10
+
+
+def test_nested_loops_multiply():
+    model = CostModel()
+    model.tables = {"a": 1000, "b": 50}
+    by_rowid = [(2, 0, 0, "SCAN a"), (3, 0, 0, "SEARCH b USING INTEGER PRIMARY KEY (rowid=?)"),
+                (4, 0, 0, "USE TEMP B-TREE FOR ORDER BY")]
+    assert model.plan_cost(by_rowid) == 1000 + 1000 + 1000
+    assert model.plan_cost([(2, 0, 0, "SCAN a"), (3, 0, 0, "SCAN b")]) == 1000 + 1000 * 50
+    assert model.plan_cost([(2, 0, 0, "SCAN x")], {"x": "b"}) == 50
+
+
+def test_admission_turns_heavy_queries_away_when_full():
+    admission = AdmissionControl(1)
+    with admission.admit(10):
+        with pytest.raises(QueryRejected) as rejected:
+            with admission.admit(10):
+                pass
+    assert rejected.value.code == query_guard.SERVER_BUSY
+    with admission.admit(10):
+        pass
+    assert admission.stats() == {"limit": 1, "running": 0, "admitted": 2, "turned_away": 1}
+
+
+def test_step_budget_stops_the_query(guarded_server):
+    control = server.QueryControl(step_budget=server.PROGRESS_INTERVAL)
+    error = call(OVERS_QUESTION, control)["error"]
+    assert error["code"] == query_guard.QUERY_ABORTED
+    assert error["data"] == {"reason": "step_budget", "limit": server.PROGRESS_INTERVAL}
+
+    # The budget is per query: the next one on the same control starts afresh.
+    assert "result" in call("show me all matches in the dataset", control)
+
+
+def test_limits_are_read_at_call_time(guarded_server, monkeypatch):
+    monkeypatch.setattr(server, "QUERY_STEP_BUDGET", server.PROGRESS_INTERVAL)
+    monkeypatch.setattr(server, "QUERY_TIMEOUT", 2.5)
+    assert server.QueryControl().timeout == 2.5
+    error = call(OVERS_QUESTION)["error"]
+    assert error["data"] == {"reason": "step_budget", "limit": server.PROGRESS_INTERVAL}
+
+
+@pytest.mark.parametrize("setting, value, code", [
+    ("MAX_QUERY_COST", 0, query_guard.QUERY_TOO_EXPENSIVE),
+    ("MAX_RESULT_BYTES", 100, query_guard.RESULT_TOO_LARGE),
+])
+def test_limits_are_json_rpc_errors(guarded_server, monkeypatch, setting, value, code):
+    monkeypatch.setattr(server, setting, value)
+    response = call(OVERS_QUESTION)
+    assert response["error"]["code"] == code
+    assert "result" not in response
+    if code == query_guard.RESULT_TOO_LARGE:
+        assert 1 <= response["error"]["data"]["page_size"] < server.DEFAULT_PAGE_SIZE
+
+
+def test_busy_server_rejects_heavy_questions_only(guarded_server, monkeypatch):
+    monkeypatch.setattr(server, "HEAVY_QUERY_COST", 1000)
+    monkeypatch.setattr(server, "ADMISSION", AdmissionControl(0))
+    assert call(OVERS_QUESTION)["error"]["code"] == query_guard.SERVER_BUSY
+    assert "result" in call("what was the highest total score")
+
+    results = server.execute_batch([OVERS_QUESTION, "what was the highest total score"])
+    assert results[OVERS_QUESTION]["error"]["data"]["reason"] == "busy"
+    assert "total_score" in results["what was the highest total score"]
+
+
+def test_merged_lookups_are_guarded(guarded_server, monkeypatch):
+    monkeypatch.setattr(server, "PLAYER_INDEX", False)
+    questions = ["show me TM Dilshan batting stats", "show me CH Gayle batting stats"]
+    monkeypatch.setattr(server, "MAX_QUERY_COST", 0)
+    results = server.execute_batch(questions)
+    assert [results[question]["error"]["code"] for question in questions] == [query_guard.QUERY_TOO_EXPENSIVE] * 2
+
+    monkeypatch.setattr(server, "MAX_QUERY_COST", 1000 * 1000)
+    monkeypatch.setattr(server, "MAX_RESULT_BYTES", 100)
+    results = server.execute_batch(questions)
+    assert [results[question]["error"]["code"] for question in questions] == [query_guard.RESULT_TOO_LARGE] * 2
@@ -0,0 +1,57 @@
+import re
+import sqlite3
+
+import pytest
+
+import data_loader
+import ipl_mcp_server as server
+
+# Entities bound into slot templates; the plan does not depend on the values.
+SAMPLE_ENTITIES = {
+    "player": ["V Kohli"],
+    "team": ["Mumbai Indians"],
+    "venue": ["Eden Gardens"],
+    "city": ["Mumbai"],
+    "season": "2012",
+    "overs": (16, 20),
+}
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    db_file = tmp_path_factory.mktemp("plans") / "ipl.db"
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    conn = sqlite3.connect(db_file)
+    yield conn
+    conn.close()
+
+
+def deliveries_full_scans(conn, sql_query, params=()):
+    """Query plan lines that scan the deliveries table without an index."""
+    names = {"deliveries"}
+    names.update(re.findall(r"\bdeliveries\s+(?:AS\s+)?(?!WHERE|JOIN|GROUP|ORDER|LIMIT|ON)(\w+)",
+                            sql_query, re.IGNORECASE))
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql_query}", params).fetchall()
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and match.group(1) in names and "INDEX" not in detail:
+            scans.append(detail)
+    return scans
+
+
+@pytest.mark.parametrize("question", list(server.QUERY_MAP))
+def test_template_does_not_scan_deliveries(conn, question):
+    params = server.get_router().bind(server.normalize_question(question), SAMPLE_ENTITIES)
+    assert deliveries_full_scans(conn, server.QUERY_MAP[question], params) == []
+
+
+@pytest.mark.parametrize("table", [table for table in data_loader.SUMMARY_TABLES if table != "venue_totals"])
+def test_single_match_summary_refresh_uses_index(conn, table):
+    select = data_loader._summary_select(table, match_filter="d.match_id = ?")
+    assert deliveries_full_scans(conn, select, (548360,)) == []
+
+
+def test_scan_detection_sees_unindexed_scan(conn):
+    assert deliveries_full_scans(conn, "SELECT SUM(extra_runs) FROM deliveries d")
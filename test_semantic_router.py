@@ -0,0 +1,57 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import ipl_mcp_server as server
+import semantic_router
+
+TEMPLATES = [server.normalize_question(key) for key in server.QUERY_MAP]
+
+
+@pytest.fixture(scope="module")
+def router():
+    return semantic_router.SemanticRouter.for_templates(TEMPLATES)
+
+
+def test_every_paraphrase_template_exists():
+    assert set(semantic_router.PARAPHRASES) <= set(TEMPLATES)
+
+
+def test_every_synonym_is_a_single_token():
+    # The tokenizer splits on anything else, so such a synonym could never match.
+    assert [word for word in semantic_router.SYNONYMS
+            if semantic_router._TOKEN_RE.fullmatch(word) is None] == []
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("who has the most dismissals", "which bowler took the most wickets"),
+    ("best stadium for batting", "which venue has the highest scoring matches"),
+    ("list all the tons", "show me all centuries scored"),
+    ("how has _player_ batted", "show me _player_ batting stats"),
+    ("highest target chased down", "show me the most successful chase targets"),
+    ("what do teams usually score batting first", "what's the average first innings score"),
+])
+def test_paraphrases_route_to_their_template(router, question, expected):
+    template, confidence = router.match(question)
+    assert template == expected
+    assert confidence >= router.threshold
+
+
+@pytest.mark.parametrize("question", ["what is the capital of france", "tell me a joke", "how do i bake bread"])
+def test_unrelated_questions_do_not_match(router, question):
+    assert router.match(question)[0] is None
+
+
+def test_ineligible_templates_are_skipped(router):
+    eligible = router.mask(template for template in TEMPLATES if "_player_" not in template)
+    assert router.match("_player_ wickets")[0] == "show me _player_ bowling stats"
+    assert router.match("_player_ wickets", eligible)[0] != "show me _player_ bowling stats"
+
+
+def test_question_router_uses_semantic_fallback():
+    router = server.QuestionRouter(server.QUERY_MAP, server.KEY_PHRASES, server.TEMPLATE_PARAMS,
+                                   server.get_semantic_router())
+    assert router.resolve("leading wicket takers") == "which bowler took the most wickets"
+    # _venue_ was not filled, so the venue template is off the table.
+    assert router.resolve("games hosted at _venue_") != "show matches played in _venue_"
+    assert router.resolve("games hosted at _venue_", frozenset({"_venue_"})) == "show matches played in _venue_"
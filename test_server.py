@@ -1,8 +1,21 @@
-import requests
+import asyncio
+import io
 import json
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
 
-# The URL where your local server is running.
-SERVER_URL = "http://127.0.0.1:8000/query"
+import pytest
+
+import data_loader
+import ipl_mcp_server as server
+import query_guard
+from mcp_client import StdioServerClient
+from metrics import RequestTrace
 
 # A list of questions to test. These should match the keys in the query_map
 # in your ipl_mcp_server.py file to ensure all functionality is tested.
@@ -12,13 +25,14 @@ TEST_QUERIES = [
     "Which team won the most matches?",
     "What was the highest total score?",
     "Show matches played in Mumbai",
-    
+
     # Player Performance
     "Who scored the most runs across all matches?",
     "Which bowler took the most wickets?",
     "Show me Virat Kohli's batting stats",
     "Who has the best bowling figures in a single match?",
-    
+    "Rohit Sharma vs Kallis",
+
     # Advanced Analytics
     "What's the average first innings score?",
     "Which venue has the highest scoring matches?",
@@ -28,54 +42,599 @@ TEST_QUERIES = [
     "What is the airspeed velocity of an unladen swallow?"
 ]
 
-def run_tests():
+UNMATCHED_QUESTION = TEST_QUERIES[-1]
+
+# Startup budgets, checked by the tests below: Claude Desktop starts a new
+# server process for every session. Generous enough for a slow CI runner.
+IMPORT_BUDGET = 0.3           # seconds, `import ipl_mcp_server` per python -X importtime
+FIRST_RESPONSE_BUDGET = 0.6   # seconds from process start to the initialize response
+
+
+# Template each test question is routed to (None: the fallback answer).
+EXPECTED_ROUTES = {
+    "Show me all matches in the dataset": "show me all matches in the dataset",
+    "Which team won the most matches?": "which team won the most matches",
+    "What was the highest total score?": "what was the highest total score",
+    "Show matches played in Mumbai": "show matches played in _venue_",
+    "Who scored the most runs across all matches?": "who scored the most runs across all matches",
+    "Which bowler took the most wickets?": "which bowler took the most wickets",
+    "Show me Virat Kohli's batting stats": "show me _player_ batting stats",
+    "Who has the best bowling figures in a single match?": "who has the best bowling figures in a single match",
+    "Rohit Sharma vs Kallis": "show me _player_ vs _player_ head to head",
+    "What's the average first innings score?": "what's the average first innings score",
+    "Which venue has the highest scoring matches?": "which venue has the highest scoring matches",
+    "Show me all centuries scored": "show me all centuries scored",
+    "What is the airspeed velocity of an unladen swallow?": None,
+    "Show me Malinga's bowling stats": "show me _player_ bowling stats",
+    "How did Gibbs fare against Narine?": "show me _player_ vs _player_ head to head",
+    "Show matches played by CSK": "show matches played by _team_",
+    "Show matches played at Eden Gardens": "show matches played in _venue_",
+    "Which team won the most matches in 2012?": "which team won the most matches in _season_",
+    "Which side had the most victories in 2012?": "which team won the most matches in _season_",
+    "Who scored the most runs in 2012?": None,
+    "Which team scored the most runs in the death overs?": "which team scored the most runs in _overs_",
+    "What's the most successful chase target?": "show me the most successful chase targets",
+    "Which team has the best powerplay performance?": "which team has the best powerplay performance",
+}
+
+
+def answer_text(response):
+    """The text of a query_ipl_data response, or None if it is malformed."""
+    content = response.get("result", {}).get("content") or [{}]
+    return content[0].get("text")
+
+
+@pytest.fixture(scope="module")
+def db_file(tmp_path_factory):
+    db_file = tmp_path_factory.mktemp("server") / "ipl.db"
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    return db_file
+
+
+@pytest.fixture(scope="module")
+def client(db_file):
+    with StdioServerClient(db_file) as client:
+        client.initialize()
+        yield client
+
+
+def test_initialize_and_list_tools(client):
+    tools = client.request("tools/list")["result"]["tools"]
+    assert {"query_ipl_data", "query_ipl_data_batch", "server_stats"} <= {tool["name"] for tool in tools}
+
+
+@pytest.mark.parametrize("question", TEST_QUERIES[:-1])
+def test_question_is_answered(client, question):
+    text = answer_text(client.call_tool("query_ipl_data", {"question": question}))
+    assert text
+    assert "Database error" not in text
+    assert "could not understand" not in text
+
+
+def test_unmatched_question_falls_back(client):
+    text = answer_text(client.call_tool("query_ipl_data", {"question": UNMATCHED_QUESTION}))
+    assert "could not understand" in text
+
+
+@pytest.mark.parametrize("question", ["Show me all matches in the dataset", "Who scored the most runs across all matches?"])
+def test_structured_formats_agree(client, question):
+    rows = client.call_tool("query_ipl_data", {"question": question, "format": "rows"})["result"]
+    columns = client.call_tool("query_ipl_data", {"question": question, "format": "columns"})["result"]
+    assert json.loads(rows["content"][0]["text"]) == rows["structuredContent"]
+    rows, columns = rows["structuredContent"], columns["structuredContent"]
+    assert rows["row_count"] == columns["row_count"] > 0
+    assert rows.get("next_cursor") == columns.get("next_cursor")
+
+    decoded = []
+    for name, values in zip(columns["columns"], columns["data"]):
+        if name in columns["encoded"]:
+            values = [columns["dictionary"][code] if code is not None else None for code in values]
+        decoded.append(values)
+    assert [dict(zip(columns["columns"], row)) for row in zip(*decoded)] == rows["rows"]
+
+
+@pytest.mark.parametrize("requested, agreed, structured", [
+    ("2025-06-18", "2025-06-18", True),
+    ("2024-11-05", "2024-11-05", False),
+    ("1999-01-01", server.PROTOCOL_VERSIONS[0], True),
+])
+def test_structured_content_only_for_clients_that_negotiated_it(monkeypatch, db_file, requested, agreed,
+                                                                   structured):
+    serve_from(monkeypatch, db_file)
+    monkeypatch.setattr(server, "_protocol_version", server._protocol_version)
+    response = server.handle_request({"jsonrpc": "2.0", "id": 1, "method": "initialize",
+                                      "params": {"protocolVersion": requested}})
+    assert response["result"]["protocolVersion"] == agreed
+    result = server.call_tool(2, {"name": "query_ipl_data",
+                                  "arguments": {"question": TEST_QUERIES[0], "format": "rows"}})["result"]
+    assert ("structuredContent" in result) == structured
+    assert json.loads(result["content"][0]["text"])["format"] == "rows"
+    server.get_pool().retire()
+
+
+def test_dictionary_encoding_shares_names_across_columns():
+    payload = server.format_columns(["team1", "team2", "match_id"], [("CSK", "MI", 1), ("MI", "RCB", 2), ("RCB", "CSK", 3)])
+    assert payload["encoded"] == ["team1", "team2"]
+    assert payload["dictionary"] == ["CSK", "MI", "RCB"]
+    assert payload["data"] == [[0, 1, 2], [1, 2, 0], [1, 2, 3]]
+
+
+def test_unknown_format_is_rejected(client):
+    response = client.call_tool("query_ipl_data", {"question": TEST_QUERIES[0], "format": "xml"})
+    assert response["error"]["code"] == -32602
+
+
+@pytest.mark.parametrize("tool, arguments", [
+    ("query_ipl_data", {"question": TEST_QUERIES[0]}),
+    ("query_ipl_data_batch", {"questions": TEST_QUERIES[:2]}),
+])
+@pytest.mark.parametrize("page_size", ["ten", 2.5, 0, True, None])
+def test_bad_page_size_is_rejected(client, tool, arguments, page_size):
+    response = client.call_tool(tool, dict(arguments, page_size=page_size))
+    assert response["error"]["code"] == -32602
+    assert "page_size" in response["error"]["message"]
+
+
+def test_server_switches_to_new_snapshot(tmp_path):
+    db_file = tmp_path / "ipl.db"
+    subset = tmp_path / "subset"
+    subset.mkdir()
+    for source in sorted(Path(data_loader.DATA_DIR).glob("*.json"))[:3]:
+        shutil.copy(source, subset)
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    arguments = {"question": "Show me all matches in the dataset", "include_total": True, "format": "rows"}
+
+    with StdioServerClient(db_file) as client:
+        client.initialize()
+        before = client.call_tool("query_ipl_data", arguments)["result"]["structuredContent"]
+        data_loader.load_data(str(db_file), str(subset))
+        after = client.call_tool("query_ipl_data", arguments)["result"]["structuredContent"]
+    assert before["total"] > after["total"] == 3
+
+
+def test_questions_route_to_expected_templates(monkeypatch, db_file):
+    monkeypatch.setattr(server, "DB_FILE", str(db_file))
+    monkeypatch.setattr(server, "_pool", None)
+    monkeypatch.setattr(server, "_extractor", None)
+    routes = {}
+    for question in EXPECTED_ROUTES:
+        trace = RequestTrace()
+        server.get_sql_query(question, trace)
+        routes[question] = trace.template
+    server.get_pool().retire()
+    assert routes == EXPECTED_ROUTES
+
+
+@pytest.mark.parametrize("question, overs", [
+    ("Which team scored the most runs in overs 0-6?", (1, 6)),
+    ("which team scored the most runs in overs 0 to 6", (1, 6)),
+    ("which team scored the most runs in the last 25 overs", (1, 20)),
+    ("which team scored the most runs in overs 16 through 20", (16, 20)),
+])
+def test_over_ranges_start_at_the_first_over(question, overs):
+    extractor = server.EntityExtractor(server.get_router().vocabulary)
+    masked, entities = extractor.extract(server.normalize_question(question))
+    assert entities == {"overs": overs}
+    key = server.get_router().resolve(masked, frozenset({"_overs_"}))
+    assert server.get_router().bind(key, entities) == (overs[0] - 1, overs[1] - 1)
+    assert min(server.get_router().bind(key, entities)) >= 0
+
+
+def test_extractor_follows_incremental_loads_without_sql(monkeypatch, tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    sources = sorted(Path(data_loader.DATA_DIR).glob("*.json"))
+    for source in sources:
+        shutil.copy(source, data_dir)
+    db_file = tmp_path / "ipl.db"
+    data_loader.load_data(str(db_file), str(data_dir))
+    serve_from(monkeypatch, db_file)
+    monkeypatch.setattr(server, "_extractor", None)
+    extractor = server.get_extractor()
+    pool = server.get_pool()
+    acquired = []
+    monkeypatch.setattr(pool, "acquire", lambda acquire=pool.acquire: acquired.append(1) or acquire())
+    assert all(server.get_extractor() is extractor for _ in range(10))
+    assert acquired == []
+
+    changed = data_dir / sources[0].name
+    match = json.loads(changed.read_text())
+    for delivery in match["innings"][0]["overs"][0]["deliveries"]:
+        delivery["batter"] = "A Newcomer"
+    changed.write_text(json.dumps(match))
+    data_loader.load_data(str(db_file), str(data_dir), incremental=True)
+    server.execute_sql_query(*server.get_sql_query("Show me all matches in the dataset"))
+    _, entities = server.get_extractor().extract("show me a newcomer batting stats")
+    pool.retire()
+    assert entities == {"player": ["A Newcomer"]}
+
+
+def test_batch_merges_lookups_of_one_template(monkeypatch, db_file):
+    serve_from(monkeypatch, db_file)
+    monkeypatch.setattr(server, "PLAYER_INDEX", False)
+    questions = ["show me TM Dilshan batting stats", "show me CH Gayle batting stats",
+                 "Show me TM Dilshan batting stats!", "show me SL Malinga bowling stats",
+                 "show me KA Pollard bowling stats"]
+    statements = []
+    guarded = server.guarded
+    monkeypatch.setattr(server, "guarded",
+                        lambda conn, generation, sql_query, *args: statements.append(sql_query)
+                        or guarded(conn, generation, sql_query, *args))
+    results = server.execute_batch(questions)
+    assert sorted(statements) == sorted(server._MERGEABLE_BY_SQL)  # one statement per template
+
+    monkeypatch.setattr(server, "RESULT_CACHE", server.ResultCache())
+    for question in questions:
+        assert results[question] == server.execute_sql_query(*server.get_sql_query(question))
+    assert results[questions[0]] == results[questions[2]]
+    assert "TM Dilshan" in results[questions[0]] and "KA Pollard" in results[questions[4]]
+    server.get_pool().retire()
+
+
+def test_key_phrases_first_listed_wins():
+    router = server.QuestionRouter(server.QUERY_MAP, server.KEY_PHRASES, server.TEMPLATE_PARAMS)
+    targets = [(phrase, server.normalize_question(question)) for phrase, question in server.KEY_PHRASES.items()]
+    phrases = [phrase for phrase, _ in targets]
+    for first in phrases:
+        for second in phrases[::7] + [""]:
+            question = f"tell me {second} and {first} please"
+            expected = next(target for phrase, target in targets if phrase in question)
+            slots = frozenset(word for word in expected.split() if word in server.SLOT_NAMES)
+            assert router.resolve(question, slots) == expected, question
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_pool_reuses_read_only_connections(db_file, in_memory):
+    pool = server.ConnectionPool(str(db_file), size=2, in_memory=in_memory)
+    with pool.connection() as first:
+        assert first.execute("SELECT COUNT(*) FROM matches").fetchone()[0] > 0
+    with pool.connection() as second:
+        assert second is first
+        with pytest.raises(sqlite3.OperationalError):
+            second.execute("DELETE FROM matches")
+    pool.retire()
+
+
+def test_result_cache_hits_evicts_and_invalidates(monkeypatch, tmp_path):
+    db_file = tmp_path / "ipl.db"
+    subset = tmp_path / "subset"
+    subset.mkdir()
+    for source in sorted(Path(data_loader.DATA_DIR).glob("*.json"))[:3]:
+        shutil.copy(source, subset)
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    monkeypatch.setattr(server, "DB_FILE", str(db_file))
+    monkeypatch.setattr(server, "_pool", None)
+    monkeypatch.setattr(server, "RESULT_CACHE", server.ResultCache(max_entries=2))
+    questions = ["Show me all matches in the dataset", "Which team won the most matches?",
+                 "What was the highest total score?"]
+
+    def ask(question):
+        return server.call_tool(1, {"name": "query_ipl_data", "arguments": {"question": question}})["result"]
+
+    first = ask(questions[0])
+    assert ask(questions[0]) == first
+    assert server.RESULT_CACHE.stats()["hits"] == 1
+
+    # Least recently used goes first: questions[1], not the just-read questions[0].
+    ask(questions[1])
+    ask(questions[0])
+    ask(questions[2])
+    stats = server.RESULT_CACHE.stats()
+    assert (stats["entries"], stats["evictions"]) == (2, 1)
+    ask(questions[0])
+    assert server.RESULT_CACHE.stats()["hits"] == 3
+
+    # A reload bumps PRAGMA user_version, which drops every cached answer.
+    data_loader.load_data(str(db_file), str(subset))
+    assert ask(questions[0]) != first
+    stats = server.RESULT_CACHE.stats()
+    assert (stats["generation"], stats["invalidations"], stats["entries"]) == (2, 1, 1)
+    server.get_pool().retire()
+
+
+def serve_from(monkeypatch, db_file):
+    """Point the in-process server at db_file with a fresh pool and result cache."""
+    monkeypatch.setattr(server, "DB_FILE", str(db_file))
+    monkeypatch.setattr(server, "_pool", None)
+    monkeypatch.setattr(server, "RESULT_CACHE", server.ResultCache())
+
+
+def all_pages(sql_query, params, page_size):
+    """Every row of a query, fetched page by page through the continuation cursors."""
+    rows, cursor = [], None
+    while True:
+        page = server.execute_sql_query(sql_query, params, page_size=page_size, cursor=cursor,
+                                        result_format="rows")
+        rows.extend(tuple(row.values()) for row in page["rows"])
+        cursor = page.get("next_cursor")
+        if cursor is None:
+            return rows
+
+
+@pytest.mark.parametrize("question, keyset", [
+    ("Show matches played in 2012", True),
+    ("Show matches played by Mumbai Indians", True),
+    ("Show me all matches in the dataset", False),
+])
+def test_pages_add_up_to_the_whole_result(monkeypatch, db_file, question, keyset):
+    serve_from(monkeypatch, db_file)
+    sql_query, params = server.get_sql_query(question)
+    assert (sql_query in server._KEYSETS_BY_SQL) == keyset
+    conn = sqlite3.connect(db_file)
+    expected = conn.execute(sql_query, params).fetchall()
+    conn.close()
+    assert len(expected) > 2
+    assert all_pages(sql_query, params, 2) == expected
+    server.get_pool().retire()
+
+
+def test_keyset_pages_split_ties(monkeypatch, tmp_path, db_file):
+    # Three hundreds with the same score in the same match, one page each.
+    tied_db = tmp_path / "tied.db"
+    shutil.copy(db_file, tied_db)
+    conn = sqlite3.connect(tied_db)
+    for twin in ("AA Twin", "ZZ Twin"):
+        conn.execute("""INSERT INTO batter_match_stats (match_id, team, batsman, runs, balls, fours, sixes)
+                        SELECT match_id, team, ?, runs, balls, fours, sixes FROM batter_match_stats
+                        WHERE runs >= 100 ORDER BY runs DESC LIMIT 1""", (twin,))
+    conn.commit()
+    serve_from(monkeypatch, tied_db)
+    sql_query, params = server.get_sql_query("Show me all centuries scored")
+    expected = conn.execute(sql_query, params).fetchall()
+    conn.close()
+    assert expected[0][1:] == expected[1][1:] == expected[2][1:]
+    assert all_pages(sql_query, params, 1) == expected
+    server.get_pool().retire()
+
+
+def test_bad_cursors_are_rejected(monkeypatch, tmp_path):
+    db_file = tmp_path / "ipl.db"
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    serve_from(monkeypatch, db_file)
+    sql_query, params = server.get_sql_query("Show matches played in 2012")
+    cursor = server.execute_sql_query(sql_query, params, page_size=1, result_format="rows")["next_cursor"]
+    assert server.execute_sql_query(sql_query, params, page_size=1, cursor="not-a-cursor") == "Invalid cursor"
+    other_sql, other_params = server.get_sql_query("Show me all matches in the dataset")
+    assert "does not belong" in server.execute_sql_query(other_sql, other_params, cursor=cursor)
+
+    data_loader.load_data(str(db_file), data_loader.DATA_DIR)
+    assert "earlier data load" in server.execute_sql_query(sql_query, params, page_size=1, cursor=cursor)
+    server.get_pool().retire()
+
+
+def test_in_memory_snapshot_matches_file(monkeypatch, db_file):
+    sql_query = server.QUERY_MAP["who scored the most runs across all matches"]
+    monkeypatch.setattr(server, "DB_FILE", str(db_file))
+    monkeypatch.setattr(server, "RESULT_CACHE", server.ResultCache())
+    answers = []
+    for in_memory in (False, True):
+        monkeypatch.setattr(server, "DB_IN_MEMORY", in_memory)
+        monkeypatch.setattr(server, "_pool", None)
+        server.RESULT_CACHE.clear()
+        answers.append(server.execute_sql_query(sql_query))
+        with server.get_pool().connection() as conn:
+            main_file = conn.execute("PRAGMA database_list").fetchone()[2]
+        assert (main_file == "") == in_memory
+        server.get_pool().retire()
+    assert answers[0] == answers[1]
+    assert "total_runs" in answers[0]
+
+
+def test_in_memory_pool_follows_incremental_loads(monkeypatch, tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    sources = sorted(Path(data_loader.DATA_DIR).glob("*.json"))
+    for source in sources[:-3]:
+        shutil.copy(source, data_dir)
+    db_file = tmp_path / "ipl.db"
+    data_loader.load_data(str(db_file), str(data_dir))
+    serve_from(monkeypatch, db_file)
+    monkeypatch.setattr(server, "DB_IN_MEMORY", True)
+    sql_query = server.QUERY_MAP["show me all matches in the dataset"]
+
+    def total():
+        return server.execute_sql_query(sql_query, include_total=True, result_format="rows")["total"]
+
+    assert total() == len(sources) - 3
+    data_loader.load_data(str(db_file), str(data_dir), incremental=True)   # switches the file to WAL
+    pool = server.get_pool()
+    assert total() == len(sources) - 3
+    assert server.get_pool() is pool   # reads alone do not start a new pool
+    for source in sources[-3:]:
+        shutil.copy(source, data_dir)
+    data_loader.load_data(str(db_file), str(data_dir), incremental=True)
+    assert total() == len(sources)
+    assert pool.retired and server.get_pool() is not pool
+    server.get_pool().retire()
+
+
+def test_retired_pool_closes_released_connections(db_file):
+    pool = server.ConnectionPool(str(db_file), size=2)
+    with pool.connection() as busy:
+        with pool.connection() as idle:
+            pass
+        pool.retire()
+        with pytest.raises(sqlite3.ProgrammingError):
+            idle.execute("SELECT 1")
+        busy.execute("SELECT 1")
+    with pytest.raises(sqlite3.ProgrammingError):
+        busy.execute("SELECT 1")
+    assert pool._idle.empty() and pool._created == 0
+
+
+def test_pipelined_calls_all_answered(client):
+    calls = [("query_ipl_data", {"question": question}) for question in TEST_QUERIES] * 3
+    wall, results = client.run_load(calls, concurrency=8)
+    assert len(results) == len(calls)
+    assert all(answer_text(response) for _, _, response in results)
+
+
+def test_dispatcher_framing_batches_lines_and_coalesces_writes():
+    class CountingOutput(io.BytesIO):
+        writes = 0
+
+        def write(self, data):
+            self.writes += 1
+            return super().write(data)
+
+    requests = [{"jsonrpc": "2.0", "id": i, "method": "tools/list"} for i in range(50)]
+    # Blank and malformed lines are skipped; the last line has no newline.
+    stdin = io.BytesIO(b"\n".join([b"", b"not json"] + [json.dumps(r).encode() for r in requests]))
+    output = CountingOutput()
+    asyncio.run(server.Dispatcher(output=output).serve(stdin))
+
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [response["id"] for response in responses] == list(range(50))
+    # At most one write for the chunk of complete lines and one for the
+    # unterminated tail (a single one if both batches were already queued).
+    assert output.writes <= 2
+
+
+def serve_messages(messages, output=None, **dispatcher_options):
+    """Run a Dispatcher over messages sent as stdin lines; the responses in the order written."""
+    stdin = io.BytesIO(b"".join(json.dumps(message).encode() + b"\n" for message in messages))
+    output = output if output is not None else io.BytesIO()
+    asyncio.run(server.Dispatcher(output=output, **dispatcher_options).serve(stdin))
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def tool_call(request_id, name, arguments=None):
+    return {"jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+            "params": {"name": name, "arguments": arguments or {}}}
+
+
+def test_fast_call_is_answered_while_a_slow_one_runs(monkeypatch):
+    fast_answered = threading.Event()
+
+    def call_tool(request_id, params, control=None):
+        if params["name"] == "slow":
+            fast_answered.wait(5)
+        return {"jsonrpc": "2.0", "id": request_id, "result": {"tool": params["name"]}}
+
+    class Output(io.BytesIO):
+        def write(self, data):
+            if b'"id":2' in data:
+                fast_answered.set()
+            return super().write(data)
+
+    monkeypatch.setattr(server, "call_tool", call_tool)
+    responses = serve_messages([tool_call(1, "slow"), tool_call(2, "fast")], Output())
+    assert [(response["id"], response["result"]["tool"]) for response in responses] == [(2, "fast"), (1, "slow")]
+
+
+def test_cancelled_call_gets_no_response(monkeypatch):
+    def call_tool(request_id, params, control=None):
+        deadline = time.monotonic() + 5
+        while params["name"] == "slow" and not control.cancelled and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return {"jsonrpc": "2.0", "id": request_id, "result": {}}
+
+    monkeypatch.setattr(server, "call_tool", call_tool)
+    cancel = {"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 1}}
+    responses = serve_messages([tool_call(1, "slow"), cancel, tool_call(2, "fast")])
+    assert [response["id"] for response in responses] == [2]
+
+
+def test_batch_gets_one_array_of_responses(monkeypatch):
+    def call_tool(request_id, params, control=None):
+        return {"jsonrpc": "2.0", "id": request_id, "result": {"tool": params["name"]}}
+
+    monkeypatch.setattr(server, "call_tool", call_tool)
+    monkeypatch.setattr(server, "_protocol_version", server._protocol_version)
+    monkeypatch.setattr(server, "WARM_UP", False)
+    initialize = {"jsonrpc": "2.0", "id": 1, "method": "initialize",
+                  "params": {"protocolVersion": "2025-03-26", "capabilities": {}}}
+    initialized = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+    batch = [tool_call(2, "first"), {"jsonrpc": "2.0", "id": 3, "method": "tools/list"},
+             initialized, tool_call(4, "second"), 5]
+    responses = serve_messages([initialize, batch, [initialized], []])
+
+    assert responses[0]["result"]["protocolVersion"] == "2025-03-26"
+    [batch_response] = [response for response in responses if isinstance(response, list)]
+    answers = {response["id"]: response for response in batch_response}
+    assert sorted(answers, key=str) == [2, 3, 4, None]
+    assert answers[2]["result"] == {"tool": "first"}
+    assert answers[4]["result"] == {"tool": "second"}
+    assert "tools" in answers[3]["result"]
+    assert answers[None]["error"]["code"] == -32600
+    # The batch of only a notification gets nothing; the empty batch is invalid.
+    assert len(responses) == 3
+    assert {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}} in responses
+
+
+def test_timed_out_query_is_aborted(monkeypatch, db_file):
+    monkeypatch.setattr(server, "DB_FILE", str(db_file))
+    monkeypatch.setattr(server, "_pool", None)
+    monkeypatch.setattr(server, "RESULT_CACHE", server.ResultCache())
+    question = {"question": "Which team scored the most runs in overs 1 to 20?"}
+    responses = serve_messages([tool_call(1, "query_ipl_data", question)], timeout=1e-6)
+    server.get_pool().retire()
+    error = responses[0]["error"]
+    assert error["code"] == query_guard.QUERY_ABORTED
+    assert error["data"]["reason"] == "timeout"
+
+
+def test_import_is_light():
+    probe = ("import sys, ipl_mcp_server as s; "
+             "print(sorted(m for m in ('numpy', 'analytics_engine') if m in sys.modules), s._router, s._pool)")
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[] None None"
+
+
+def test_import_time_within_budget():
+    def import_seconds():
+        stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import ipl_mcp_server"],
+                                capture_output=True, text=True, check=True).stderr
+        return int(stderr.splitlines()[-1].split("|")[1]) / 1e6
+
+    assert min(import_seconds() for _ in range(3)) < IMPORT_BUDGET
+
+
+def test_initialize_answered_without_database(tmp_path):
+    # initialize and tools/list must not wait for (or need) the database.
+    elapsed = []
+    for _ in range(3):
+        start = time.perf_counter()
+        with StdioServerClient(tmp_path / "missing.db") as client:
+            assert client.initialize()["result"]["serverInfo"]["name"] == "ipl-cricket-analyzer"
+            elapsed.append(time.perf_counter() - start)
+            assert client.request("tools/list")["result"]["tools"]
+    assert min(elapsed) < FIRST_RESPONSE_BUDGET
+
+
+def run_tests(db_file=data_loader.DB_FILE):
     """
-    Sends each test query to the server and checks the response.
+    Starts the server on db_file and checks the response to each test query.
     """
     print("--- Starting Server Functionality Test ---")
-    
+
     passed_tests = 0
     failed_tests = 0
-    
-    for i, question in enumerate(TEST_QUERIES):
-        print(f"\n[{i+1}/{len(TEST_QUERIES)}] Testing question: '{question}'")
-        
-        try:
-            # The payload to send, in JSON format.
-            payload = {"question": question}
-            
-            # Send the POST request to the server.
-            response = requests.post(SERVER_URL, json=payload, timeout=10)
-            
-            # Check if the request was successful (HTTP 200 OK).
-            if response.status_code == 200:
-                response_data = response.json()
-                # Check if the response contains the 'response' key.
-                if 'response' in response_data and response_data['response']:
-                    print(f"✅ PASS: Server returned a valid response.")
-                    # print("   " + response_data['response'].split('\n')[0] + "...") # Optional: print first line of response
-                    passed_tests += 1
-                else:
-                    print(f"❌ FAIL: Server response was empty or malformed.")
-                    failed_tests += 1
+
+    with StdioServerClient(db_file) as client:
+        client.initialize()
+        for i, question in enumerate(TEST_QUERIES):
+            print(f"\n[{i+1}/{len(TEST_QUERIES)}] Testing question: '{question}'")
+            try:
+                text = answer_text(client.call_tool("query_ipl_data", {"question": question}, timeout=10))
+            except TimeoutError as e:
+                print(f"❌ FAIL: {e}")
+                failed_tests += 1
+                continue
+            if text and "Database error" not in text:
+                print(f"✅ PASS: Server returned a valid response.")
+                passed_tests += 1
             else:
-                print(f"❌ FAIL: Server returned status code {response.status_code}")
+                print(f"❌ FAIL: Server response was empty or malformed.")
                 failed_tests += 1
 
-        except requests.exceptions.RequestException as e:
-            print(f"❌ FAIL: Could not connect to the server at {SERVER_URL}.")
-            print(f"   Error: {e}")
-            print("   Please ensure the 'uvicorn ipl_mcp_server:app --reload' server is running in another terminal.")
-            failed_tests += 1
-            # If we can't connect, no point in continuing.
-            break
-
     # --- Print Final Summary ---
     print("\n--- Test Summary ---")
     print(f"Total Tests: {len(TEST_QUERIES)}")
     print(f"✅ Passed: {passed_tests}")
     print(f"❌ Failed: {failed_tests}")
     print("--------------------")
+    return failed_tests == 0
 
 if __name__ == "__main__":
-    run_tests()
\ No newline at end of file
+    sys.exit(0 if run_tests(*sys.argv[1:2]) else 1)